@@ -7,20 +7,36 @@
 - encode_query: 编码查询文本 → dense + sparse vectors
 - encode_documents: 批量编码文档 → dense + sparse vectors
 - rerank: 重排序文档
+- batch_stats: 微批处理统计（排队等待 vs 计算耗时）
 
 优势：
 - 模型常驻内存，无需重复加载（节省 2-3 分钟）
 - 支持批量编码
 - 可部署到远程 GPU 服务器
 - 独立扩展和优化
+- 并发请求微批处理：时间窗口内到达的 encode_query / rerank 合并为一次前向计算
+
+微批处理配置：
+- BATCH_WINDOW_MS: 收集窗口（毫秒，默认 5）
+- QUERY_MAX_BATCH: 单批最多查询数（默认 32）
+- RERANK_MAX_PAIRS: 单批最多 query-document 对（默认 128）
+
+ColBERT 多向量（同一次前向计算的 late-interaction 向量，可替代 reranker）：
+- COLBERT_VECTORS: 1 = encode_query / encode_documents 结果附带 "colbert"（默认 0）
+- COLBERT_MAX_VECTORS: 文档多向量超过此数时相邻 token 求均值合并（默认 128，0 = 不合并）
+- RERANKER_MODEL=none: 不加载 reranker（rerank 工具不可用）
 """
 
 import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, List
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
 
+import numpy as np
 from FlagEmbedding import BGEM3FlagModel, FlagReranker
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -30,6 +46,11 @@ log = logging.getLogger(__name__)
 BGE_M3_MODEL = os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3")
 RERANKER_MODEL = os.environ.get("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
 USE_FP16 = os.environ.get("USE_FP16", "true").lower() == "true"
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "5"))
+QUERY_MAX_BATCH = int(os.environ.get("QUERY_MAX_BATCH", "32"))
+RERANK_MAX_PAIRS = int(os.environ.get("RERANK_MAX_PAIRS", "128"))
+COLBERT_VECTORS = os.environ.get("COLBERT_VECTORS", "0") == "1"
+COLBERT_MAX_VECTORS = int(os.environ.get("COLBERT_MAX_VECTORS", "128"))
 
 # 全局模型实例（常驻内存）
 embedding_model = None
@@ -48,6 +69,9 @@ def load_models():
     )
     log.info("✅ Embedding 模型加载完成")
 
+    if RERANKER_MODEL.lower() == "none":
+        log.info("RERANKER_MODEL=none，不加载 reranker")
+        return
     log.info(f"加载 reranker 模型: {RERANKER_MODEL}")
     reranker_model = FlagReranker(
         RERANKER_MODEL,
@@ -57,8 +81,188 @@ def load_models():
     log.info("✅ Reranker 模型加载完成")
 
 
+class BatchMetrics:
+    """微批处理统计：批大小、排队等待耗时、计算耗时（最近 1000 批/请求）。"""
+
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.queue_wait_ms: deque = deque(maxlen=1000)
+        self.compute_ms: deque = deque(maxlen=1000)
+        self.batch_sizes: deque = deque(maxlen=1000)
+
+    def record(self, waits_ms: List[float], compute_ms: float) -> None:
+        self.batches += 1
+        self.requests += len(waits_ms)
+        self.queue_wait_ms.extend(waits_ms)
+        self.compute_ms.append(compute_ms)
+        self.batch_sizes.append(len(waits_ms))
+
+    @staticmethod
+    def _pct(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    def snapshot(self) -> Dict[str, Any]:
+        sizes = self.batch_sizes
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "queue_wait_ms": {"p50": self._pct(self.queue_wait_ms, 0.5),
+                              "p95": self._pct(self.queue_wait_ms, 0.95)},
+            "compute_ms": {"p50": self._pct(self.compute_ms, 0.5),
+                           "p95": self._pct(self.compute_ms, 0.95)},
+        }
+
+
+class MicroBatcher:
+    """请求合并器：收集 window_ms 内到达的请求（总权重不超过 max_batch），
+    在专用线程中执行一次批量计算，再把结果分发回各调用方。
+
+    batch_fn 接收 item 列表，返回等长结果列表。weight 用于按 pair 数等计量批大小。
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 executor: ThreadPoolExecutor, window_ms: float, max_batch: int,
+                 weight: Callable[[Any], int] = lambda item: 1):
+        self.name = name
+        self.metrics = BatchMetrics()
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._weight = weight
+        self._queue: asyncio.Queue = None
+        self._carry = None  # 超出上一批容量、留给下一批的请求
+        self._worker = None
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _next(self, timeout: float = None):
+        if self._carry is not None:
+            entry, self._carry = self._carry, None
+            return entry
+        if timeout is None:
+            return await self._queue.get()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        first = await self._next()
+        batch = [first]
+        total = self._weight(first[0])
+        deadline = loop.time() + self._window
+        while total < self._max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                entry = await self._next(remaining)
+            except asyncio.TimeoutError:
+                break
+            w = self._weight(entry[0])
+            if total + w > self._max_batch:
+                self._carry = entry
+                break
+            batch.append(entry)
+            total += w
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            waits_ms = [(started - enqueued) * 1000 for _, _, enqueued in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._batch_fn, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.metrics.record(waits_ms, (time.perf_counter() - started) * 1000)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+# 每个模型一个单线程执行器：同一模型的前向计算串行，批处理由 MicroBatcher 负责
+_embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+_rerank_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+def _to_sparse(weights: Dict[Any, float]) -> Dict[str, float]:
+    return {str(k): float(v) for k, v in weights.items()}
+
+
+def _pool_colbert(vecs, max_vectors: int = COLBERT_MAX_VECTORS) -> List[List[float]]:
+    """与 scripts/colbert.py 的 pool 相同：相邻 token 向量按组求均值后归一化。"""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if 0 < max_vectors < len(vecs):
+        factor = -(-len(vecs) // max_vectors)
+        vecs = np.add.reduceat(vecs, np.arange(0, len(vecs), factor), axis=0)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms > 0, norms, 1)
+    return vecs.tolist()
+
+
+def _encode_query_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """一次前向计算编码多条查询。"""
+    result = embedding_model.encode(
+        texts,
+        batch_size=len(texts),
+        return_dense=True,
+        return_sparse=True,
+        return_colbert_vecs=COLBERT_VECTORS
+    )
+    out = [
+        {"dense": result["dense_vecs"][i].tolist(),
+         "sparse": _to_sparse(result["lexical_weights"][i])}
+        for i in range(len(texts))
+    ]
+    if COLBERT_VECTORS:
+        for item, vecs in zip(out, result["colbert_vecs"]):
+            item["colbert"] = np.asarray(vecs, dtype=np.float32).tolist()
+    return out
+
+
+def _rerank_batch(requests: List[tuple]) -> List[List[float]]:
+    """把多个 (query, doc_texts) 请求的 pair 拼成一次 compute_score，再按请求切回。"""
+    pairs = [[query, text] for query, texts in requests for text in texts]
+    if not pairs:
+        return [[] for _ in requests]
+    scores = reranker_model.compute_score(pairs, normalize=True)
+    if isinstance(scores, (int, float)):
+        scores = [scores]
+    out, offset = [], 0
+    for _, texts in requests:
+        out.append([float(s) for s in scores[offset:offset + len(texts)]])
+        offset += len(texts)
+    return out
+
+
+query_batcher = MicroBatcher("encode_query", _encode_query_batch, _embed_executor,
+                             BATCH_WINDOW_MS, QUERY_MAX_BATCH)
+rerank_batcher = MicroBatcher("rerank", _rerank_batch, _rerank_executor,
+                              BATCH_WINDOW_MS, RERANK_MAX_PAIRS,
+                              weight=lambda item: max(1, len(item[1])))
+
+
 async def encode_query(text: str) -> Dict[str, Any]:
-    """编码查询文本
+    """编码查询文本（与并发请求合并为一次批量前向计算）
 
     Args:
         text: 查询文本
@@ -67,28 +271,12 @@ async def encode_query(text: str) -> Dict[str, Any]:
         {
             "dense": [float, ...],  # 1024d dense vector
             "sparse": {int: float, ...},  # sparse vector
-            "colbert": [[float, ...], ...]  # colbert vectors (optional)
+            "colbert": [[float, ...], ...]  # COLBERT_VECTORS=1 时，每个 token 一个向量
         }
     """
     try:
         log.info(f"编码查询: {text[:50]}...")
-
-        # 使用 BGE-M3 编码
-        result = embedding_model.encode(
-            text,
-            return_dense=True,
-            return_sparse=True,
-            return_colbert_vecs=False  # 暂不使用 ColBERT
-        )
-
-        return {
-            "dense": result["dense_vecs"].tolist(),
-            "sparse": {
-                str(k): float(v)
-                for k, v in zip(result["lexical_weights"][0].indices,
-                               result["lexical_weights"][0].values)
-            }
-        }
+        return await query_batcher.submit(text)
 
     except Exception as e:
         log.error(f"编码查询失败: {e}")
@@ -106,7 +294,8 @@ async def encode_documents(texts: List[str], batch_size: int = 32) -> List[Dict[
         [
             {
                 "dense": [float, ...],
-                "sparse": {int: float, ...}
+                "sparse": {int: float, ...},
+                "colbert": [[float, ...], ...]  # COLBERT_VECTORS=1 时，至多 COLBERT_MAX_VECTORS 个
             },
             ...
         ]
@@ -114,26 +303,28 @@ async def encode_documents(texts: List[str], batch_size: int = 32) -> List[Dict[
     try:
         log.info(f"批量编码 {len(texts)} 个文档")
 
-        # 批量编码
-        result = embedding_model.encode(
-            texts,
-            batch_size=batch_size,
-            return_dense=True,
-            return_sparse=True,
-            return_colbert_vecs=False
+        # 批量编码（与查询共用 embedding 执行线程，避免并发调用同一模型）
+        result = await asyncio.get_running_loop().run_in_executor(
+            _embed_executor,
+            lambda: embedding_model.encode(
+                texts,
+                batch_size=batch_size,
+                return_dense=True,
+                return_sparse=True,
+                return_colbert_vecs=COLBERT_VECTORS
+            ),
         )
 
         # 转换格式
         encoded = []
         for i in range(len(texts)):
-            encoded.append({
+            item = {
                 "dense": result["dense_vecs"][i].tolist(),
-                "sparse": {
-                    str(k): float(v)
-                    for k, v in zip(result["lexical_weights"][i].indices,
-                                   result["lexical_weights"][i].values)
-                }
-            })
+                "sparse": _to_sparse(result["lexical_weights"][i]),
+            }
+            if COLBERT_VECTORS:
+                item["colbert"] = _pool_colbert(result["colbert_vecs"][i])
+            encoded.append(item)
 
         log.info(f"✅ 编码完成: {len(encoded)} 个文档")
         return encoded
@@ -154,17 +345,16 @@ async def rerank(query: str, documents: List[Dict[str, Any]], top_k: int = 10) -
     Returns:
         重排序后的文档列表，添加 rerank_score 字段
     """
+    if reranker_model is None:
+        raise RuntimeError("reranker 未加载（RERANKER_MODEL=none）")
     try:
         log.info(f"重排序 {len(documents)} 个文档")
 
         # 提取文档文本
         doc_texts = [doc.get("text", "") for doc in documents]
 
-        # 构建 query-document pairs
-        pairs = [[query, text] for text in doc_texts]
-
-        # 计算 rerank 分数
-        scores = reranker_model.compute_score(pairs, normalize=True)
+        # 计算 rerank 分数（与并发请求的 pairs 合并计算）
+        scores = await rerank_batcher.submit((query, doc_texts))
 
         # 添加分数到文档
         for i, doc in enumerate(documents):
@@ -184,6 +374,15 @@ async def rerank(query: str, documents: List[Dict[str, Any]], top_k: int = 10) -
         raise
 
 
+def batch_stats() -> Dict[str, Any]:
+    """微批处理统计"""
+    return {
+        "window_ms": BATCH_WINDOW_MS,
+        "encode_query": {"max_batch": QUERY_MAX_BATCH, **query_batcher.metrics.snapshot()},
+        "rerank": {"max_pairs": RERANK_MAX_PAIRS, **rerank_batcher.metrics.snapshot()},
+    }
+
+
 # MCP Server 工具定义
 TOOLS = [
     {
@@ -243,6 +442,11 @@ TOOLS = [
             },
             "required": ["query", "documents"]
         }
+    },
+    {
+        "name": "batch_stats",
+        "description": "微批处理统计：批大小、排队等待与计算耗时的 p50/p95",
+        "inputSchema": {"type": "object", "properties": {}}
     }
 ]
 
@@ -265,10 +469,51 @@ async def handle_tool_call(tool_name: str, arguments: Dict[str, Any]) -> Any:
             arguments.get("top_k", 10)
         )
 
+    elif tool_name == "batch_stats":
+        return batch_stats()
+
     else:
         raise ValueError(f"Unknown tool: {tool_name}")
 
 
+async def handle_request(request: Dict[str, Any]) -> None:
+    """处理单个 JSON-RPC 请求并写回响应。"""
+    if request.get("method") == "tools/list":
+        response = {
+            "jsonrpc": "2.0",
+            "id": request.get("id"),
+            "result": {"tools": TOOLS}
+        }
+
+    elif request.get("method") == "tools/call":
+        tool_name = request["params"]["name"]
+        arguments = request["params"].get("arguments", {})
+
+        try:
+            result = await handle_tool_call(tool_name, arguments)
+            response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": {"content": [{"type": "text", "text": json.dumps(result)}]}
+            }
+        except Exception as e:
+            response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -1, "message": str(e)}
+            }
+
+    else:
+        response = {
+            "jsonrpc": "2.0",
+            "id": request.get("id"),
+            "error": {"code": -32601, "message": "Method not found"}
+        }
+
+    # 发送响应（并发请求可能乱序返回，调用方按 id 匹配）
+    print(json.dumps(response), flush=True)
+
+
 async def main():
     """启动 MCP Server"""
     log.info("=" * 80)
@@ -279,61 +524,35 @@ async def main():
     load_models()
 
     log.info("\n✅ 服务就绪，等待请求...")
+    log.info(f"   微批处理: window={BATCH_WINDOW_MS}ms, query_batch={QUERY_MAX_BATCH}, "
+             f"rerank_pairs={RERANK_MAX_PAIRS}")
     log.info("=" * 80)
 
-    # MCP Server 主循环
+    # MCP Server 主循环：每个请求独立成 task，并发请求才能被合并成批
+    loop = asyncio.get_running_loop()
+    pending = set()
     while True:
         try:
             # 从 stdin 读取请求
-            line = await asyncio.get_event_loop().run_in_executor(None, input)
+            line = await loop.run_in_executor(None, input)
 
             if not line:
                 continue
 
             request = json.loads(line)
+            task = asyncio.create_task(handle_request(request))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
 
-            # 处理请求
-            if request.get("method") == "tools/list":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request.get("id"),
-                    "result": {"tools": TOOLS}
-                }
-
-            elif request.get("method") == "tools/call":
-                tool_name = request["params"]["name"]
-                arguments = request["params"].get("arguments", {})
-
-                try:
-                    result = await handle_tool_call(tool_name, arguments)
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "result": {"content": [{"type": "text", "text": json.dumps(result)}]}
-                    }
-                except Exception as e:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "error": {"code": -1, "message": str(e)}
-                    }
-
-            else:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request.get("id"),
-                    "error": {"code": -32601, "message": "Method not found"}
-                }
-
-            # 发送响应
-            print(json.dumps(response), flush=True)
-
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             log.info("\n服务停止")
             break
         except Exception as e:
             log.error(f"处理请求失败: {e}")
 
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
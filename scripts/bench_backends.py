@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""向量后端 benchmark：进程内 NumPy 后端 vs Qdrant，对比写入、查询延迟和召回。
+
+语料为 docs/ 解析出的全部 chunk（与 index.py 相同的 payload）。默认用
+EMBEDDING_PROVIDER 编码（走 embedding 缓存）；--synthetic 用随机 dense / sparse 向量，
+不需要模型，--scale N 把语料复制到 N 个 chunk 看规模效应。
+
+每个后端执行同一批查询：
+  dense   dense 向量 top-k
+  hybrid  dense + sparse 两路 prefetch → RRF（与 mcp_server.hybrid_search 相同）
+recall@k 以 float32 精确暴力检索的结果为基准（Qdrant 走 HNSW 近似，numpy 后端是精确
+检索，float16 存储只引入舍入误差）。非 synthetic 模式另报 golden 用例命中数。
+--threads N 另测 N 个线程并发执行 hybrid 查询的吞吐（MCP daemon 多个工具线程的情形）。
+
+用法:
+  python scripts/bench_backends.py --synthetic --scale 100000 --no-qdrant
+  docker compose up -d qdrant && python scripts/bench_backends.py docs
+"""
+
+import argparse
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import models
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from index import _collect_md_files, _encode_text, _point_id, parse_file  # noqa: E402
+from numpy_backend import NumpyVectorClient, _Sparse, _top_k, rrf_fuse  # noqa: E402
+from search_metrics import percentile  # noqa: E402
+
+DIM = 1024
+VOCAB = 250_000
+
+
+def load_chunks(dirs: list[str]) -> list[dict]:
+    chunks = []
+    for f in _collect_md_files(dirs):
+        try:
+            chunks.extend(parse_file(str(f)))
+        except Exception as e:  # frontmatter 解析失败的文件 index 也会跳过
+            print(f"skip {f}: {type(e).__name__}", file=sys.stderr)
+    return chunks
+
+
+def synthetic_vectors(n: int, seed: int) -> tuple[np.ndarray, list[models.SparseVector]]:
+    rng = np.random.default_rng(seed)
+    dense = rng.standard_normal((n, DIM), dtype=np.float32)
+    dense /= np.linalg.norm(dense, axis=1, keepdims=True)
+    sparse = []
+    for _ in range(n):
+        idx = np.unique(rng.zipf(1.3, 60) % VOCAB)
+        sparse.append(models.SparseVector(indices=idx.tolist(), values=rng.random(len(idx)).tolist()))
+    return dense, sparse
+
+
+def encode(texts: list[str]) -> tuple[np.ndarray, list[models.SparseVector]]:
+    from embedding_provider import get_embedding_provider
+    out = get_embedding_provider().encode_texts(texts)
+    dense = np.asarray(out["dense_vecs"], dtype=np.float32)
+    lexical = out["lexical_weights"] or [{} for _ in texts]
+    sparse = [models.SparseVector(indices=[int(k) for k in w], values=list(w.values()))
+              for w in lexical]
+    return dense, sparse
+
+
+def build(client, name: str, ids: list[str], dense: np.ndarray,
+          sparse: list[models.SparseVector], payloads: list[dict], batch: int) -> float:
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(
+        name,
+        vectors_config={"dense": models.VectorParams(size=dense.shape[1],
+                                                     distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    t0 = time.perf_counter()
+    for s in range(0, len(ids), batch):
+        client.upsert(name, wait=False, points=models.Batch(
+            ids=ids[s:s + batch],
+            vectors={"dense": dense[s:s + batch].tolist(), "sparse": sparse[s:s + batch]},
+            payloads=payloads[s:s + batch],
+        ))
+    client.delete(name, wait=True, points_selector=models.PointIdsList(points=[]))
+    return time.perf_counter() - t0
+
+
+def exact(dense: np.ndarray, sparse_index: _Sparse, qd: np.ndarray,
+          qs: models.SparseVector, k: int) -> tuple[list[int], list[int]]:
+    """float32 暴力检索的 dense top-k 和 hybrid(RRF) top-k（行号）。"""
+    rows = np.arange(len(dense))
+    d_rows, d_scores = _top_k(rows, dense @ (qd / np.linalg.norm(qd)), 20)
+    s_rows, s_scores = _top_k(rows, sparse_index.scores(qs, len(dense)), 20)
+    fused, _ = rrf_fuse([(d_rows, d_scores), (s_rows, s_scores)], k)
+    return d_rows[:k].tolist(), fused.tolist()
+
+
+def run_queries(client, name: str, queries: list, k: int) -> dict:
+    out = {"dense": ([], []), "hybrid": ([], [])}
+    for qd, qs in queries:
+        t0 = time.perf_counter()
+        r = client.query_points(name, query=qd.tolist(), using="dense", limit=k,
+                                with_payload=["path"])
+        out["dense"][0].append((time.perf_counter() - t0) * 1000)
+        out["dense"][1].append(r.points)
+        t0 = time.perf_counter()
+        r = client.query_points(
+            name,
+            prefetch=[models.Prefetch(query=qd.tolist(), using="dense", limit=20),
+                      models.Prefetch(query=qs, using="sparse", limit=20)],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=k, with_payload=["path"])
+        out["hybrid"][0].append((time.perf_counter() - t0) * 1000)
+        out["hybrid"][1].append(r.points)
+    return out
+
+
+def hybrid_qps(client, name: str, queries: list, k: int, threads: int) -> float:
+    """threads 个线程并发执行全部 hybrid 查询的吞吐（查询 / 秒）。"""
+    def one(q):
+        qd, qs = q
+        client.query_points(
+            name,
+            prefetch=[models.Prefetch(query=qd.tolist(), using="dense", limit=20),
+                      models.Prefetch(query=qs, using="sparse", limit=20)],
+            query=models.FusionQuery(fusion=models.Fusion.RRF), limit=k, with_payload=["path"])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, queries))
+    return len(queries) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="NumPy 后端 vs Qdrant benchmark")
+    parser.add_argument("dirs", nargs="*", default=["docs"], help="Markdown 语料目录")
+    parser.add_argument("--synthetic", action="store_true", help="随机向量，不加载模型")
+    parser.add_argument("--scale", type=int, default=0, help="把语料复制到 N 个 chunk")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--no-qdrant", action="store_true", help="只测 numpy 后端")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=0, help="另测 N 线程并发 hybrid 吞吐")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.dirs)
+    if not chunks:
+        sys.exit("没有找到 chunk")
+    if args.scale:
+        chunks = [chunks[i % len(chunks)] for i in range(args.scale)]
+    payloads = [{"path": c["metadata"].get("path", ""), "text": c["text"]} for c in chunks]
+    # 与 Qdrant 返回的格式一致（带连字符的 UUID），便于和结果比对
+    ids = [str(uuid.UUID(_point_id(f"{c['chunk_id']}#{i}"))) for i, c in enumerate(chunks)]
+
+    golden = []
+    if args.synthetic:
+        dense, sparse = synthetic_vectors(len(chunks), args.seed)
+        qd_all, qs_all = synthetic_vectors(args.queries, args.seed + 1)
+        queries = list(zip(qd_all, qs_all))
+    else:
+        from eval_retrieval import load_test_cases
+        dense, sparse = encode([_encode_text(c) for c in chunks])
+        golden = load_test_cases()
+        qd_all, qs_all = encode([tc["question"] for tc in golden])
+        queries = list(zip(qd_all, qs_all))
+    print(f"{len(chunks)} chunks × {dense.shape[1]}d + sparse, {len(queries)} queries, "
+          f"top-{args.top_k}")
+
+    sparse_index = _Sparse(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                           np.zeros(0, dtype=np.float32))
+    sparse_index.append(sparse)
+    truth = [exact(dense, sparse_index, qd, qs, args.top_k) for qd, qs in queries]
+    truth_ids = [([ids[r] for r in d], [ids[r] for r in h]) for d, h in truth]
+
+    backends = []
+    with tempfile.TemporaryDirectory() as tmp:
+        backends.append(("numpy-f16", NumpyVectorClient(f"{tmp}/f16", dtype="float16")))
+        backends.append(("numpy-f32", NumpyVectorClient(f"{tmp}/f32", dtype="float32")))
+        if not args.no_qdrant:
+            from qdrant_pool import new_qdrant_client
+            backends.append(("qdrant", new_qdrant_client()))
+
+        print(f"  {'backend':<11}{'build s':>9}{'mode':>8}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'p99 ms':>9}{'recall':>8}" + (f"{'golden':>8}" if golden else ""))
+        for name, client in backends:
+            build_s = build(client, "bench-backend", ids, dense, sparse, payloads, args.batch)
+            client.query_points("bench-backend", query=queries[0][0].tolist(), using="dense",
+                                limit=1)  # 预热（numpy 后端首次查询建 sparse 倒排）
+            res = run_queries(client, "bench-backend", queries, args.top_k)
+            for mode, col in (("dense", 0), ("hybrid", 1)):
+                lat, results = res[mode]
+                lat.sort()
+                recall = np.mean([len({p.id for p in pts} & set(t[col])) / max(len(t[col]), 1)
+                                  for pts, t in zip(results, truth_ids)])
+                line = (f"  {name:<11}{build_s:>9.1f}{mode:>8}{percentile(lat, 50):>9.2f}"
+                        f"{percentile(lat, 95):>9.2f}{percentile(lat, 99):>9.2f}{recall:>8.3f}")
+                if golden:
+                    from eval_retrieval import check_hit
+                    hits = sum(check_hit([{"path": (p.payload or {}).get("path", "")} for p in pts],
+                                         tc["expected_paths"])
+                               for pts, tc in zip(results, golden))
+                    line += f"{hits:>5}/{len(golden)}"
+                print(line)
+            if args.threads:
+                single = hybrid_qps(client, "bench-backend", queries, args.top_k, 1)
+                multi = hybrid_qps(client, "bench-backend", queries, args.top_k, args.threads)
+                print(f"  {name:<11}hybrid qps: 1 thread {single:.0f}, "
+                      f"{args.threads} threads {multi:.0f}")
+            if name == "qdrant":
+                client.delete_collection("bench-backend")
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""分块引擎 microbenchmark：单遍分块 vs 旧实现（多次 re.sub + 逐标题扫描围栏）。
+
+对语料中每个 Markdown 文件的正文（去掉 frontmatter）执行 shortcode 清理 + 标题切分，
+重复 --repeat 次取最快一轮，报告 MB/s 和加速比，并统计两种实现输出不一致的文件数、
+超长 section 数。--synthetic 额外构造“大量标题 × 大量代码块”的文档，观察旧实现的
+O(标题数 × 围栏数) 退化。
+
+用法:
+  python scripts/bench_chunking.py                       # docs/
+  python scripts/bench_chunking.py tests/fixtures/kb-sources --repeat 5
+  python scripts/bench_chunking.py --synthetic 2000
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import frontmatter
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from index import (  # noqa: E402
+    MAX_CHUNK_CHARS, merge_small_sections, split_by_headings, split_oversized_sections,
+)
+
+
+# ── 旧实现（对照组） ──────────────────────────────────────────────
+
+def legacy_clean(content: str) -> str:
+    content = re.sub(r'\{\{<\s*glossary_tooltip\s+text="([^"]+)"[^>]*>\}\}', r'\1', content)
+    content = re.sub(r'\{\{<\s*glossary_tooltip\s+term_id="([^"]+)"[^>]*>\}\}', r'\1', content)
+    content = re.sub(r'\{\{[<%]\s*/?\s*note\s*[%>]\}\}', '', content)
+    content = re.sub(r'\{\{[<%]\s*/?\s*warning\s*[%>]\}\}', '', content)
+    content = re.sub(r'\{\{<\s*feature-state[^>]*>\}\}', '', content)
+    content = re.sub(r'\{\{%\s*code_sample\s+file="([^"]+)"\s*%\}\}', r'[code: \1]', content)
+    content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
+    content = re.sub(r'\{\{[<%][^}]*[%>]\}\}', '', content)
+    return content
+
+
+def legacy_split(content: str) -> list[dict]:
+    heading_re = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+    fences = list(re.finditer(r'^```', content, re.MULTILINE))
+    ranges = [(fences[i].start(), fences[i + 1].end()) for i in range(0, len(fences) - 1, 2)]
+    sections, stack, last = [], [], 0
+    for m in heading_re.finditer(content):
+        if any(s <= m.start() <= e for s, e in ranges):
+            continue
+        text = content[last:m.start()].strip()
+        if text:
+            sections.append({"text": text, "section_path": " > ".join(t for _, t in stack)})
+        level = len(m.group(1))
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, m.group(2).strip()))
+        last = m.end()
+    text = content[last:].strip()
+    if text:
+        sections.append({"text": text, "section_path": " > ".join(t for _, t in stack)})
+    return sections or [{"text": content.strip(), "section_path": ""}]
+
+
+# ── benchmark ─────────────────────────────────────────────────────
+
+def synthetic_doc(n: int) -> str:
+    """n 个标题，每个标题下一个含 # 注释的代码块。"""
+    return "\n\n".join(
+        f"## Step {i}\n\nRun the command below.\n\n```bash\n# step {i}\necho {i}\n```"
+        for i in range(n))
+
+
+def _best_of(fn, docs: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for doc in docs:
+            fn(doc)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(docs: list[str], label: str, repeat: int) -> None:
+    size_mb = sum(len(d.encode()) for d in docs) / 1e6
+    legacy_t = _best_of(lambda d: legacy_split(legacy_clean(d)), docs, repeat)
+    new_t = _best_of(split_by_headings, docs, repeat)
+
+    mismatched = sum(legacy_split(legacy_clean(d)) != split_by_headings(d) for d in docs)
+    oversized = before = after = 0
+    for d in docs:
+        merged = merge_small_sections(split_by_headings(d))
+        oversized += sum(len(s["text"]) > MAX_CHUNK_CHARS for s in merged)
+        before += len(merged)
+        after += len(split_oversized_sections(merged))
+
+    print(f"\n{label}: {len(docs)} docs, {size_mb:.2f} MB, best of {repeat}")
+    print(f"  {'impl':<10}{'seconds':>10}{'MB/s':>10}")
+    print(f"  {'legacy':<10}{legacy_t:>10.3f}{size_mb / legacy_t:>10.1f}")
+    print(f"  {'single':<10}{new_t:>10.3f}{size_mb / new_t:>10.1f}")
+    print(f"  speedup {legacy_t / new_t:.1f}x, output differs on {mismatched} docs")
+    print(f"  oversized sections (> {MAX_CHUNK_CHARS} chars): {oversized}; "
+          f"chunks {before} → {after} after splitting")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="分块引擎 microbenchmark")
+    parser.add_argument("dirs", nargs="*", default=["docs"], help="Markdown 语料目录")
+    parser.add_argument("--repeat", type=int, default=3, help="重复轮数，取最快一轮")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="额外测试 N 个标题 × N 个代码块的合成文档")
+    args = parser.parse_args()
+
+    docs = []
+    for d in args.dirs:
+        for f in sorted(Path(d).rglob("*.md")):
+            if ".preprocess" in f.parts:
+                continue
+            try:
+                docs.append(frontmatter.load(f).content)
+            except Exception as e:  # frontmatter 解析失败的文件 index 也会跳过
+                print(f"skip {f}: {type(e).__name__}", file=sys.stderr)
+    if docs:
+        run(docs, ", ".join(args.dirs), args.repeat)
+    if args.synthetic:
+        run([synthetic_doc(args.synthetic)], f"synthetic ({args.synthetic} headings × fences)",
+            args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Embedding 批处理 benchmark：固定 batch_size vs 按 token 长度分桶。
+
+对语料解析出的全部 chunk（与 index.py 相同的编码文本）统计两种分批方式的
+padding 开销：padded tokens = Σ 批内条数 × 批内最长，有效率 = 真实 token / padded。
+加 --encode 时加载 EMBEDDING_PROVIDER 指定的模型实际编码，报告 texts/s。
+（关闭 embedding 缓存，避免第二轮命中缓存。）
+
+用法:
+  python scripts/bench_embedding.py                      # docs/，只统计 padding
+  python scripts/bench_embedding.py docs --encode --limit 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ["EMBEDDING_CACHE"] = "0"
+
+from embedding_provider import (  # noqa: E402
+    EMBEDDING_BATCH_TOKENS, estimate_tokens, get_embedding_provider, token_budget_batches,
+)
+from index import PIPELINE_BATCH, _encode_text, parse_file  # noqa: E402
+
+
+def load_texts(dirs: list[str], limit: int) -> list[str]:
+    texts = []
+    for d in dirs:
+        for f in sorted(Path(d).rglob("*.md")):
+            if ".preprocess" in f.parts:
+                continue
+            try:
+                texts.extend(_encode_text(c) for c in parse_file(str(f)))
+            except Exception as e:  # frontmatter 解析失败的文件 index 也会跳过
+                print(f"skip {f}: {type(e).__name__}", file=sys.stderr)
+    return texts[:limit] if limit else texts
+
+
+def padding_stats(lengths: list[int], batch_tokens: int, batch_size: int) -> dict:
+    groups = token_budget_batches(lengths, batch_tokens, batch_size)
+    padded = sum(len(g) * max(lengths[i] for i in g) for g in groups)
+    real = sum(lengths)
+    return {"batches": len(groups), "padded": padded, "efficiency": real / padded if padded else 1.0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embedding 分桶批处理 benchmark")
+    parser.add_argument("dirs", nargs="*", default=["docs"], help="Markdown 语料目录")
+    parser.add_argument("--batch-size", type=int, default=PIPELINE_BATCH, help="每批最多条数")
+    parser.add_argument("--batch-tokens", type=int, default=EMBEDDING_BATCH_TOKENS or 16384,
+                        help="分桶模式每批 token 预算")
+    parser.add_argument("--limit", type=int, default=0, help="只取前 N 个 chunk")
+    parser.add_argument("--encode", action="store_true", help="加载模型实际编码并计时")
+    args = parser.parse_args()
+
+    texts = load_texts(args.dirs, args.limit)
+    if not texts:
+        sys.exit("没有找到 chunk")
+
+    provider = get_embedding_provider() if args.encode else None
+    tokenizer = getattr(getattr(provider, "_model", None), "tokenizer", None) or getattr(
+        provider, "_tokenizer", None)
+    if tokenizer is not None:
+        lengths = [len(ids) for ids in tokenizer(texts, truncation=True, max_length=8192)["input_ids"]]
+        source = "tokenizer"
+    else:
+        lengths = [estimate_tokens(t) for t in texts]
+        source = "estimate"
+
+    print(f"{len(texts)} chunks, {sum(lengths)} tokens ({source}), "
+          f"min/median/max {min(lengths)}/{sorted(lengths)[len(lengths) // 2]}/{max(lengths)}")
+    modes = [("fixed", 0), ("bucketed", args.batch_tokens)]
+    print(f"  {'mode':<10}{'batches':>9}{'padded tok':>12}{'efficiency':>12}{'seconds':>10}{'texts/s':>10}")
+    baseline = None
+    for name, budget in modes:
+        st = padding_stats(lengths, budget, args.batch_size)
+        line = f"  {name:<10}{st['batches']:>9}{st['padded']:>12}{st['efficiency']:>12.1%}"
+        if provider is not None:
+            provider._batch_tokens = budget
+            t0 = time.perf_counter()
+            provider.encode_texts(texts, batch_size=args.batch_size)
+            sec = time.perf_counter() - t0
+            baseline = baseline or sec
+            line += f"{sec:>10.1f}{len(texts) / sec:>10.1f}  ({baseline / sec:.2f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Qdrant 传输方式 benchmark：REST vs gRPC 的写入吞吐和查询延迟。
+
+在 QDRANT_URL 指向的 server 上为每种传输各建一个临时 collection（与 index.py
+相同的 dense 1024 + sparse 配置），用随机向量写入 --points 个点，再执行 --queries
+次 hybrid 查询（dense + sparse prefetch → RRF），结束后删除临时 collection。
+每种传输都先取一次 get_qdrant_client()，与线上路径一样复用连接池。
+
+用法:
+  docker compose up -d qdrant
+  python scripts/bench_qdrant.py --points 20000 --queries 300
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from qdrant_pool import QDRANT_URL, get_qdrant_client  # noqa: E402
+from search_metrics import percentile  # noqa: E402
+
+DIM = 1024
+
+
+def _sparse(rng: np.random.Generator, n: int) -> list[models.SparseVector]:
+    out = []
+    for _ in range(n):
+        idx = np.unique(rng.integers(0, 250_000, 40))
+        out.append(models.SparseVector(indices=idx.tolist(), values=rng.random(len(idx)).tolist()))
+    return out
+
+
+def bench_upsert(client: QdrantClient, name: str, n: int, batch: int, seed: int) -> float:
+    client.create_collection(
+        collection_name=name,
+        vectors_config={"dense": models.VectorParams(size=DIM, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    for start in range(0, n, batch):
+        m = min(batch, n - start)
+        dense = rng.random((m, DIM), dtype=np.float32)
+        client.upsert(collection_name=name, wait=False, points=models.Batch(
+            ids=list(range(start, start + m)),
+            vectors={"dense": dense.tolist(), "sparse": _sparse(rng, m)},
+            payloads=[{"text": f"chunk {start + i} " * 40} for i in range(m)],
+        ))
+    client.delete(collection_name=name, wait=True, points_selector=models.PointIdsList(points=[]))
+    return n / (time.perf_counter() - t0)
+
+
+def bench_query(client: QdrantClient, name: str, queries: int, seed: int) -> list[float]:
+    rng = np.random.default_rng(seed + 1)
+    latencies = []
+    for _ in range(queries):
+        dense = rng.random(DIM, dtype=np.float32).tolist()
+        sparse = _sparse(rng, 1)[0]
+        t0 = time.perf_counter()
+        client.query_points(
+            collection_name=name,
+            prefetch=[models.Prefetch(query=dense, using="dense", limit=20),
+                      models.Prefetch(query=sparse, using="sparse", limit=20)],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=10,
+            with_payload=True,
+        )
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return sorted(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Qdrant REST vs gRPC benchmark")
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Qdrant {QDRANT_URL}: {args.points} points × {DIM}d + sparse, "
+          f"batch {args.batch}, {args.queries} queries")
+    print(f"  {'transport':<10}{'upsert pts/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for transport, grpc in (("rest", False), ("grpc", True)):
+        client = get_qdrant_client(prefer_grpc=grpc)
+        name = f"bench-transport-{transport}"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        try:
+            rate = bench_upsert(client, name, args.points, args.batch, args.seed)
+            lat = bench_query(client, name, args.queries, args.seed)
+        finally:
+            client.delete_collection(name)
+        print(f"  {transport:<10}{rate:>14.0f}{percentile(lat, 50):>10.1f}"
+              f"{percentile(lat, 95):>10.1f}{percentile(lat, 99):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""BM25F 词法检索：CJK 感知分词 + Qdrant sparse 向量（IDF modifier）。
+
+文档侧在 index.py 写入时计算 BM25F 的词频部分，存进名为 "bm25" 的 sparse 向量：
+
+  tf'(t) = Σ_f  w_f · tf_f(t) / (1 - b + b · len_f / avglen_f)     # title / section_path / text
+  value(t) = tf'(t) · (k1 + 1) / (tf'(t) + k1)
+
+IDF 由 Qdrant 在查询时按全库文档频率计算（SparseVectorParams(modifier=IDF)，
+idf = ln((N - df + 0.5) / (df + 0.5) + 1)），新增 / 删除文档后无需重算已有向量。
+查询向量每个词权重为其出现次数，一次 query_points 即得到按 BM25 排序的结果。
+
+分词：
+- NFKC 归一化（全角转半角）后转小写
+- 拉丁字母 / 数字串按 . _ - / : 连接成复合词（maxmemory-policy、redis.conf、
+  k8s.io/api），同时输出复合词本身和各组成部分，精确命令和拆开的单词都能命中
+- 连续 CJK 字符切成相邻二元组（单字成词时保留单字），不依赖中文分词词典
+
+词 → sparse 下标用 md5 前 4 字节（31 位），与进程、Python hash 随机化无关。
+
+环境变量:
+  BM25_K1=1.2
+  BM25_B=0.75
+  BM25_FIELD_WEIGHTS=title:3,section_path:2,text:1
+"""
+
+import hashlib
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Optional
+
+from qdrant_client import models
+
+VECTOR_NAME = "bm25"
+
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+FIELD_WEIGHTS = {
+    k: float(v) for k, v in (
+        item.split(":") for item in
+        os.environ.get("BM25_FIELD_WEIGHTS", "title:3,section_path:2,text:1").split(",") if item)
+}
+# 各字段平均词数（按 docs/ 语料统计）。固定常数而不是随索引变化，已写入的向量不会因为
+# 语料增减而失效；偏差只影响长度归一化的力度
+AVG_FIELD_LEN = {"title": 6.0, "section_path": 5.0, "text": 290.0}
+
+# 假名、CJK 统一汉字（含扩展 A、兼容汉字）、韩文音节
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"[a-z0-9]+(?:[._\-/:][a-z0-9]+)*|[{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for m in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        tok = m.group()
+        if _CJK_RE.match(tok):
+            if len(tok) == 1:
+                tokens.append(tok)
+            else:
+                tokens.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+            continue
+        tokens.append(tok)
+        parts = _PART_RE.findall(tok)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def token_id(token: str) -> int:
+    return int.from_bytes(hashlib.md5(token.encode()).digest()[:4], "little") & 0x7FFFFFFF
+
+
+def _sparse(weights: dict[int, float]) -> models.SparseVector:
+    return models.SparseVector.model_construct(indices=list(weights),
+                                               values=list(weights.values()))
+
+
+def doc_vector(fields: dict[str, str]) -> models.SparseVector:
+    """字段名 → 文本，返回 BM25F 词频部分的 sparse 向量（不含 IDF）。"""
+    tf: dict[int, float] = {}
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS.get(field, 0.0)
+        if not weight or not text:
+            continue
+        tokens = tokenize(text)
+        norm = 1 - BM25_B + BM25_B * len(tokens) / AVG_FIELD_LEN.get(field, AVG_FIELD_LEN["text"])
+        for tok, n in Counter(tokens).items():
+            tid = token_id(tok)
+            tf[tid] = tf.get(tid, 0.0) + weight * n / norm
+    return _sparse({t: v * (BM25_K1 + 1) / (v + BM25_K1) for t, v in tf.items()})
+
+
+def chunk_vector(chunk: dict) -> models.SparseVector:
+    metadata = chunk.get("metadata", {})
+    return doc_vector({"title": metadata.get("title", ""),
+                       "section_path": metadata.get("section_path", ""),
+                       "text": chunk["text"]})
+
+
+def payload_vector(payload: dict) -> models.SparseVector:
+    """已写入的 point payload → 文档向量（档位迁移时给没有 bm25 向量的旧 point 补写）。"""
+    return doc_vector({field: payload.get(field) or ""
+                       for field in ("title", "section_path", "text")})
+
+
+def query_vector(query: str) -> models.SparseVector:
+    counts: dict[int, float] = {}
+    for tok in tokenize(query):
+        tid = token_id(tok)
+        counts[tid] = counts.get(tid, 0.0) + 1.0
+    return _sparse(counts)
+
+
+def sparse_params(index: Optional[models.SparseIndexParams] = None) -> models.SparseVectorParams:
+    return models.SparseVectorParams(modifier=models.Modifier.IDF, index=index)
+
+
+def has_bm25(client, collection: str) -> bool:
+    """collection（或 alias 指向的 collection）是否带 bm25 sparse 向量。"""
+    try:
+        info = client.get_collection(collection)
+    except Exception:
+        return False
+    return VECTOR_NAME in (info.config.params.sparse_vectors or {})
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""BGE-M3 ColBERT 多向量：同一次前向计算顺带输出，作为轻量的 late-interaction 重排。
+
+BGE-M3 除 dense（CLS）和 sparse（lexical 权重）外还有 colbert_linear 头：每个 token
+一个 L2 归一化的向量。文档侧存进名为 "colbert" 的多向量（MultiVectorConfig MAX_SIM），
+查询时 QueryPlan 在融合后的候选上按 MaxSim 重打分：
+
+  score(q, d) = Σ_i  max_j  cos(q_i, d_j)
+
+不需要第二个模型和第二次前向计算（cross-encoder 可以关掉，见 mcp_server.py
+RERANKER_MODEL=none），重打分只读 prefetch 候选的向量，在 Qdrant 服务端完成。
+
+存储：多向量只用于重排，不建 HNSW（m=0）；默认 float16、放磁盘（on_disk），
+内存里只有 dense / sparse 索引。token 数超过 COLBERT_MAX_VECTORS 的 chunk 把相邻
+token 向量按组求均值再归一化（token pooling），每个 chunk 的向量数和写入请求大小
+都有上界：1024 维 float16 × 128 个向量 ≈ 256 KB / chunk。
+
+环境变量:
+  COLBERT_VECTORS=0          # 1 = 编码并写入 colbert 多向量（仅 local / onnx provider）
+  COLBERT_MAX_VECTORS=128    # 每个 chunk 最多保留的 token 向量数，0 = 不池化
+  COLBERT_DATATYPE=float16   # Qdrant 存储精度：float16 / float32
+  COLBERT_ON_DISK=1          # 0 = 原始向量常驻内存
+"""
+
+import os
+
+import numpy as np
+from qdrant_client import models
+
+VECTOR_NAME = "colbert"
+
+COLBERT_ENABLED = os.environ.get("COLBERT_VECTORS", "0") == "1"
+COLBERT_MAX_VECTORS = int(os.environ.get("COLBERT_MAX_VECTORS", "128"))
+COLBERT_DATATYPE = os.environ.get("COLBERT_DATATYPE", "float16")
+COLBERT_ON_DISK = os.environ.get("COLBERT_ON_DISK", "1") != "0"
+
+# 带多向量的写入按 token 向量总数切批：每个请求约 1024 × 1024 个浮点数（JSON 约 10 MB，
+# 低于 Qdrant 默认 32 MB 的请求上限）
+UPSERT_VECTORS = 1024
+
+
+def pool(vecs: np.ndarray, max_vectors: int = COLBERT_MAX_VECTORS) -> np.ndarray:
+    """token 向量 (n, dim) → 至多 max_vectors 个：相邻 ceil(n / max) 个一组求均值后归一化。"""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if max_vectors <= 0 or len(vecs) <= max_vectors:
+        return vecs
+    factor = -(-len(vecs) // max_vectors)
+    pooled = np.add.reduceat(vecs, np.arange(0, len(vecs), factor), axis=0)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.where(norms > 0, norms, 1)
+
+
+def upsert_batch_size(max_vectors: int = COLBERT_MAX_VECTORS) -> int:
+    """带多向量时每个写入请求的点数。"""
+    return max(1, UPSERT_VECTORS // max(max_vectors, 1)) if max_vectors > 0 else 1
+
+
+def vector_params(dim: int = 1024) -> models.VectorParams:
+    return models.VectorParams(
+        size=dim,
+        distance=models.Distance.COSINE,
+        multivector_config=models.MultiVectorConfig(
+            comparator=models.MultiVectorComparator.MAX_SIM),
+        hnsw_config=models.HnswConfigDiff(m=0),  # 只做重排，不建图
+        datatype=models.Datatype(COLBERT_DATATYPE),
+        on_disk=COLBERT_ON_DISK,
+    )
+
+
+def has_colbert(client, collection: str) -> bool:
+    """collection（或 alias 指向的 collection）是否带 colbert 多向量。"""
+    try:
+        info = client.get_collection(collection)
+    except Exception:
+        return False
+    return VECTOR_NAME in (info.config.params.vectors or {})
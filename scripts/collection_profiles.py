@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""collection 存储档位：dense 向量的量化、精度、内存 / 磁盘分层和 HNSW 参数。
+
+ensure_collection 按 COLLECTION_PROFILE 建库，档位名写进 collection metadata
+（"profile"），查询端据此加上量化检索参数（oversampling + 原始向量 rescore）。
+
+  档位         dense 原始向量          量化（常驻内存）      HNSW m / ef   payload
+  default      float32 内存           无                  16 / 100      内存
+  ram-fast     float32 内存           int8 scalar         32 / 256      内存
+  balanced     float16 磁盘 (mmap)     int8 scalar         16 / 128      内存
+  disk-large   float16 磁盘           binary (1 bit)      16 / 100 磁盘 磁盘
+  disk-pq      float16 磁盘           product (x16)       16 / 100 磁盘 磁盘
+
+量化向量常驻内存做 HNSW 遍历，取 limit × oversampling 个候选后用原始向量重打分，
+原始向量放磁盘时内存占用约为 int8 1/4、binary 1/32、product 1/16。1024 维 × 100 万
+chunk：default 约 4 GB 内存，balanced 约 1 GB，disk-large 约 128 MB（另有 HNSW 图）。
+disk-* 档位的 sparse 倒排索引也放磁盘；colbert 多向量始终按 colbert.py 的配置存储。
+
+已有 collection 换档位不需要重新编码：index.py --migrate-profile <档位> 把向量原样
+复制到新版本 collection 后原子切换 alias（见 index.migrate_profile）。
+
+numpy 后端（VECTOR_BACKEND=numpy）是精确暴力检索，量化 / HNSW / on_disk 参数被忽略。
+
+环境变量:
+  COLLECTION_PROFILE=          # 新建 collection 的档位；空 = default，--rebuild 时沿用线上档位
+"""
+
+import os
+from typing import Optional
+
+from qdrant_client import models
+
+DENSE_DIM = 1024
+
+# 未列出的字段取 default 的值
+PROFILES: dict[str, dict] = {
+    "default": {
+        "datatype": "float32", "on_disk": False, "on_disk_payload": False,
+        "quantization": None, "oversampling": 1.0,
+        "m": 16, "ef_construct": 100, "hnsw_on_disk": False,
+    },
+    "ram-fast": {"quantization": "scalar", "oversampling": 1.5, "m": 32, "ef_construct": 256},
+    "balanced": {"datatype": "float16", "on_disk": True, "quantization": "scalar",
+                 "oversampling": 2.0, "ef_construct": 128},
+    "disk-large": {"datatype": "float16", "on_disk": True, "on_disk_payload": True,
+                   "quantization": "binary", "oversampling": 3.0, "hnsw_on_disk": True},
+    "disk-pq": {"datatype": "float16", "on_disk": True, "on_disk_payload": True,
+                "quantization": "product", "oversampling": 4.0, "hnsw_on_disk": True},
+}
+
+COLLECTION_PROFILE = os.environ.get("COLLECTION_PROFILE", "")
+
+
+def get_profile(name: Optional[str] = None) -> dict:
+    """档位名 → 完整配置（补齐 default 的字段），未知档位抛 ValueError。"""
+    name = name or COLLECTION_PROFILE or "default"
+    if name not in PROFILES:
+        raise ValueError(f"未知的 collection 档位: {name}（可选: {', '.join(PROFILES)}）")
+    return {**PROFILES["default"], **PROFILES[name], "name": name}
+
+
+def quantization_config(kind: Optional[str]) -> Optional[models.QuantizationConfig]:
+    if kind is None:
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if kind == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True))
+    if kind == "product":
+        return models.ProductQuantization(product=models.ProductQuantizationConfig(
+            compression=models.CompressionRatio.X16, always_ram=True))
+    raise ValueError(f"未知的量化方式: {kind}")
+
+
+def dense_params(profile: dict, dim: int = DENSE_DIM) -> models.VectorParams:
+    return models.VectorParams(
+        size=dim,
+        distance=models.Distance.COSINE,
+        datatype=models.Datatype(profile["datatype"]),
+        on_disk=profile["on_disk"],
+        hnsw_config=models.HnswConfigDiff(m=profile["m"], ef_construct=profile["ef_construct"],
+                                          on_disk=profile["hnsw_on_disk"]),
+        quantization_config=quantization_config(profile["quantization"]),
+    )
+
+
+def sparse_index(profile: dict) -> Optional[models.SparseIndexParams]:
+    """disk-* 档位的 sparse 倒排索引放磁盘，其余用 Qdrant 默认（内存）。"""
+    return models.SparseIndexParams(on_disk=True) if profile["on_disk_payload"] else None
+
+
+def search_params(name: Optional[str]) -> Optional[models.SearchParams]:
+    """collection metadata 中的档位名 → dense 检索的量化参数；未量化或未知档位返回 None。"""
+    if name not in PROFILES:
+        return None
+    profile = get_profile(name)
+    if profile["quantization"] is None:
+        return None
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        rescore=True, oversampling=profile["oversampling"]))
+
+
+def collection_profile(client, collection: str) -> Optional[str]:
+    """collection（或 alias）建库时的档位名；早于档位的 collection 返回 None。"""
+    try:
+        info = client.get_collection(collection)
+    except Exception:
+        return None
+    return (getattr(info.config, "metadata", None) or {}).get("profile")
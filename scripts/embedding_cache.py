@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Embedding 持久化缓存。
+
+以 (模型标识, 归一化文本的 sha256) 为 key，把 dense 向量和 sparse lexical weights
+存入 SQLite（WAL 模式，索引进程和 MCP Server 可同时读写）。超过容量上限时按
+最近使用时间淘汰。未变更语料的全量重建几乎不消耗模型时间，openai 模式下的
+付费 API 调用也降到接近零。
+
+查询路径上不做全表操作：写入时只累加进程内的字节数，越过上限或每写入
+_SIZE_RESYNC_PUTS 条时才用 SUM(size) 校正（其他进程也在写同一个文件）；命中时的
+访问时间先记在内存里，攒够 _TOUCH_BATCH 条、超过 _TOUCH_FLUSH_SEC 秒或随下一次写入
+一起提交，淘汰顺序因此是近似 LRU。
+
+ColBERT 多向量（COLBERT_VECTORS=1）每条是 dense 的上百倍，不进缓存：此时文档和
+查询都交给模型编码，编码结果里的 dense / sparse 照常写入缓存。
+
+环境变量:
+  EMBEDDING_CACHE=1                 # 0 关闭缓存（默认开启）
+  EMBEDDING_CACHE_PATH=...          # 缓存文件（默认 ~/.cache/knowledge-base-search/embeddings.sqlite）
+  EMBEDDING_CACHE_MAX_MB=2048       # 容量上限，超出后淘汰最久未用的条目
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from qdrant_client import models
+
+from embedding_provider import EmbeddingProvider
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "knowledge-base-search" / "embeddings.sqlite"
+_SQL_BATCH = 500  # SQLite 单条语句的参数个数有上限
+_TOUCH_BATCH = 256
+_TOUCH_FLUSH_SEC = 30.0
+_SIZE_RESYNC_PUTS = 1000
+
+
+def normalize_text(text: str) -> str:
+    """缓存 key 用的文本归一化：Unicode NFC + 去首尾空白。"""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def cache_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+def _pack_sparse(weights: dict) -> bytes:
+    indices = np.fromiter((int(k) for k in weights.keys()), dtype=np.int32, count=len(weights))
+    values = np.fromiter((float(v) for v in weights.values()), dtype=np.float32,
+                         count=len(weights))
+    return indices.tobytes() + values.tobytes()
+
+
+def _unpack_sparse(blob: bytes) -> dict:
+    n = len(blob) // 8
+    indices = np.frombuffer(blob, dtype=np.int32, count=n)
+    values = np.frombuffer(blob, dtype=np.float32, count=n, offset=n * 4)
+    return {str(int(i)): float(v) for i, v in zip(indices, values)}
+
+
+class EmbeddingCache:
+    """SQLite 向量缓存，按总字节数上限做 LRU 淘汰。线程安全。"""
+
+    def __init__(self, path: Path | str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dense BLOB NOT NULL,"
+            " sparse BLOB,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+        self._total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self._puts = 0  # 上次校正 _total 之后写入的条数
+        self._touched: dict[str, float] = {}  # 未提交的访问时间
+        self._touched_at = time.monotonic()
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple[np.ndarray, Optional[dict]]]:
+        """批量查询，返回命中的 {key: (dense, sparse | None)}。"""
+        found: dict[str, tuple[np.ndarray, Optional[dict]]] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), _SQL_BATCH):
+                batch = unique[start:start + _SQL_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, dense, sparse FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, dense, sparse in rows:
+                    found[key] = (
+                        np.frombuffer(dense, dtype=np.float32),
+                        _unpack_sparse(sparse) if sparse is not None else None,
+                    )
+                    self._touched[key] = now
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+            if (len(self._touched) >= _TOUCH_BATCH
+                    or time.monotonic() - self._touched_at >= _TOUCH_FLUSH_SEC):
+                self._flush_touched()
+                self._db.commit()
+        return found
+
+    def put_many(self, entries: list[tuple[str, np.ndarray, Optional[dict]]]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, dense, sparse in entries:
+            dense_blob = np.asarray(dense, dtype=np.float32).tobytes()
+            sparse_blob = _pack_sparse(sparse) if sparse is not None else None
+            size = len(dense_blob) + (len(sparse_blob) if sparse_blob else 0)
+            rows.append((key, dense_blob, sparse_blob, size, now))
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dense, sparse, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?)", rows)
+            self._flush_touched()
+            self._db.commit()
+            # 覆盖已有 key 时会多算，只会让校正提前发生
+            self._total += sum(row[3] for row in rows)
+            self._puts += len(rows)
+            if self._total > self.max_bytes or self._puts >= _SIZE_RESYNC_PUTS:
+                self._evict()
+
+    def _flush_touched(self) -> None:
+        """把攒下的访问时间写入（不提交，由调用方提交）。"""
+        if self._touched:
+            self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                 [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def _evict(self) -> None:
+        """用 SUM(size) 校正累计字节数；超出上限时删除最久未用的条目，直到回落到上限的 90%。"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self._total, self._puts = total, 0
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._db.commit()
+        self._total = total
+        log.info(f"  embedding 缓存淘汰 {evicted} 条（上限 {self.max_bytes // (1 << 20)} MB）")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        return {"entries": count, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """在任意 EmbeddingProvider 外包一层持久化缓存，只把未命中的文本交给模型。"""
+
+    def __init__(self, inner: EmbeddingProvider, cache: EmbeddingCache):
+        self._inner = inner
+        self._cache = cache
+        self.model_id = inner.model_id
+        self.colbert = inner.colbert
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
+        keys = [cache_key(self.model_id, t) for t in texts]
+        if self.colbert:
+            output = self._inner.encode_texts(texts, batch_size=batch_size)
+            lexical = output["lexical_weights"]
+            self._cache.put_many([
+                (k, np.asarray(output["dense_vecs"][i], dtype=np.float32),
+                 lexical[i] if lexical is not None else None)
+                for i, k in enumerate(keys)])
+            return output
+        found = self._cache.get_many(keys)
+
+        # 未命中的文本去重后交给模型
+        miss_keys = list(dict.fromkeys(k for k in keys if k not in found))
+        if miss_keys:
+            first_text = {}
+            for k, t in zip(keys, texts):
+                first_text.setdefault(k, t)
+            output = self._inner.encode_texts([first_text[k] for k in miss_keys],
+                                              batch_size=batch_size)
+            lexical = output["lexical_weights"]
+            new_entries = []
+            for i, k in enumerate(miss_keys):
+                dense = np.asarray(output["dense_vecs"][i], dtype=np.float32)
+                sparse = lexical[i] if lexical is not None else None
+                found[k] = (dense, sparse)
+                new_entries.append((k, dense, sparse))
+            self._cache.put_many(new_entries)
+
+        if len(texts) > 1:
+            log.info(f"  embedding 缓存: {len(texts) - len(miss_keys)} 命中, "
+                     f"{len(miss_keys)} 编码")
+
+        dense_vecs = np.stack([found[k][0] for k in keys]) if keys else np.zeros(
+            (0, 0), dtype=np.float32)
+        sparse_list = [found[k][1] for k in keys]
+        has_sparse = bool(keys) and all(s is not None for s in sparse_list)
+        return {
+            "dense_vecs": dense_vecs,
+            "lexical_weights": sparse_list if has_sparse else None,
+        }
+
+    def encode_query(self, query: str) -> dict:
+        key = cache_key(self.model_id, query)
+        hit = None if self.colbert else self._cache.get_many([key]).get(key)
+        if hit is None:
+            q = self._inner.encode_query(query)
+            sparse = None
+            if q["sparse_vec"] is not None:
+                sparse = {str(i): v for i, v in zip(q["sparse_vec"].indices,
+                                                     q["sparse_vec"].values)}
+            self._cache.put_many([(key, np.asarray(q["dense_vec"], dtype=np.float32), sparse)])
+            return q
+
+        dense, sparse = hit
+        sparse_vec = None
+        if sparse is not None:
+            sparse_vec = models.SparseVector(
+                indices=list(map(int, sparse.keys())),
+                values=list(sparse.values()),
+            )
+        return {"dense_vec": dense.tolist(), "sparse_vec": sparse_vec}
+
+
+def cache_from_env() -> Optional[EmbeddingCache]:
+    """按环境变量创建缓存；EMBEDDING_CACHE=0 时返回 None。"""
+    if os.environ.get("EMBEDDING_CACHE", "1") == "0":
+        return None
+    path = os.environ.get("EMBEDDING_CACHE_PATH", str(DEFAULT_CACHE_PATH))
+    max_mb = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "2048"))
+    return EmbeddingCache(path, max_bytes=max_mb * 1024 * 1024)
@@ -6,27 +6,87 @@
 环境变量:
   EMBEDDING_PROVIDER=local          # 默认，本地 BGE-M3
   EMBEDDING_PROVIDER=openai         # 外部 API（SiliconFlow、Jina 等）
+  EMBEDDING_PROVIDER=onnx           # 本地 ONNX Runtime（INT8 量化，CPU 推理，见 onnx_backend.py）
   EMBEDDING_API_KEY=sk-xxx          # API key（openai 模式必需）
   EMBEDDING_BASE_URL=https://...    # API endpoint（openai 模式必需）
   EMBEDDING_MODEL=BAAI/bge-m3      # 模型名（openai 模式）
   EMBEDDING_DIM=1024                # 向量维度（openai 模式，默认 1024）
   EMBEDDING_CONCURRENCY=4           # 并行 API 请求数（openai 模式，默认 4）
+  EMBEDDING_BATCH_TOKENS=16384      # 本地模型每批 padding 后的 token 预算（0 = 固定 batch_size）
+  EMBEDDING_API_BATCH_TOKENS=8192   # openai 模式每个请求的 token 预算（0 = 固定 64 条）
+  EMBEDDING_WORKERS=8               # local/onnx 多进程数据并行（见 parallel_encoder.py，默认关闭）
+  COLBERT_VECTORS=1                 # local/onnx 同时输出 ColBERT 多向量（见 colbert.py，默认关闭）
+
+批处理：encode_texts 先按 token 长度降序排序，再按 token 预算切批（本地模型按
+“条数 × 批内最长”计，API 按 token 总数计），输出恢复为输入顺序。长短混合的 chunk
+不再都 pad 到同批最长，CPU 上省掉大部分花在 padding 上的计算。
+
+两种 provider 都默认包一层持久化缓存（见 embedding_cache.py，EMBEDDING_CACHE=0 关闭）。
 """
 
 import logging
 import os
+import re
 from abc import ABC, abstractmethod
 from typing import Optional
 
 import numpy as np
 from qdrant_client import models
 
+from colbert import COLBERT_ENABLED, pool
+
 log = logging.getLogger(__name__)
 
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "16384"))
+EMBEDDING_API_BATCH_TOKENS = int(os.environ.get("EMBEDDING_API_BATCH_TOKENS", "8192"))
+API_MAX_BATCH = 64
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """没有 tokenizer 时的 token 数估计：CJK 约 1 字 1 token，其余约 4 字符 1 token。"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 2
+
+
+def token_budget_batches(lengths: list[int], max_tokens: int, max_batch: int,
+                         padded: bool = True) -> list[list[int]]:
+    """按长度降序分组，每组的 token 开销不超过 max_tokens、条数不超过 max_batch。
+
+    padded=True 时开销 = 条数 × 组内最长（本地模型按批内最长 padding）；
+    padded=False 时开销 = token 总数（API 请求限额）。单条超预算时独占一组。
+    max_tokens <= 0 退化为按输入顺序每 max_batch 条一组。
+    返回各组在输入中的下标。
+    """
+    if max_tokens <= 0:
+        return [list(range(i, min(i + max_batch, len(lengths))))
+                for i in range(0, len(lengths), max_batch)]
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches: list[list[int]] = []
+    cur: list[int] = []
+    cost = 0
+    for i in order:
+        # 降序排列，组内最长 = 组内第一条
+        new_cost = (len(cur) + 1) * lengths[cur[0]] if padded and cur else cost + lengths[i]
+        if cur and (new_cost > max_tokens or len(cur) >= max_batch):
+            batches.append(cur)
+            cur, new_cost = [], lengths[i]
+        cur.append(i)
+        cost = new_cost
+    if cur:
+        batches.append(cur)
+    return batches
+
 
 class EmbeddingProvider(ABC):
     """Embedding 编码抽象基类。"""
 
+    # 模型标识，用作 embedding 缓存 key 的一部分；不同模型/维度必须不同
+    model_id: str = ""
+    # 是否输出 ColBERT 多向量（encode_texts 的 colbert_vecs / encode_query 的 colbert_vec）
+    colbert: bool = False
+
     @abstractmethod
     def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
         """批量编码文档文本。
@@ -34,6 +94,8 @@ class EmbeddingProvider(ABC):
         返回:
             {"dense_vecs": ndarray (N, dim), "lexical_weights": list[dict] | None}
             lexical_weights 为 None 表示不支持 sparse（外部 API 模式）。
+            colbert=True 时另有 "colbert_vecs": list[ndarray (n_i, dim)]，每条已按
+            COLBERT_MAX_VECTORS 池化。
         """
 
     @abstractmethod
@@ -43,35 +105,70 @@ class EmbeddingProvider(ABC):
         返回:
             {"dense_vec": list[float], "sparse_vec": SparseVector | None}
             sparse_vec 为 None 表示不支持 sparse。
+            colbert=True 时另有 "colbert_vec": list[list[float]]（每个查询 token 一个向量）。
         """
 
 
 class LocalBGEM3Provider(EmbeddingProvider):
-    """本地 BGE-M3 模型，支持 dense + sparse。"""
+    """本地 BGE-M3 模型，支持 dense + sparse（+ 可选 ColBERT 多向量）。"""
 
-    def __init__(self, model_name: str = "BAAI/bge-m3"):
+    def __init__(self, model_name: str = "BAAI/bge-m3", max_length: int = 8192,
+                 batch_tokens: int = EMBEDDING_BATCH_TOKENS, colbert: bool = COLBERT_ENABLED):
         from FlagEmbedding import BGEM3FlagModel
+        from transformers import AutoConfig
         log.info(f"加载本地模型 {model_name}...")
         self._model = BGEM3FlagModel(model_name, use_fp16=True)
+        self._dense_dim = AutoConfig.from_pretrained(model_name).hidden_size
+        self._max_length = max_length
+        self._batch_tokens = batch_tokens
+        self.colbert = colbert
+        self.model_id = f"local:{model_name}"
+
+    def _token_lengths(self, texts: list[str]) -> list[int]:
+        enc = self._model.tokenizer(texts, add_special_tokens=True, truncation=True,
+                                    max_length=self._max_length)
+        return [len(ids) for ids in enc["input_ids"]]
 
     def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
-        output = self._model.encode(
-            texts, return_dense=True, return_sparse=True, batch_size=batch_size
-        )
-        return {
-            "dense_vecs": output["dense_vecs"],
-            "lexical_weights": output["lexical_weights"],
-        }
+        if not texts:
+            empty = {"dense_vecs": np.zeros((0, self._dense_dim), dtype=np.float32),
+                     "lexical_weights": []}
+            return {**empty, "colbert_vecs": []} if self.colbert else empty
+        lengths = self._token_lengths(texts) if self._batch_tokens > 0 else [0] * len(texts)
+        dense = None
+        lexical: list = [None] * len(texts)
+        multi: list = [None] * len(texts)
+        for group in token_budget_batches(lengths, self._batch_tokens, batch_size):
+            output = self._model.encode(
+                [texts[i] for i in group], return_dense=True, return_sparse=True,
+                return_colbert_vecs=self.colbert, batch_size=len(group),
+                max_length=self._max_length,
+            )
+            vecs = np.asarray(output["dense_vecs"])
+            if dense is None:
+                dense = np.empty((len(texts), vecs.shape[1]), dtype=vecs.dtype)
+            dense[group] = vecs
+            for i, weights in zip(group, output["lexical_weights"]):
+                lexical[i] = weights
+            if self.colbert:
+                for i, tokens in zip(group, output["colbert_vecs"]):
+                    multi[i] = pool(tokens).astype(np.float16)
+        out = {"dense_vecs": dense, "lexical_weights": lexical}
+        return {**out, "colbert_vecs": multi} if self.colbert else out
 
     def encode_query(self, query: str) -> dict:
-        q = self._model.encode([query], return_dense=True, return_sparse=True)
+        q = self._model.encode([query], return_dense=True, return_sparse=True,
+                               return_colbert_vecs=self.colbert)
         dense_vec = q["dense_vecs"][0].tolist()
         sparse = q["lexical_weights"][0]
         sparse_vec = models.SparseVector(
             indices=list(map(int, sparse.keys())),
             values=list(sparse.values()),
         )
-        return {"dense_vec": dense_vec, "sparse_vec": sparse_vec}
+        out = {"dense_vec": dense_vec, "sparse_vec": sparse_vec}
+        if self.colbert:
+            out["colbert_vec"] = np.asarray(q["colbert_vecs"][0], dtype=np.float32).tolist()
+        return out
 
 
 class OpenAICompatibleProvider(EmbeddingProvider):
@@ -84,12 +181,15 @@ class OpenAICompatibleProvider(EmbeddingProvider):
         model: str = "BAAI/bge-m3",
         dim: int = 1024,
         concurrency: int = 4,
+        batch_tokens: int = EMBEDDING_API_BATCH_TOKENS,
     ):
         from openai import OpenAI
         self._client = OpenAI(api_key=api_key, base_url=base_url)
         self._model = model
         self._dim = dim
         self._concurrency = concurrency
+        self._batch_tokens = batch_tokens
+        self.model_id = f"openai:{model}:{dim}"
         log.info(f"使用外部 embedding API: {base_url} model={model} dim={dim} concurrency={concurrency}")
 
     def _encode_batch(self, batch: list[str], batch_idx: int, total: int) -> list[list[float]]:
@@ -102,8 +202,8 @@ class OpenAICompatibleProvider(EmbeddingProvider):
                 vecs = [item.embedding for item in resp.data]
                 if not vecs:
                     raise ValueError("No embedding data received")
-                if total > 64:
-                    log.info(f"  API embedding {batch_idx + len(batch)}/{total}")
+                if total > API_MAX_BATCH:
+                    log.info(f"  API embedding batch {batch_idx + 1}: {len(batch)}/{total} texts")
                 return vecs
             except Exception as e:
                 if attempt < max_retries - 1:
@@ -116,38 +216,32 @@ class OpenAICompatibleProvider(EmbeddingProvider):
     def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
         from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        api_batch = min(batch_size, 64)
-        batches = []
-        for start in range(0, len(texts), api_batch):
-            batches.append((start, texts[start : start + api_batch]))
+        if not texts:
+            return {"dense_vecs": np.zeros((0, self._dim), dtype=np.float32), "lexical_weights": None}
+        lengths = [estimate_tokens(t) for t in texts]
+        groups = token_budget_batches(lengths, self._batch_tokens, min(batch_size, API_MAX_BATCH),
+                                      padded=False)
+        dense = np.empty((len(texts), self._dim), dtype=np.float32)
 
         # 单 batch 不需要线程池
-        if len(batches) == 1:
-            vecs = self._encode_batch(batches[0][1], 0, len(texts))
-            return {
-                "dense_vecs": np.array(vecs, dtype=np.float32),
-                "lexical_weights": None,
-            }
+        if len(groups) == 1:
+            dense[groups[0]] = self._encode_batch([texts[i] for i in groups[0]], 0, len(texts))
+            return {"dense_vecs": dense, "lexical_weights": None}
 
-        all_vecs = [None] * len(batches)
-        workers = min(self._concurrency, len(batches))
-        log.info(f"  并行 embedding: {len(batches)} batches × {api_batch} texts, {workers} workers")
+        workers = min(self._concurrency, len(groups))
+        log.info(f"  并行 embedding: {len(texts)} texts → {len(groups)} batches "
+                 f"(≤{self._batch_tokens} tokens), {workers} workers")
 
         with ThreadPoolExecutor(max_workers=workers) as executor:
             futures = {}
-            for i, (start, batch) in enumerate(batches):
-                future = executor.submit(self._encode_batch, batch, start, len(texts))
-                futures[future] = i
+            for i, group in enumerate(groups):
+                future = executor.submit(self._encode_batch, [texts[j] for j in group], i, len(texts))
+                futures[future] = group
 
             for future in as_completed(futures):
-                idx = futures[future]
-                all_vecs[idx] = future.result()
+                dense[futures[future]] = future.result()
 
-        flat = [v for batch_vecs in all_vecs for v in batch_vecs]
-        return {
-            "dense_vecs": np.array(flat, dtype=np.float32),
-            "lexical_weights": None,
-        }
+        return {"dense_vecs": dense, "lexical_weights": None}
 
     def encode_query(self, query: str) -> dict:
         resp = self._client.embeddings.create(input=[query], model=self._model)
@@ -182,8 +276,22 @@ def get_embedding_provider() -> EmbeddingProvider:
             api_key=api_key, base_url=base_url, model=model, dim=dim,
             concurrency=concurrency,
         )
+    elif int(os.environ.get("EMBEDDING_WORKERS", "0")) > 1:
+        from parallel_encoder import EMBEDDING_WORKERS, DataParallelProvider, model_factory
+        model_name = os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3")
+        _provider = DataParallelProvider(model_factory(provider_type, model_name), EMBEDDING_WORKERS)
+    elif provider_type == "onnx":
+        from onnx_backend import OnnxBGEM3Provider
+        model_name = os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3")
+        _provider = OnnxBGEM3Provider(model_name=model_name)
     else:
         model_name = os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3")
         _provider = LocalBGEM3Provider(model_name=model_name)
 
+    from embedding_cache import CachedEmbeddingProvider, cache_from_env
+    cache = cache_from_env()
+    if cache is not None:
+        log.info(f"embedding 缓存: {cache.path}")
+        _provider = CachedEmbeddingProvider(_provider, cache)
+
     return _provider
@@ -9,6 +9,7 @@ Usage:
   python scripts/eval_retrieval.py                    # retrieval-only
   python scripts/eval_retrieval.py --ragas             # + LLM answer + RAGAS judge
   python scripts/eval_retrieval.py --ragas --top-k 10  # custom top-k
+  python scripts/eval_retrieval.py --parity --golden   # ONNX vs PyTorch backend drift
 
 Environment variables (RAGAS mode):
   JUDGE_API_KEY / DEEPSEEK_API_KEY  — API key for DeepSeek (answer gen + RAGAS judge)
@@ -16,6 +17,8 @@ Environment variables (RAGAS mode):
   JUDGE_BASE_URL                    — API base URL (default: https://api.deepseek.com)
   EMBEDDING_PROVIDER                — embedding provider for search
   QDRANT_URL                        — Qdrant endpoint (default: http://localhost:6333)
+  QDRANT_PREFER_GRPC                — 1 to query over gRPC (see qdrant_pool.py)
+  COLLECTION_NAME                   — collection or alias to query (default: knowledge-base)
 """
 
 import argparse
@@ -46,25 +49,38 @@ def load_test_cases(golden_only: bool = False) -> list[dict]:
     return SO_TEST_CASES
 
 
-def search(query: str, top_k: int = 5, mode: str = "dense") -> list[dict]:
-    """Search against Qdrant. mode='dense' for dense-only, 'hybrid' for full pipeline."""
+def search(query: str, top_k: int = 5, mode: str = "dense", timer=None) -> list[dict]:
+    """Search against Qdrant. mode='dense' for dense-only, 'hybrid' for full pipeline.
+
+    If a StageTimer is given, per-stage latencies are recorded into it.
+    """
     if mode == "hybrid":
-        return _hybrid_search(query, top_k)
-    return _dense_search(query, top_k)
+        return _hybrid_search(query, top_k, timer)
+    return _dense_search(query, top_k, timer=timer)
 
 
-def _dense_search(query: str, top_k: int = 5) -> list[dict]:
+def _dense_search(query: str, top_k: int = 5, provider=None, timer=None) -> list[dict]:
     """Dense-only vector search against Qdrant."""
     from embedding_provider import get_embedding_provider
-    from qdrant_client import QdrantClient
+    from search_metrics import StageTimer
+
+    provider = provider or get_embedding_provider()
+    timer = timer or StageTimer()
+    with timer.stage("encode"):
+        q = provider.encode_query(query)
+    with timer.stage("qdrant"):
+        timer.round_trips += 1
+        return _dense_query(q["dense_vec"], top_k)
 
-    provider = get_embedding_provider()
-    client = QdrantClient(url=os.environ.get("QDRANT_URL", "http://localhost:6333"))
 
-    q = provider.encode_query(query)
+def _dense_query(dense_vec: list[float], top_k: int = 5) -> list[dict]:
+    """Run a dense vector query and flatten the hits."""
+    from qdrant_pool import get_qdrant_client
+
+    client = get_qdrant_client()
     results = client.query_points(
-        collection_name="knowledge-base",
-        query=q["dense_vec"],
+        collection_name=os.environ.get("COLLECTION_NAME", "knowledge-base"),  # alias
+        query=dense_vec,
         using="dense",
         limit=top_k,
         with_payload=True,
@@ -82,11 +98,19 @@ def _dense_search(query: str, top_k: int = 5) -> list[dict]:
     return hits
 
 
-def _hybrid_search(query: str, top_k: int = 5) -> list[dict]:
+def _hybrid_search(query: str, top_k: int = 5, timer=None) -> list[dict]:
     """Full hybrid search: dense + sparse/BM25 + RRF + reranker."""
     from mcp_server import hybrid_search as _hs
 
-    raw = _hs(query, top_k=top_k)
+    raw = _hs(query, top_k=top_k, include_timings=timer is not None)
+    # Server-side stage timings are appended as a trailing [TIMINGS] line
+    raw, _, timings_json = raw.partition("\n\n[TIMINGS] ")
+    if timer is not None and timings_json:
+        timings = json.loads(timings_json)
+        timer.cache_hit = timings.pop("cache_hit", False)
+        timer.round_trips = timings.pop("round_trips", 0)
+        timer.plan = timings.pop("plan", "")
+        timer.timings.update(timings)
     # hybrid_search returns JSON string + hint text after \n\n
     json_str = raw.split("\n\n[SEARCH NOTE]")[0]
     items = json.loads(json_str)
@@ -183,6 +207,8 @@ def ragas_score(query: str, answer: str, contexts: list[str]) -> dict:
 
 def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False, mode: str = "dense") -> dict:
     """Run the full evaluation."""
+    from search_metrics import SearchMetrics, StageTimer, format_table
+
     cases = load_test_cases(golden_only=golden_only)
     log.info(f"Running {len(cases)} test cases (top_k={top_k}, mode={mode}, ragas={use_ragas})\n")
 
@@ -190,10 +216,14 @@ def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False,
     failed = 0
     results = []
     faith_scores = []
+    latency = SearchMetrics(window=len(cases))
     t0 = time.time()
 
     for i, tc in enumerate(cases):
-        hits = search(tc["question"], top_k=top_k, mode=mode)
+        timer = StageTimer()
+        hits = search(tc["question"], top_k=top_k, mode=mode, timer=timer)
+        timings = timer.finish()
+        latency.record(timings, cache_hit=timer.cache_hit, round_trips=timer.round_trips)
         hit = check_hit(hits, tc["expected_paths"])
 
         status = "PASS" if hit else "FAIL"
@@ -217,6 +247,8 @@ def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False,
             "status": status,
             "hits": [{"path": h["path"], "title": h["title"], "score": h["score"]}
                      for h in hits[:5]],
+            "timings_ms": timings,
+            "round_trips": timer.round_trips,
         }
 
         # RAGAS mode: generate answer + score faithfulness
@@ -248,6 +280,8 @@ def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False,
         "top_k": top_k,
         "mode": mode,
         "elapsed_sec": round(elapsed, 1),
+        "latency_ms": latency.summary()["stages_ms"],
+        "round_trips": latency.summary()["round_trips"],
     }
     if faith_scores:
         summary["avg_faithfulness"] = round(sum(faith_scores) / len(faith_scores), 3)
@@ -260,6 +294,8 @@ def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False,
         log.info(f"Faithfulness: avg={summary['avg_faithfulness']:.3f} "
                  f"min={summary['min_faithfulness']:.3f} (n={len(faith_scores)})")
     log.info(f"Time: {elapsed:.1f}s")
+    log.info(f"\nLatency breakdown ({mode}, {latency.cache_hits} result-cache hits):")
+    log.info(format_table(latency.summary()))
 
     # Save results
     output_dir = Path(__file__).parent.parent / "eval"
@@ -272,14 +308,110 @@ def run_eval(top_k: int = 5, use_ragas: bool = False, golden_only: bool = False,
     return summary
 
 
+def parity_check(top_k: int = 5, golden_only: bool = True, max_drift: float = 5.0) -> dict:
+    """Compare the ONNX backend against the PyTorch backend.
+
+    Both backends encode every query and search the same (PyTorch-built) index.
+    Reports pass rate, query latency, query-vector cosine, top-k overlap and
+    reranker top-1 agreement. Drift is the pass-rate drop of ONNX vs PyTorch,
+    in percentage points.
+    """
+    import numpy as np
+    from FlagEmbedding import FlagReranker
+    from embedding_provider import LocalBGEM3Provider
+    from onnx_backend import OnnxBGEM3Provider, OnnxReranker
+
+    model = os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3")
+    reranker_model = os.environ.get("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+    embedders = {"pytorch": LocalBGEM3Provider(model), "onnx": OnnxBGEM3Provider(model)}
+    rerankers = {"pytorch": FlagReranker(reranker_model, use_fp16=True),
+                 "onnx": OnnxReranker(reranker_model)}
+
+    cases = load_test_cases(golden_only=golden_only)
+    log.info(f"Parity check: {len(cases)} cases, top_k={top_k}\n")
+
+    stats = {name: {"passed": 0, "encode_ms": [], "rerank_ms": []} for name in embedders}
+    cosines, overlaps, rerank_agree = [], [], 0
+    for tc in cases:
+        vecs, paths = {}, {}
+        for name, provider in embedders.items():
+            t0 = time.perf_counter()
+            q = provider.encode_query(tc["question"])
+            stats[name]["encode_ms"].append((time.perf_counter() - t0) * 1000)
+            hits = _dense_query(q["dense_vec"], top_k)
+            stats[name]["passed"] += check_hit(hits, tc["expected_paths"])
+            vecs[name] = np.asarray(q["dense_vec"], dtype=np.float32)
+            paths[name] = [h["path"] for h in hits]
+            if name == "pytorch":
+                pairs = [(tc["question"], h["text"]) for h in hits]
+
+        a, b = vecs["pytorch"], vecs["onnx"]
+        cosines.append(float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b))))
+        overlaps.append(len(set(paths["pytorch"]) & set(paths["onnx"])) / max(1, top_k))
+
+        top1 = {}
+        for name, reranker in rerankers.items():
+            t0 = time.perf_counter()
+            scores = reranker.compute_score(pairs) if pairs else []
+            stats[name]["rerank_ms"].append((time.perf_counter() - t0) * 1000)
+            if isinstance(scores, (int, float)):
+                scores = [scores]
+            top1[name] = int(np.argmax(scores)) if len(scores) else -1
+        rerank_agree += top1["pytorch"] == top1["onnx"]
+
+    def _ms(values: list[float]) -> str:
+        return f"{np.median(values):.1f}" if values else "-"
+
+    log.info(f"{'backend':<10}{'pass':>8}{'encode p50 ms':>16}{'rerank p50 ms':>16}")
+    summary = {"total": len(cases), "top_k": top_k}
+    for name, st in stats.items():
+        rate = round(100 * st["passed"] / len(cases), 1)
+        summary[f"{name}_pass_rate"] = rate
+        summary[f"{name}_encode_p50_ms"] = float(_ms(st["encode_ms"]))
+        summary[f"{name}_rerank_p50_ms"] = float(_ms(st["rerank_ms"]))
+        log.info(f"{name:<10}{rate:>7}%{_ms(st['encode_ms']):>16}{_ms(st['rerank_ms']):>16}")
+
+    summary["drift_pp"] = round(summary["pytorch_pass_rate"] - summary["onnx_pass_rate"], 1)
+    summary["query_cosine_min"] = round(min(cosines), 4)
+    summary["query_cosine_mean"] = round(sum(cosines) / len(cosines), 4)
+    summary["topk_overlap_mean"] = round(sum(overlaps) / len(overlaps), 3)
+    summary["rerank_top1_agreement"] = round(rerank_agree / len(cases), 3)
+    summary["max_drift_pp"] = max_drift
+    log.info(f"\nRecall drift: {summary['drift_pp']} pp (max {max_drift})")
+    log.info(f"Query cosine: mean={summary['query_cosine_mean']} "
+             f"min={summary['query_cosine_min']}")
+    log.info(f"Top-{top_k} overlap: {summary['topk_overlap_mean']}, "
+             f"rerank top-1 agreement: {summary['rerank_top1_agreement']}")
+
+    output_file = Path(__file__).parent.parent / "eval" / "onnx-parity-results.json"
+    output_file.parent.mkdir(exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"\nResults saved to {output_file}")
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser(description="Redis docs KB retrieval eval")
     parser.add_argument("--ragas", action="store_true", help="Enable RAGAS faithfulness scoring")
     parser.add_argument("--golden", action="store_true", help="Run only golden subset (~6 cases)")
     parser.add_argument("--hybrid", action="store_true", help="Use full hybrid search (dense+sparse+reranker)")
     parser.add_argument("--top-k", type=int, default=5, help="Number of results to retrieve")
+    parser.add_argument("--parity", action="store_true",
+                        help="Compare ONNX backend against PyTorch (recall drift + latency)")
+    parser.add_argument("--max-drift", type=float, default=5.0,
+                        help="Max allowed pass-rate drop in --parity mode (percentage points)")
     args = parser.parse_args()
 
+    if args.parity:
+        summary = parity_check(top_k=args.top_k, golden_only=args.golden,
+                               max_drift=args.max_drift)
+        if summary["drift_pp"] > args.max_drift:
+            log.error(f"\nFAILED: ONNX recall drift {summary['drift_pp']} pp "
+                      f"> {args.max_drift} pp")
+            sys.exit(1)
+        return
+
     mode = "hybrid" if args.hybrid else "dense"
     summary = run_eval(top_k=args.top_k, use_ragas=args.ragas, golden_only=args.golden, mode=mode)
 
@@ -19,6 +19,7 @@ Environment variables:
 
 import argparse
 import asyncio
+import atexit
 import json
 import logging
 import os
@@ -68,18 +69,23 @@ def build_system_prompt() -> str:
 """
 
 
+MCP_PYTHON = str(PROJECT_ROOT / ".venv" / "bin" / "python")
+
+
+def get_mcp_env() -> dict:
+    """Env passed to the MCP server (and checked against a shared daemon's config)."""
+    return {"QDRANT_URL": os.environ.get("QDRANT_URL", "http://localhost:6333")}
+
+
 def get_mcp_server_config() -> dict:
-    """Build MCP server config for the Agent session."""
-    mcp_script = str(PROJECT_ROOT / "scripts" / "mcp_server.py")
-    return {
-        "knowledge-base": {
-            "command": str(PROJECT_ROOT / ".venv" / "bin" / "python"),
-            "args": [mcp_script],
-            "env": {
-                "QDRANT_URL": os.environ.get("QDRANT_URL", "http://localhost:6333"),
-            },
-        }
-    }
+    """Build MCP server config for the Agent session.
+
+    By default every session runs its own stdio mcp_server; MCP_MODE=shim / http share
+    one mcp_server daemon across sessions (see mcp_shim.py).
+    """
+    from mcp_shim import mcp_servers_config
+
+    return mcp_servers_config(python=MCP_PYTHON, env=get_mcp_env())
 
 
 async def run_single_case(
@@ -239,6 +245,13 @@ async def run_eval(
     log.info(f"Running {len(cases)} E2E skill eval cases "
              f"(concurrency={concurrency}, max_turns={max_turns}, ragas={use_ragas})\n")
 
+    # Start the shared search daemon up front so model loading isn't billed to the first case,
+    # and stop it when the eval exits if this run started it
+    from mcp_shim import MCP_MODE, ensure_daemon, stop_spawned_daemons
+    if MCP_MODE != "stdio":
+        atexit.register(stop_spawned_daemons)
+        log.info(f"MCP daemon: {ensure_daemon(python=MCP_PYTHON, env=get_mcp_env())}")
+
     results = []
     passed = 0
     failed = 0
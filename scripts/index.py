@@ -8,8 +8,11 @@
   # 索引单个文件
   python scripts/index.py --file docs/runbook/redis.md
 
-  # 全量重建（遍历指定目录下所有 .md）
-  python scripts/index.py --full docs/
+  # 全量重建（遍历指定目录下所有 .md，多个目录共用一条流水线）
+  python scripts/index.py --full docs/ tests/fixtures/kb-sources/redis-docs/content/
+
+  # 零停机重建：写入新版本 collection，校验后原子切换 alias，再回收旧版本
+  python scripts/index.py --rebuild docs/
 
   # 增量更新（基于 git diff）
   python scripts/index.py --incremental
@@ -22,32 +25,73 @@
 
   # 查看索引状态
   python scripts/index.py --status
+
+  # 快照导出 / 校验 / 恢复（流式分块，导出时写 <快照>.manifest.json，见 snapshot_io.py）
+  python scripts/index.py --snapshot-export snapshots/knowledge-base.snapshot
+  python scripts/index.py --snapshot-verify snapshots/knowledge-base.snapshot
+  python scripts/index.py --snapshot-import snapshots/knowledge-base.snapshot
+
+  # 旧 collection 补建 payload 索引、回填 path_segments / scope（只改 payload）
+  python scripts/index.py --migrate-payload
+
+  # 换存储档位（量化 / 磁盘分层 / HNSW，见 collection_profiles.py）：复制已有向量到新版本
+  # collection，不重新编码，校验后原子切换 alias
+  python scripts/index.py --migrate-profile disk-large
+
+环境变量:
+  COLLECTION_PROFILE=      # 新建 collection 的存储档位（空 = default，--rebuild 沿用线上档位）
+  INDEX_BATCH_SIZE=256     # 流水线每批 chunk 数（encode / upsert 的单位）
+  INDEX_UPLOAD_WORKERS=4   # 并行上传线程数（wait=False，结束时统一等待落盘）
+  INDEX_UPLOAD_RETRIES=3   # 单批上传失败的重试次数
+  INDEX_DELETE_BATCH=256   # 批量删除时每个 MatchAny 过滤包含的 doc_id 数
+  INDEX_DELETE_WORKERS=4   # 批量删除的并发请求数
+  INDEX_QUEUE_DEPTH=2      # 阶段间队列深度，内存峰值 ≈ batch × 队列深度
+  INDEX_PARSE_WORKERS=0    # 解析进程数，0 = CPU 核数，1 = 在主进程中串行解析
+  INDEX_MAX_CHUNK_CHARS=3200  # 单个 chunk 上限，超长 section 按段落 / 代码块边界切开
+  INDEX_CHUNK_OVERLAP=200     # 切开的相邻 chunk 之间的重叠字符数
+  INDEX_REBUILD_MIN_RATIO=0.5 # --rebuild 新版本点数不得低于线上的比例
+  INDEX_REBUILD_KEEP=0        # --rebuild 后保留的旧版本数
+  INDEX_REBUILD_GC_DELAY=5    # 切换后等待多少秒再删除旧版本（让进行中的查询结束）
 """
 
 import argparse
+import collections
 import hashlib
+import itertools
+import multiprocessing
 import json
 import logging
 import os
+import queue
 import re
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 import frontmatter
 import numpy as np
 from qdrant_client import QdrantClient, models
 
+import bm25
+import colbert
+import collection_profiles
 from embedding_provider import EmbeddingProvider, get_embedding_provider
+from qdrant_pool import QDRANT_URL, VECTOR_BACKEND, get_qdrant_client
+from snapshot_io import (
+    download_snapshot, load_resume_state, manifest_path, upload_snapshot, verify_snapshot,
+)
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger(__name__)
 
-QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION = os.environ.get("COLLECTION_NAME", "knowledge-base")
-MAX_CHUNK_CHARS = 3200
+MAX_CHUNK_CHARS = int(os.environ.get("INDEX_MAX_CHUNK_CHARS", "3200"))
+CHUNK_OVERLAP_CHARS = int(os.environ.get("INDEX_CHUNK_OVERLAP", "200"))
 
 _provider = None
 
@@ -61,26 +105,71 @@ def get_provider() -> EmbeddingProvider:
 
 
 def get_qdrant() -> QdrantClient:
-    return QdrantClient(url=QDRANT_URL)
+    """进程内共享的 Qdrant client（连接池复用，QDRANT_PREFER_GRPC=1 走 gRPC）。"""
+    return get_qdrant_client()
+
+
+def resolve_alias(client: QdrantClient, name: str) -> Optional[str]:
+    """name 是 alias 时返回它指向的 collection，否则返回 None。"""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name
+    return None
 
 
-def ensure_collection(client: QdrantClient) -> None:
-    """确保 collection 存在，包含 dense 向量、sparse 向量和 text 全文索引。"""
+# collection metadata 标记：全部 points 都已带 path_fields 的结构化路径字段。新建时写入，
+# 旧 collection 由 --migrate-payload（全量索引时自动执行）回填后写入。mcp_server 据此
+# 决定 scope 走 path_segments 索引还是退回 path 全文匹配；只有索引不代表旧 points 已回填
+PATH_FIELDS_FLAG = "path_fields"
+
+# 过滤 / 删除用到的 payload 字段都建索引，否则每次带 filter 的查询和删除都是全表扫描
+PAYLOAD_INDEXES = {
+    "doc_id": models.PayloadSchemaType.KEYWORD,
+    "source_repo": models.PayloadSchemaType.KEYWORD,
+    "path_segments": models.PayloadSchemaType.KEYWORD,
+    "scope": models.PayloadSchemaType.KEYWORD,
+    "doc_type": models.PayloadSchemaType.KEYWORD,
+    "tags": models.PayloadSchemaType.KEYWORD,
+    "quality_score": models.PayloadSchemaType.INTEGER,
+}
+
+
+def ensure_collection(client: QdrantClient, collection: Optional[str] = None,
+                      profile: Optional[str] = None,
+                      with_colbert: Optional[bool] = None) -> None:
+    """确保 collection 存在，包含 dense 向量、sparse 向量、bm25 词法向量、text 全文索引和 payload 索引。
+
+    新建时按存储档位 profile（默认 COLLECTION_PROFILE，见 collection_profiles.py）配置
+    dense 向量的量化 / 精度 / 磁盘分层和 HNSW 参数，档位名写进 collection metadata。
+    with_colbert（默认 COLBERT_VECTORS=1）时另建 colbert 多向量（MaxSim 重排用，见 colbert.py）。
+    collection 可以是 alias（蓝绿重建后 COLLECTION 即为 alias），此时视为已存在。
+    已有 collection 缺少的 payload 索引会补建。
+    """
+    collection = collection or COLLECTION
     collections = [c.name for c in client.get_collections().collections]
-    if COLLECTION not in collections:
-        log.info(f"创建 collection: {COLLECTION}")
+    if collection not in collections and resolve_alias(client, collection) is None:
+        prof = collection_profiles.get_profile(profile)
+        if with_colbert is None:
+            with_colbert = colbert.COLBERT_ENABLED
+        log.info(f"创建 collection: {collection}（档位 {prof['name']}）")
+        sparse_index = collection_profiles.sparse_index(prof)
         client.create_collection(
-            collection_name=COLLECTION,
+            collection_name=collection,
             vectors_config={
-                "dense": models.VectorParams(size=1024, distance=models.Distance.COSINE),
+                "dense": collection_profiles.dense_params(prof),
+                **({colbert.VECTOR_NAME: colbert.vector_params()} if with_colbert else {}),
             },
             sparse_vectors_config={
-                "sparse": models.SparseVectorParams(),
+                "sparse": models.SparseVectorParams(index=sparse_index),
+                bm25.VECTOR_NAME: bm25.sparse_params(sparse_index),
             },
+            on_disk_payload=prof["on_disk_payload"],
+            # 新 collection 的 points 都由 _chunk_payload 写入，带 path_fields 的字段
+            metadata={"profile": prof["name"], PATH_FIELDS_FLAG: True},
         )
-        # 全文索引用于 BM25-like 检索（当 sparse 向量不可用时作为 RRF 第二信号）
+        # 全文索引：没有 bm25 向量的旧 collection 上 keyword_search 的退路
         client.create_payload_index(
-            collection_name=COLLECTION,
+            collection_name=collection,
             field_name="text",
             field_schema=models.TextIndexParams(
                 type=models.TextIndexType.TEXT,
@@ -90,37 +179,89 @@ def ensure_collection(client: QdrantClient) -> None:
             ),
         )
         log.info("已创建 text 全文索引（multilingual tokenizer）")
+    ensure_payload_indexes(client, collection)
+
+
+def ensure_payload_indexes(client: QdrantClient, collection: Optional[str] = None) -> list[str]:
+    """补建 PAYLOAD_INDEXES 中缺少的 keyword / integer 索引，返回新建的字段名。"""
+    collection = collection or COLLECTION
+    schema = client.get_collection(collection).payload_schema or {}
+    created = []
+    for field, field_type in PAYLOAD_INDEXES.items():
+        if field in schema:
+            continue
+        client.create_payload_index(collection_name=collection, field_name=field,
+                                    field_schema=field_type, wait=True)
+        created.append(field)
+    if created:
+        log.info(f"已创建 payload 索引: {', '.join(created)}")
+    return created
+
+
+def has_path_fields(client: QdrantClient, collection: Optional[str] = None) -> bool:
+    """collection 的全部 points 是否都带 path_segments / scope（见 PATH_FIELDS_FLAG）。"""
+    try:
+        info = client.get_collection(collection or COLLECTION)
+    except Exception:
+        return False
+    return bool((getattr(info.config, "metadata", None) or {}).get(PATH_FIELDS_FLAG))
+
+
+def bump_index_version(client: QdrantClient, collection: Optional[str] = None) -> None:
+    """在 collection metadata 写入新的 index_version，通知 MCP Server 结果缓存失效。
+
+    老版本 Qdrant 不支持 collection metadata 时忽略（服务端仍按 points_count 失效）。
+    """
+    version = datetime.now(timezone.utc).isoformat()
+    try:
+        client.update_collection(collection or COLLECTION, metadata={"index_version": version})
+    except Exception as e:
+        log.debug(f"写入 index_version 失败: {e}")
 
 
 # ── 标题分块 ──────────────────────────────────────────────────────
+#
+# 单遍分块：一个 re.finditer 按顺序产出 HTML 注释 / Hugo shortcode / 围栏行 / 标题行
+# 四类词法单元，其余为正文。边扫描边维护围栏状态和标题栈，清理 shortcode 与切分
+# section 在同一遍完成，整体 O(文档长度)。
+# 行级单元以前导 \n 匹配（而不是 ^ + MULTILINE），所有分支的首字符都是 < { \n，
+# 正则引擎可以按首字符集快速跳过正文。
+
+_COMMENT_PAT = r'<!--(?P<comment>.*?)-->'
+_SHORTCODE_PAT = r'\{\{[<%]\s*(?P<sc_body>[^}]*?)\s*[%>]\}\}'
+_LINE_PAT = (r'\n(?=[`~#])(?:(?P<fence>(?P<fence_mark>`{3,}|~{3,})[^\n]*)'
+             r'|(?P<hashes>#{1,6})[ \t]+(?P<title>[^\n]+))')
+
+_CLEAN_RE = re.compile(_COMMENT_PAT + '|' + _SHORTCODE_PAT, re.DOTALL)
+_TOKEN_RE = re.compile('|'.join([_LINE_PAT, _COMMENT_PAT, _SHORTCODE_PAT]), re.DOTALL)
+_SC_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def _shortcode_text(body: str) -> str:
+    """shortcode 替换为保留的文本。
+
+    {{< glossary_tooltip text="containers" term_id="container" >}} → containers
+    {{< glossary_tooltip term_id="node" >}} → node
+    {{% code_sample file="..." %}} → [code: ...]
+    其余（note / warning 开闭标签、feature-state、relref 等）→ 删除
+    """
+    name = body.split(None, 1)[0] if body else ""
+    if name == "glossary_tooltip":
+        attrs = dict(_SC_ATTR_RE.findall(body))
+        return attrs.get("text") or attrs.get("term_id", "")
+    if name == "code_sample":
+        attrs = dict(_SC_ATTR_RE.findall(body))
+        return f"[code: {attrs['file']}]" if "file" in attrs else ""
+    return ""
+
+
+def _clean_token(m: re.Match) -> str:
+    return "" if m.group("comment") is not None else _shortcode_text(m.group("sc_body"))
+
 
 def _clean_hugo_shortcodes(content: str) -> str:
-    """清理 Hugo shortcodes，保留有意义的文本。"""
-    # {{< glossary_tooltip text="containers" term_id="container" >}} → containers
-    content = re.sub(
-        r'\{\{<\s*glossary_tooltip\s+text="([^"]+)"[^>]*>\}\}',
-        r'\1', content)
-    # {{< glossary_tooltip term_id="node" >}} → node
-    content = re.sub(
-        r'\{\{<\s*glossary_tooltip\s+term_id="([^"]+)"[^>]*>\}\}',
-        r'\1', content)
-    # {{< note >}} ... {{< /note >}} → keep content
-    content = re.sub(r'\{\{[<%]\s*/?\s*note\s*[%>]\}\}', '', content)
-    # {{< warning >}} ... {{< /warning >}} → keep content
-    content = re.sub(r'\{\{[<%]\s*/?\s*warning\s*[%>]\}\}', '', content)
-    # {{< feature-state ... >}} → remove
-    content = re.sub(r'\{\{<\s*feature-state[^>]*>\}\}', '', content)
-    # {{% code_sample file="..." %}} → [code sample: ...]
-    content = re.sub(
-        r'\{\{%\s*code_sample\s+file="([^"]+)"\s*%\}\}',
-        r'[code: \1]', content)
-    # <!-- overview --> etc HTML comments → remove
-    content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
-    # Any remaining shortcodes → remove
-    content = re.sub(r'\{\{[<%][^}]*[%>]\}\}', '', content)
-    # {{< relref "..." >}} inside links → keep link text
-    content = re.sub(r'\{\{<\s*relref\s+"[^"]*"\s*>\}\}', '', content)
-    return content
+    """清理 Hugo shortcodes 和 HTML 注释，保留有意义的文本（单次扫描）。"""
+    return _CLEAN_RE.sub(_clean_token, content)
 
 
 def _load_sidecar(filepath: str) -> Optional[dict]:
@@ -151,46 +292,101 @@ def _in_code_fence(pos: int, ranges: list[tuple[int, int]]) -> bool:
     return any(start <= pos <= end for start, end in ranges)
 
 
-def split_by_headings(content: str) -> list[dict]:
-    """按 Markdown 标题切分，保留 section_path 层级。跳过代码块中的 #。
+def _fence_open(m: re.Match) -> tuple[str, int]:
+    """围栏行 → 打开的围栏 (字符, 长度)。"""
+    mark = m.group("fence_mark")
+    return mark[0], len(mark)
 
-    返回: [{"text": "...", "section_path": "故障恢复 > 手动恢复 > 确认新 Master"}]
+
+def _fence_closes(fence: tuple[str, int], m: re.Match) -> bool:
+    """围栏行 m 是否闭合 fence：同一种字符、不短于开启围栏、后面没有 info string。"""
+    mark = m.group("fence_mark")
+    return (mark[0] == fence[0] and len(mark) >= fence[1]
+            and not m.group("fence")[len(mark):].strip())
+
+
+class _SectionBuilder:
+    """split_by_headings 的累积状态：已产出的 sections、标题栈、当前段落的文本片段。"""
+
+    def __init__(self):
+        self.sections: list[dict] = []
+        self.stack: list[tuple[int, str]] = []  # [(level, title), ...]
+        self.parts: list[str] = []
+
+    def flush(self) -> None:
+        text = "".join(self.parts).strip()
+        if text:
+            self.sections.append({"text": text,
+                                  "section_path": " > ".join(t for _, t in self.stack)})
+        self.parts = []
+
+    def heading(self, level: int, title: str) -> None:
+        self.flush()
+        # 弹出同级或更低级的标题
+        while self.stack and self.stack[-1][0] >= level:
+            self.stack.pop()
+        self.stack.append((level, title))
+
+    def snapshot(self) -> tuple:
+        return len(self.sections), list(self.stack), list(self.parts)
+
+    def restore(self, snap: tuple) -> None:
+        n, self.stack, self.parts = snap
+        del self.sections[n:]
+
+
+def _scan(content: str, pos: int, out: _SectionBuilder, fences: bool) -> Optional[tuple]:
+    """从 pos 开始扫描 content（首字符为 \n），把正文 / 标题写入 out。
+
+    fences=False 时不识别代码围栏。扫描结束时仍有未闭合的围栏，返回
+    (围栏起点, 围栏前的 out 快照)，由调用方回退后按普通文本重扫。
     """
-    heading_re = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
-    code_ranges = _find_code_fence_ranges(content)
-    sections = []
-    headings_stack: list[tuple[int, str]] = []  # [(level, title), ...]
-    last_pos = 0
-
-    for match in heading_re.finditer(content):
-        # 跳过代码块中的 #
-        if _in_code_fence(match.start(), code_ranges):
+    fence = None  # (字符, 长度)
+    opened = None  # (围栏起点, 围栏前的快照)
+    for m in _TOKEN_RE.finditer(content, pos):
+        out.parts.append(content[pos:m.start()])
+        pos = m.end()
+        if m.group("comment") is not None:
             continue
+        if m.group("sc_body") is not None:
+            out.parts.append(_shortcode_text(m.group("sc_body")))
+        elif m.group("fence") is not None:
+            if fence is None:
+                if fences:
+                    fence, opened = _fence_open(m), (m.start(), out.snapshot())
+            elif _fence_closes(fence, m):
+                fence = None
+            out.parts.append(m.group(0))
+        else:
+            title = _clean_hugo_shortcodes(m.group("title")).strip()
+            if fence is not None or not title:
+                # 代码块中的 # 不是标题
+                out.parts.append(_clean_hugo_shortcodes(m.group(0)))
+            else:
+                out.heading(len(m.group("hashes")), title)
+    out.parts.append(content[pos:])
+    return opened if fence is not None else None
 
-        # 保存上一段
-        if last_pos < match.start():
-            text = content[last_pos:match.start()].strip()
-            if text:
-                path = " > ".join(h[1] for h in headings_stack)
-                sections.append({"text": text, "section_path": path})
 
-        # 更新标题栈
-        level = len(match.group(1))
-        title = match.group(2).strip()
-        # 弹出同级或更低级的标题
-        while headings_stack and headings_stack[-1][0] >= level:
-            headings_stack.pop()
-        headings_stack.append((level, title))
-        last_pos = match.end()
-
-    # 最后一段
-    if last_pos < len(content):
-        text = content[last_pos:].strip()
-        if text:
-            path = " > ".join(h[1] for h in headings_stack)
-            sections.append({"text": text, "section_path": path})
+def split_by_headings(content: str) -> list[dict]:
+    """按 Markdown 标题切分，保留 section_path 层级。跳过代码块中的 #。
 
-    return sections if sections else [{"text": content.strip(), "section_path": ""}]
+    同一遍扫描中清理 Hugo shortcodes / HTML 注释（见 _clean_hugo_shortcodes）。
+    未闭合的代码围栏不视为代码块。
+
+    返回: [{"text": "...", "section_path": "故障恢复 > 手动恢复 > 确认新 Master"}]
+    """
+    out = _SectionBuilder()
+    text = "\n" + content  # 第一行也以 \n 开头，见 _LINE_PAT
+    unclosed = _scan(text, 0, out, fences=True)
+    if unclosed is not None:
+        start, snap = unclosed
+        out.restore(snap)
+        _scan(text, start, out, fences=False)
+    out.flush()
+    if out.sections:
+        return out.sections
+    return [{"text": _clean_hugo_shortcodes(content).strip(), "section_path": ""}]
 
 
 def merge_small_sections(sections: list[dict], max_chars: int = MAX_CHUNK_CHARS) -> list[dict]:
@@ -227,123 +423,723 @@ def _same_parent(path_a: str, path_b: str) -> bool:
     return parts_a == parts_b
 
 
+# 空行（只消费前一个 \n，后一个 \n 留给下一行的围栏 / 空行匹配）或围栏行
+_BLOCK_TOKEN_RE = re.compile(r'\n(?:(?P<brk>[ \t]*(?=\n))'
+                             r'|(?P<fence>(?P<fence_mark>`{3,}|~{3,})[^\n]*))')
+
+
+def _scan_blocks(text: str, pos: int, fences: bool) -> tuple[list[str], Optional[tuple]]:
+    """从 pos（指向 \n）开始按空行切块，围栏内的空行不切。
+
+    返回 (块列表, 未闭合围栏所在块的 (序号, 起点前的 \n 位置))，与 _scan 一样由调用方
+    回退后按普通文本重扫。
+    """
+    blocks: list[str] = []
+    start = pos + 1
+    fence = None
+    opened = None
+    for m in _BLOCK_TOKEN_RE.finditer(text, pos):
+        if m.group("brk") is not None:
+            if fence is None:
+                blocks.append(text[start:m.start()])
+                start = m.end() + 1
+        elif fence is None:
+            if fences:
+                fence, opened = _fence_open(m), (len(blocks), start - 1)
+        elif _fence_closes(fence, m):
+            fence = None
+    blocks.append(text[start:])
+    return blocks, (opened if fence is not None else None)
+
+
+def _split_blocks(text: str) -> list[str]:
+    """按空行切成段落块；代码块内的空行不切，整个代码块是一个块。
+
+    围栏规则与 split_by_headings 相同（``` / ~~~，闭合围栏同字符且不短于开启围栏），
+    未闭合的围栏不视为代码块。
+    """
+    text = "\n" + text  # 第一行也以 \n 开头，见 _BLOCK_TOKEN_RE
+    blocks, unclosed = _scan_blocks(text, 0, fences=True)
+    if unclosed is not None:
+        n, pos = unclosed
+        blocks = blocks[:n] + _scan_blocks(text, pos, fences=False)[0]
+    return [b for b in blocks if b.strip()]
+
+
+def _hard_split(block: str, max_chars: int) -> list[str]:
+    """超长块（大段代码、无空行的长文）按行切，单行超长时按字符切。"""
+    pieces: list[str] = []
+    cur = ""
+    for line in block.split("\n"):
+        while len(line) > max_chars:
+            if cur:
+                pieces.append(cur)
+                cur = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if cur and len(cur) + 1 + len(line) > max_chars:
+            pieces.append(cur)
+            cur = line
+        else:
+            cur = f"{cur}\n{line}" if cur else line
+    if cur.strip():
+        pieces.append(cur)
+    return pieces
+
+
+def _overlap_tail(units: list[str], limit: int) -> list[str]:
+    """取上一个 chunk 末尾不超过 limit 字符的内容作为下一个 chunk 的开头。
+
+    优先取完整的段落块；最后一块本身超过 limit 时，取其末尾并对齐到行首/词首。
+    """
+    if limit <= 0 or not units:
+        return []
+    tail: list[str] = []
+    size = 0
+    for unit in reversed(units):
+        extra = len(unit) + (2 if tail else 0)
+        if size + extra > limit:
+            break
+        tail.insert(0, unit)
+        size += extra
+    if tail:
+        return tail
+    last = units[-1][-limit:]
+    for sep in ("\n", " "):
+        cut = last.find(sep)
+        if cut != -1 and last[cut + 1:].strip():
+            return [last[cut + 1:]]
+    return [last]
+
+
+def split_oversized_sections(sections: list[dict], max_chars: int = MAX_CHUNK_CHARS,
+                             overlap: int = CHUNK_OVERLAP_CHARS) -> list[dict]:
+    """把超过 max_chars 的 section 按段落 / 代码块边界切开，相邻片段重叠约 overlap 字符。
+
+    否则超长 section 会被 embedding 模型截断，尾部内容检索不到却仍付出编码开销。
+    """
+    result = []
+    for sec in sections:
+        if len(sec["text"]) <= max_chars:
+            result.append(sec)
+            continue
+        units: list[str] = []
+        for block in _split_blocks(sec["text"]):
+            units.extend(_hard_split(block, max_chars) if len(block) > max_chars else [block])
+
+        pieces: list[str] = []
+        cur: list[str] = []
+        cur_len = 0
+        for unit in units:
+            if cur and cur_len + 2 + len(unit) > max_chars:
+                pieces.append("\n\n".join(cur))
+                cur = _overlap_tail(cur, min(overlap, max_chars - len(unit) - 2))
+                cur_len = len("\n\n".join(cur))
+            cur_len += len(unit) + (2 if cur else 0)
+            cur.append(unit)
+        if cur:
+            pieces.append("\n\n".join(cur))
+        result.extend({"text": p, "section_path": sec["section_path"]} for p in pieces)
+    return result
+
+
 # ── 索引核心 ──────────────────────────────────────────────────────
 
-def index_chunks(chunks: list[dict], batch_size: int = 256) -> None:
-    """将 chunks 编码为向量并写入 Qdrant。支持大批量分批编码。"""
-    if not chunks:
-        log.info("没有 chunks 需要索引")
-        return
+def _encode_text(chunk: dict) -> str:
+    """编码时拼接 title + section_path + text + contextual_summary。
+
+    summary 放末尾避免过度主导相似度（ChatGPT 建议）。
+    """
+    metadata = chunk.get("metadata", {})
+    parts = [metadata.get("title", ""), metadata.get("section_path", ""), chunk["text"]]
+    ctx_summary = metadata.get("contextual_summary", "")
+    if ctx_summary:
+        parts.append(f"DOC_SUMMARY: {ctx_summary}")
+    return "\n".join(p for p in parts if p)
+
+
+def _point_id(chunk_id: str) -> str:
+    return hashlib.md5(chunk_id.encode()).hexdigest()
+
+
+def _iter_point_batches(chunks: list[dict], output: dict, batch_size: int,
+                        extra: frozenset = frozenset()) -> Iterator[models.Batch]:
+    """把 chunks 和编码结果按 batch_size 切成列式 models.Batch，惰性产出。
+
+    dense 矩阵按切片整体转换（一次 C 层 tolist），不逐点构造 PointStruct；
+    字段类型由构造保证，用 model_construct 跳过 pydantic 对上百万个 float 的逐个校验。
+    extra 是写入目标接受的可选向量：bm25 词法向量由文本直接计算，不经过模型；
+    colbert 多向量取自编码结果（provider 不输出时不写）。
+    """
+    dense = output["dense_vecs"]
+    lexical = output["lexical_weights"]
+    multi = output.get("colbert_vecs") if colbert.VECTOR_NAME in extra else None
+    for start in range(0, len(chunks), batch_size):
+        part = chunks[start:start + batch_size]
+        end = start + len(part)
+        vectors: dict = {"dense": np.asarray(dense[start:end], dtype=np.float32).tolist()}
+        if lexical is not None:
+            vectors["sparse"] = [
+                models.SparseVector.model_construct(indices=list(map(int, w.keys())),
+                                                    values=list(map(float, w.values())))
+                for w in lexical[start:end]
+            ]
+        if bm25.VECTOR_NAME in extra:
+            vectors[bm25.VECTOR_NAME] = [bm25.chunk_vector(c) for c in part]
+        if multi is not None:
+            vectors[colbert.VECTOR_NAME] = [np.asarray(m, dtype=np.float32).tolist()
+                                            for m in multi[start:end]]
+        yield models.Batch.model_construct(
+            ids=[_point_id(c["chunk_id"]) for c in part],
+            vectors=vectors,
+            payloads=[_chunk_payload(c) for c in part],
+        )
+
+
+# ── 内容指纹：只编码新增或变更的 chunk ──────────────────────────
+
+def content_hash(chunk: dict) -> str:
+    """chunk 的内容指纹（基于实际送入模型的编码文本）。"""
+    return hashlib.sha256(_encode_text(chunk).encode()).hexdigest()[:16]
+
+
+def _chunk_payload(chunk: dict) -> dict:
+    payload = {
+        "doc_id": chunk["doc_id"],
+        "chunk_id": chunk["chunk_id"],
+        "text": chunk["text"],
+    }
+    payload.update(chunk.get("metadata", {}))
+    payload["content_hash"] = content_hash(chunk)
+    return payload
+
+
+class SyncPlan:
+    """一批文档与索引现状的差异。"""
+
+    def __init__(self):
+        self.embed: list[dict] = []                    # 需要编码的 chunks
+        self.reuse: list[tuple[dict, str]] = []        # (chunk, 复用向量的旧 point id)
+        self.unchanged = 0                             # 内容与 payload 都未变，跳过
+        self.stale_ids: list[str] = []                 # 已消失的旧 points
+
+
+def plan_sync(chunks: list[dict], existing: dict[str, dict], force: bool = False,
+              copy_unchanged: bool = False) -> SyncPlan:
+    """比较新 chunks 与已有 points（point_id → payload），决定每个 chunk 的处理方式。
+
+    - 同一 point 且指纹、payload 都相同 → 跳过
+    - 指纹在该文档已有 points 中存在 → 复用旧向量，只重写 payload（含 chunk 顺序变化）
+    - 否则 → 重新编码
+    已有但不再出现的 point 会被删除。force=True 时全部重新编码。
+    copy_unchanged=True（写入另一个 collection 的蓝绿重建）时未变更的 chunk 也
+    复用旧向量写入，且不产生删除。
+    """
+    plan = SyncPlan()
+    by_hash: dict[str, str] = {}
+    for pid, payload in existing.items():
+        h = payload.get("content_hash")
+        if h:
+            by_hash.setdefault(h, pid)
+
+    new_ids = set()
+    for chunk in chunks:
+        pid = _point_id(chunk["chunk_id"])
+        new_ids.add(pid)
+        if force:
+            plan.embed.append(chunk)
+            continue
+        payload = _chunk_payload(chunk)
+        h = payload["content_hash"]
+        old = existing.get(pid)
+        if old is not None and old.get("content_hash") == h:
+            if old == payload and not copy_unchanged:
+                plan.unchanged += 1
+            else:
+                plan.reuse.append((chunk, pid))
+        elif h in by_hash:
+            plan.reuse.append((chunk, by_hash[h]))
+        else:
+            plan.embed.append(chunk)
+
+    if not copy_unchanged:
+        plan.stale_ids = [pid for pid in existing if pid not in new_ids]
+    return plan
+
+
+def _existing_points(client: QdrantClient, doc_ids: list[str],
+                     collection: Optional[str] = None) -> dict[str, dict]:
+    """读取若干文档已索引 points 的 payload（不含向量）。"""
+    existing: dict[str, dict] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection or COLLECTION,
+            scroll_filter=models.Filter(must=[
+                models.FieldCondition(key="doc_id", match=models.MatchAny(any=doc_ids))
+            ]),
+            limit=1000,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        for p in points:
+            existing[str(p.id)] = p.payload or {}
+        if offset is None:
+            return existing
+
 
+def _reused_points(client: QdrantClient, reuse: list[tuple[dict, str]],
+                   collection: Optional[str] = None, extra: frozenset = frozenset(),
+                   ) -> tuple[list[models.PointStruct], list[dict]]:
+    """取回旧向量，按新 chunk 的 id 和 payload 重新组装 point。
+
+    bm25 向量按新 chunk 重新计算：旧 collection 可能没有，写入目标可能不接受。
+    colbert 多向量只能来自模型：写入目标接受而旧向量里没有的 chunk 改为重新编码。
+    scroll 之后、retrieve 之前被并发删除的旧 point 同样改为重新编码。
+    返回 (复用的 points, 需要重新编码的 chunks)。
+    """
+    if not reuse:
+        return [], []
+    src_ids = list(dict.fromkeys(src for _, src in reuse))
+    records = client.retrieve(collection_name=collection or COLLECTION, ids=src_ids,
+                              with_payload=False, with_vectors=True)
+    vectors = {str(r.id): r.vector for r in records}
+    points, missing = [], []
+    vanished = 0
+    for chunk, src in reuse:
+        old = vectors.get(src)
+        if old is None:
+            vanished += 1
+            missing.append(chunk)
+            continue
+        if colbert.VECTOR_NAME in extra and colbert.VECTOR_NAME not in old:
+            missing.append(chunk)
+            continue
+        vector = {k: v for k, v in old.items()
+                  if k != bm25.VECTOR_NAME and (k != colbert.VECTOR_NAME or k in extra)}
+        if bm25.VECTOR_NAME in extra:
+            vector[bm25.VECTOR_NAME] = bm25.chunk_vector(chunk)
+        points.append(models.PointStruct(id=_point_id(chunk["chunk_id"]), vector=vector,
+                                         payload=_chunk_payload(chunk)))
+    if vanished:
+        log.warning(f"  {vanished} 个 chunk 的旧 point 在读取向量前已被删除，改为重新编码")
+    return points, missing
+
+
+# ── 流式流水线：parse → encode → upsert ──────────────────────────
+#
+# 三个阶段通过有界队列连接，encode 第 N+1 批与 upsert 第 N 批并行。
+# 内存峰值由 batch 大小 × 队列深度决定，与语料规模无关。
+#
+# upsert 阶段由 UPLOAD_WORKERS 个线程并行上传，写入不等待落盘（wait=False），
+# 全部上传结束后用一次 wait=True 的空操作作为一致性屏障：Qdrant 按 WAL 顺序
+# 应用更新，屏障返回即表示之前的写入都已生效。
+
+PIPELINE_BATCH = int(os.environ.get("INDEX_BATCH_SIZE", "256"))
+PIPELINE_QUEUE_DEPTH = int(os.environ.get("INDEX_QUEUE_DEPTH", "2"))
+UPSERT_BATCH = 500  # Qdrant 单次上限约 1000 点
+UPLOAD_WORKERS = int(os.environ.get("INDEX_UPLOAD_WORKERS", "4"))
+UPLOAD_RETRIES = int(os.environ.get("INDEX_UPLOAD_RETRIES", "3"))
+
+_STOP = object()
+
+
+class StageStats:
+    """单个流水线阶段的吞吐统计。"""
+
+    def __init__(self, name: str, unit: str = "chunks"):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0  # 实际工作时间（不含等待队列；多进程阶段为各进程之和）
+        self.errors = 0
+        self._first_start: Optional[float] = None
+        self._last_end: Optional[float] = None
+        self._lock = threading.Lock()  # upsert 阶段多线程共用
+
+    def add(self, items: int, seconds: float) -> None:
+        with self._lock:
+            now = time.perf_counter()
+            if self._first_start is None:
+                self._first_start = now - seconds
+            self._last_end = now
+            self.items += items
+            self.batches += 1
+            self.busy += seconds
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+    @property
+    def wall(self) -> float:
+        """从第一批开始到最后一批结束的墙钟时间。"""
+        if self._first_start is None:
+            return 0.0
+        return self._last_end - self._first_start
+
+    def summary(self) -> str:
+        text = (f"{self.name}: {self.items} {self.unit} / {self.batches} batches, "
+                f"{self.busy:.1f}s busy, {self.rate:.1f} {self.unit}/s")
+        if self.wall > 0:
+            text += f"; wall {self.wall:.1f}s, {self.items / self.wall:.1f} {self.unit}/s"
+        if self.errors:
+            text += f", {self.errors} errors"
+        return text
+
+
+class _PipelineAborted(Exception):
+    """下游阶段失败，上游停止生产。"""
+
+
+def _queue_put(q: queue.Queue, item, abort: threading.Event) -> None:
+    """带中止检查的 put，避免下游异常退出后上游永久阻塞。"""
+    while True:
+        if abort.is_set():
+            raise _PipelineAborted()
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _queue_get(q: queue.Queue, abort: threading.Event):
+    while True:
+        if abort.is_set():
+            raise _PipelineAborted()
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+def _encode_stage(in_q: queue.Queue, out_q: queue.Queue, client: QdrantClient,
+                  replace_docs: bool, force: bool, abort: threading.Event,
+                  stats: StageStats, counts: dict, errors: list,
+                  source: Optional[str], copy: bool, extra: frozenset) -> None:
+    """source: 读取已有 points / 旧向量的 collection（None = 没有可复用的）；
+    copy=True 表示写入的是另一个 collection，未变更的 chunk 也要复制过去；
+    extra: 写入目标接受的可选向量（bm25 / colbert）。"""
     provider = get_provider()
-    client = get_qdrant()
-    ensure_collection(client)
-
-    # 编码时拼接 title + section_path + text + contextual_summary
-    # summary 放末尾避免过度主导相似度（ChatGPT 建议）
-    encode_texts = []
-    for c in chunks:
-        title = c.get("metadata", {}).get("title", "")
-        section = c.get("metadata", {}).get("section_path", "")
-        text = c["text"]
-        ctx_summary = c.get("metadata", {}).get("contextual_summary", "")
-        parts = [title, section, text]
-        if ctx_summary:
-            parts.append(f"DOC_SUMMARY: {ctx_summary}")
-        encode_texts.append("\n".join(p for p in parts if p))
-
-    log.info(f"编码 {len(encode_texts)} 个 chunks（batch_size={batch_size}）...")
-    output = provider.encode_texts(encode_texts, batch_size=batch_size)
-    has_sparse = output["lexical_weights"] is not None
-
-    points = []
-    for i, chunk in enumerate(chunks):
-        point_id = hashlib.md5(chunk["chunk_id"].encode()).hexdigest()
-
-        payload = {
-            "doc_id": chunk["doc_id"],
-            "chunk_id": chunk["chunk_id"],
-            "text": chunk["text"],
-        }
-        payload.update(chunk.get("metadata", {}))
+    try:
+        while True:
+            chunks = _queue_get(in_q, abort)
+            if chunks is _STOP:
+                break
+            t0 = time.perf_counter()
+            if replace_docs:
+                doc_ids = list(dict.fromkeys(c["doc_id"] for c in chunks))
+                existing = _existing_points(client, doc_ids, source) if source else {}
+                plan = plan_sync(chunks, existing, force=force, copy_unchanged=copy)
+            else:
+                plan = SyncPlan()
+                plan.embed = chunks
+            reused, missing = _reused_points(client, plan.reuse, source, extra)
+            plan.embed = plan.embed + missing
+            output = None
+            if plan.embed:
+                output = provider.encode_texts([_encode_text(c) for c in plan.embed],
+                                               batch_size=PIPELINE_BATCH)
+            stats.add(len(plan.embed), time.perf_counter() - t0)
+            counts["chunks"] += len(chunks)
+            counts["embedded"] += len(plan.embed)
+            counts["reused"] += len(reused)
+            counts["unchanged"] += plan.unchanged
+            counts["deleted"] += len(plan.stale_ids)
+            _queue_put(out_q, (plan.embed, output, reused, plan.stale_ids), abort)
+        _queue_put(out_q, _STOP, abort)
+    except _PipelineAborted:
+        pass
+    except Exception as e:
+        errors.append(e)
+        abort.set()
+
+
+def _with_retries(fn, what: str, retries: int = UPLOAD_RETRIES):
+    """调用 fn，失败时指数退避重试（1s、2s、4s…），最后一次失败抛出原异常。"""
+    for attempt in range(retries):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            wait = 2 ** attempt
+            log.warning(f"  {what} 失败 (attempt {attempt + 1}): {e}, {wait}s 后重试")
+            time.sleep(wait)
+
+
+def _upload_batches(embed: list[dict], output: Optional[dict],
+                    reused: list[models.PointStruct], extra: frozenset = frozenset()) -> Iterator:
+    """一个流水线批次的上传单元：新编码的列式 Batch + 复用向量的 PointStruct 列表。
+
+    带 colbert 多向量时按每点的向量数缩小批次，单个请求不超过 Qdrant 的大小上限。
+    """
+    size = UPSERT_BATCH
+    if colbert.VECTOR_NAME in extra:
+        size = min(size, colbert.upsert_batch_size())
+    if output is not None:
+        yield from _iter_point_batches(embed, output, size, extra)
+    for start in range(0, len(reused), size):
+        yield reused[start:start + size]
+
+
+def _upsert_stage(in_q: queue.Queue, client: QdrantClient, abort: threading.Event,
+                  stats: StageStats, errors: list, target: str, extra: frozenset) -> None:
+    """上传线程（UPLOAD_WORKERS 个共用 in_q）。收到 _STOP 后放回，让其他线程也退出。"""
+    try:
+        while True:
+            item = _queue_get(in_q, abort)
+            if item is _STOP:
+                _queue_put(in_q, _STOP, abort)
+                break
+            embed, output, reused, stale_ids = item
+            if not embed and not reused and not stale_ids:
+                continue
+            t0 = time.perf_counter()
+            if stale_ids:
+                _with_retries(lambda: client.delete(
+                    collection_name=target, wait=False,
+                    points_selector=models.PointIdsList(points=stale_ids)), "delete")
+            n = 0
+            for batch in _upload_batches(embed, output, reused, extra):
+                _with_retries(lambda: client.upsert(collection_name=target, points=batch,
+                                                    wait=False), "upsert")
+                n += len(batch.ids) if isinstance(batch, models.Batch) else len(batch)
+            stats.add(n, time.perf_counter() - t0)
+            log.info(f"  upsert {stats.items} chunks")
+    except _PipelineAborted:
+        pass
+    except Exception as e:
+        errors.append(e)
+        abort.set()
+
+
+def _consistency_barrier(client: QdrantClient, collection: Optional[str] = None) -> None:
+    """wait=True 的空删除：返回时此前所有 wait=False 写入都已应用。"""
+    _with_retries(lambda: client.delete(collection_name=collection or COLLECTION, wait=True,
+                                        points_selector=models.PointIdsList(points=[])),
+                  "barrier")
+
+
+def run_pipeline(batches: Iterable[list[dict]], replace_docs: bool = False,
+                 force: bool = False, parse_stats: Optional[StageStats] = None,
+                 target: Optional[str] = None, copy_from: Optional[str] = None) -> dict:
+    """流式执行 encode + upsert。
+
+    batches 是 chunk 列表的迭代器（通常是惰性解析的生成器），在调用线程中消费，
+    encode 占一个线程，upsert 由 UPLOAD_WORKERS 个线程并行（wait=False，结束时
+    一次一致性屏障）。replace_docs=True 时每批被视为其文档的完整
+    新版本（要求同一文档的 chunks 不跨批）：按内容指纹只编码新增/变更的 chunk，
+    删除已消失的 chunk；force=True 时忽略指纹全部重新编码。
 
-        vector: dict = {"dense": output["dense_vecs"][i].tolist()}
-        if has_sparse:
-            sparse = output["lexical_weights"][i]
-            vector["sparse"] = models.SparseVector(
-                indices=list(map(int, sparse.keys())),
-                values=list(sparse.values()),
-            )
+    target 为空时原地更新 COLLECTION。指定 target（蓝绿重建的新 collection）时
+    写入 target，按指纹从 copy_from（当前线上 collection，可为 None）复制未变更
+    chunk 的向量，只编码新增/变更的部分。
+
+    返回计数 {"chunks", "embedded", "reused", "unchanged", "deleted"}。
+    任一阶段失败时中止整条流水线并抛出原异常。
+    """
+    client = get_qdrant()
+    source = COLLECTION if target is None else copy_from
+    target = target or COLLECTION
+    ensure_collection(client, target)
+    # 建库早于 bm25 / colbert 的 collection 不接受这些向量，照旧只写 dense / sparse
+    # （--rebuild 后补上）；provider 不输出 colbert 多向量（外部 API 模式）时也不写
+    extra = set()
+    if bm25.has_bm25(client, target):
+        extra.add(bm25.VECTOR_NAME)
+    if colbert.has_colbert(client, target) and get_provider().colbert:
+        extra.add(colbert.VECTOR_NAME)
+    extra = frozenset(extra)
+
+    encode_q: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    upsert_q: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    abort = threading.Event()
+    errors: list[Exception] = []
+    encode_stats = StageStats("encode")
+    upsert_stats = StageStats("upsert")
+    counts = dict.fromkeys(["chunks", "embedded", "reused", "unchanged", "deleted"], 0)
+
+    workers = [
+        threading.Thread(target=_encode_stage, name="index-encode",
+                         args=(encode_q, upsert_q, client, replace_docs, force, abort,
+                               encode_stats, counts, errors, source, source != target,
+                               extra),
+                         daemon=True),
+    ] + [
+        threading.Thread(target=_upsert_stage, name=f"index-upsert-{i}",
+                         args=(upsert_q, client, abort, upsert_stats, errors, target,
+                               extra),
+                         daemon=True)
+        for i in range(max(1, UPLOAD_WORKERS))
+    ]
+    for w in workers:
+        w.start()
+
+    t0 = time.perf_counter()
+    try:
+        for chunks in batches:
+            if chunks:
+                _queue_put(encode_q, chunks, abort)
+        _queue_put(encode_q, _STOP, abort)
+    except _PipelineAborted:
+        pass
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        for w in workers:
+            w.join()
+
+    changed = counts["embedded"] or counts["reused"] or counts["deleted"]
+    if changed and not errors:
+        t_barrier = time.perf_counter()
+        _consistency_barrier(client, target)
+        log.info(f"  ⏱ 一致性屏障 {time.perf_counter() - t_barrier:.2f}s")
+    if changed:
+        bump_index_version(client, target)
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - t0
+    for stats in (parse_stats, encode_stats, upsert_stats):
+        if stats is not None:
+            log.info(f"  ⏱ {stats.summary()}")
+    if elapsed > 0 and counts["chunks"]:
+        log.info(f"  ⏱ 总计 {elapsed:.1f}s, {counts['chunks'] / elapsed:.1f} chunks/s")
+    if replace_docs:
+        log.info(f"  指纹比对: {counts['embedded']} 编码, {counts['reused']} 复用向量, "
+                 f"{counts['unchanged']} 未变更, {counts['deleted']} 删除")
+    return counts
+
+
+def _slice_batches(chunks: list[dict], batch_size: int) -> Iterator[list[dict]]:
+    for start in range(0, len(chunks), batch_size):
+        yield chunks[start:start + batch_size]
 
-        points.append(models.PointStruct(
-            id=point_id,
-            vector=vector,
-            payload=payload,
-        ))
 
-    # 分批 upsert（Qdrant 单次上限约 1000 点）
-    UPSERT_BATCH = 500
-    for start in range(0, len(points), UPSERT_BATCH):
-        batch = points[start:start + UPSERT_BATCH]
-        client.upsert(collection_name=COLLECTION, points=batch)
-        if len(points) > UPSERT_BATCH:
-            log.info(f"  upsert {start + len(batch)}/{len(points)}")
+def index_chunks(chunks: list[dict], batch_size: int = 256) -> None:
+    """将 chunks 编码为向量并写入 Qdrant。按 batch_size 分批流式编码 + 写入。"""
+    if not chunks:
+        log.info("没有 chunks 需要索引")
+        return
 
-    log.info(f"✅ 已索引 {len(points)} 个 chunks")
+    log.info(f"编码 {len(chunks)} 个 chunks（batch_size={batch_size}）...")
+    counts = run_pipeline(_slice_batches(chunks, batch_size))
+    log.info(f"✅ 已索引 {counts['chunks']} 个 chunks")
+
+
+# ── 批量删除 ──────────────────────────────────────────────────────
+#
+# 按字段值批量删除：值列表切成 DELETE_BATCH 一组，每组一个 MatchAny 过滤的 count +
+# delete（doc_id / source_repo 都有 keyword 索引），DELETE_WORKERS 组并发。删除不等
+# 待落盘，全部提交后用一次一致性屏障收尾。
+
+DELETE_BATCH = int(os.environ.get("INDEX_DELETE_BATCH", "256"))
+DELETE_WORKERS = int(os.environ.get("INDEX_DELETE_WORKERS", "4"))
+
+
+def delete_where(client: QdrantClient, field: str, values: Iterable[str],
+                 collection: Optional[str] = None, batch_size: int = DELETE_BATCH,
+                 workers: int = DELETE_WORKERS) -> int:
+    """删除 field 取值在 values 中的所有 points，返回删除的点数。失败时抛出异常。"""
+    collection = collection or COLLECTION
+    values = list(dict.fromkeys(values))
+    if not values:
+        return 0
+
+    def delete_group(group: list[str]) -> int:
+        flt = models.Filter(must=[
+            models.FieldCondition(key=field, match=models.MatchAny(any=group))
+        ])
+        n = _with_retries(lambda: client.count(collection_name=collection, count_filter=flt,
+                                               exact=True).count, "count")
+        if n:
+            _with_retries(lambda: client.delete(
+                collection_name=collection, wait=False,
+                points_selector=models.FilterSelector(filter=flt)), "delete")
+        return n
+
+    groups = [values[i:i + batch_size] for i in range(0, len(values), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups)))) as pool:
+        deleted = sum(pool.map(delete_group, groups))
+    if deleted:
+        _consistency_barrier(client, collection)
+    return deleted
+
+
+def _after(batches: Iterable[list[dict]], future: Future) -> Iterator[list[dict]]:
+    """第一批交给流水线之前等待 future：后台删除与解析重叠，但一定先于写入完成。"""
+    it = iter(batches)
+    first = next(it, None)
+    future.result()
+    if first is not None:
+        yield first
+    yield from it
 
 
 def delete_doc(doc_id: str) -> None:
     """删除某个文档的所有 chunks。"""
     client = get_qdrant()
-    client.delete(
-        collection_name=COLLECTION,
-        points_selector=models.FilterSelector(
-            filter=models.Filter(must=[
-                models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))
-            ])
-        ),
-    )
-    log.info(f"✅ 已删除 doc_id={doc_id} 的所有 chunks")
+    n = delete_where(client, "doc_id", [doc_id])
+    bump_index_version(client)
+    log.info(f"✅ 已删除 doc_id={doc_id} 的 {n} 个 chunks")
 
 
 def delete_by_source_repo(repo_url: str) -> None:
     """按 source_repo 字段批量删除某个仓库的所有 chunks。"""
     client = get_qdrant()
-    # 先统计数量
-    count_result = client.count(
-        collection_name=COLLECTION,
-        count_filter=models.Filter(must=[
-            models.FieldCondition(key="source_repo", match=models.MatchValue(value=repo_url))
-        ]),
-    )
-    n = count_result.count
+    n = delete_where(client, "source_repo", [repo_url])
     if n == 0:
         log.info(f"source_repo={repo_url} 无 chunks，跳过删除")
         return
-
-    client.delete(
-        collection_name=COLLECTION,
-        points_selector=models.FilterSelector(
-            filter=models.Filter(must=[
-                models.FieldCondition(key="source_repo", match=models.MatchValue(value=repo_url))
-            ])
-        ),
-    )
+    bump_index_version(client)
     log.info(f"✅ 已删除 source_repo={repo_url} 的 {n} 个 chunks")
 
 
-def _stable_doc_id(filepath: str) -> str:
-    """从文件路径生成稳定的 doc_id（基于相对路径，跨机器一致）。"""
-    # 去掉常见前缀，保留有意义的路径部分
+_DOC_ROOTS = ["tests/fixtures/kb-sources/k8s-website/content/en/docs/",
+              "tests/fixtures/kb-sources/redis-docs/content/",
+              "docs/"]
+
+
+def _relative_doc_path(filepath: str) -> str:
+    """去掉常见的文档根前缀，保留有意义的路径部分。"""
     p = filepath
-    for prefix in ["tests/fixtures/kb-sources/k8s-website/content/en/docs/",
-                    "tests/fixtures/kb-sources/redis-docs/content/",
-                    "docs/"]:
+    for prefix in _DOC_ROOTS:
         if prefix in p:
-            p = p[p.index(prefix) + len(prefix):]
-            break
+            return p[p.index(prefix) + len(prefix):]
+    return p
+
+
+def _stable_doc_id(filepath: str) -> str:
+    """从文件路径生成稳定的 doc_id（基于相对路径，跨机器一致）。"""
     # 用路径的 md5 前 8 位
-    return hashlib.md5(p.encode()).hexdigest()[:8]
+    return hashlib.md5(_relative_doc_path(filepath).encode()).hexdigest()[:8]
+
+
+def path_fields(filepath: str) -> dict:
+    """路径的结构化字段，供 scope 过滤走 keyword 索引精确匹配。
+
+    path_segments: 路径中的全部目录名（不含文件名），scope=runbook 即匹配
+                   path_segments 含 "runbook"，等价于旧的 path 包含 "/runbook/"
+    scope:         文档根下的一级目录（runbook / adr / api ...），根目录文件为 ""
+    """
+    norm = filepath.replace("\\", "/")
+    parts = [s for s in norm.split("/") if s and s != "."]
+    rel = [s for s in _relative_doc_path(norm).split("/") if s and s != "."]
+    return {
+        "path_segments": parts[:-1],
+        "scope": rel[0] if len(rel) > 1 else "",
+    }
+
+
+def _normalize_tags(tags) -> list[str]:
+    if isinstance(tags, str):
+        tags = [t for t in re.split(r"[,\s]+", tags) if t]
+    return [str(t) for t in tags or []]
 
 
 def parse_file(filepath: str) -> list[dict]:
@@ -352,9 +1148,9 @@ def parse_file(filepath: str) -> list[dict]:
     doc_id = post.metadata.get("id", _stable_doc_id(filepath))
     title = post.metadata.get("title", os.path.basename(filepath))
 
-    content = _clean_hugo_shortcodes(post.content)
-    sections = split_by_headings(content)
+    sections = split_by_headings(post.content)
     sections = merge_small_sections(sections)
+    sections = split_oversized_sections(sections)
 
     # 加载 sidecar 预处理数据
     sidecar = _load_sidecar(filepath)
@@ -367,7 +1163,8 @@ def parse_file(filepath: str) -> list[dict]:
             "section_path": sec["section_path"],
             "chunk_index": i,
             "confidence": post.metadata.get("confidence", "unknown"),
-            "tags": post.metadata.get("tags", []),
+            **path_fields(filepath),
+            "tags": _normalize_tags(post.metadata.get("tags")),
             "source_repo": post.metadata.get("source_repo", ""),
             "source_path": post.metadata.get("source_path", ""),
             "source_commit": post.metadata.get("source_commit", ""),
@@ -393,80 +1190,121 @@ def parse_file(filepath: str) -> list[dict]:
     return chunk_data
 
 
-def index_file(filepath: str) -> int:
-    """索引单个 Markdown 文件（解析 + 编码 + 写入）。返回 chunk 数。"""
-    post = frontmatter.load(filepath)
-    doc_id = post.metadata.get("id", _stable_doc_id(filepath))
-
-    # 先删除旧 chunks
-    try:
-        delete_doc(doc_id)
-    except Exception:
-        pass
+def index_file(filepath: str, force: bool = False) -> int:
+    """索引单个 Markdown 文件（解析 + 编码 + 写入）。返回 chunk 数。
 
+    按内容指纹与已索引版本比对：只编码新增/变更的 chunk，删除已消失的 chunk。
+    """
     chunk_data = parse_file(filepath)
-    index_chunks(chunk_data)
+    run_pipeline([chunk_data], replace_docs=True, force=force)
     return len(chunk_data)
 
 
 # ── 全量 / 增量 ──────────────────────────────────────────────────
 
-def index_full(docs_dir: str) -> None:
-    """全量重建：先收集所有 chunks，再一次性批量编码 + 写入。"""
-    md_files = sorted(Path(docs_dir).rglob("*.md"))
-    # 跳过 .preprocess 目录下的文件
-    md_files = [f for f in md_files if ".preprocess" not in f.parts]
-    if not md_files:
-        log.info(f"目录 {docs_dir} 下没有 .md 文件")
-        return
+PARSE_WORKERS = int(os.environ.get("INDEX_PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
 
-    log.info(f"全量索引: {len(md_files)} 个文件 ({docs_dir})")
 
-    # Phase 1: 收集所有 doc_id 用于批量删除
-    doc_ids: set[str] = set()
-    all_chunks: list[dict] = []
-    errors = 0
+def _parse_one(filepath: str) -> tuple[str, Optional[list[dict]], str, float]:
+    """解析进程的任务：返回 (路径, chunks | None, 错误信息, 耗时)。单文件失败不影响其他文件。"""
+    t0 = time.perf_counter()
+    try:
+        return filepath, parse_file(filepath), "", time.perf_counter() - t0
+    except Exception as e:
+        return filepath, None, f"{type(e).__name__}: {e}", time.perf_counter() - t0
 
-    for f in md_files:
-        try:
-            chunks = parse_file(str(f))
-            if chunks:
-                doc_ids.add(chunks[0]["doc_id"])
-                all_chunks.extend(chunks)
-                log.info(f"  📄 {f} → {len(chunks)} chunks")
-        except Exception as e:
-            log.error(f"  ❌ {f}: {e}")
-            errors += 1
 
-    log.info(f"解析完成: {len(md_files) - errors} 文件, {len(all_chunks)} chunks")
+def _iter_parsed(md_files: list[Path], workers: int) -> Iterator[tuple]:
+    """按文件顺序流式产出 _parse_one 的结果。
 
-    if not all_chunks:
+    workers > 1 时分发到进程池，同时在途的文件数限制在 workers × 4，
+    解析结果不会因下游 encode 较慢而在内存中堆积。
+    """
+    paths = [str(f) for f in md_files]
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _parse_one(path)
+        return
+
+    # spawn：run_pipeline 已启动 encode/upsert 线程，fork 带线程的进程不安全
+    ctx = multiprocessing.get_context("spawn")
+    window = workers * 4
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=ctx) as pool:
+        it = iter(paths)
+        pending = collections.deque(
+            pool.submit(_parse_one, path) for path in itertools.islice(it, window))
+        while pending:
+            result = pending.popleft().result()
+            path = next(it, None)
+            if path is not None:
+                pending.append(pool.submit(_parse_one, path))
+            yield result
+
+
+def _iter_doc_batches(md_files: list[Path], batch_size: int, stats: StageStats,
+                      workers: int = 1) -> Iterator[list[dict]]:
+    """解析文件（可多进程），按整文档凑满 batch_size 个 chunks 后产出一批。"""
+    buf: list[dict] = []
+    for f, chunks, error, seconds in _iter_parsed(md_files, workers):
+        if error:
+            log.error(f"  ❌ {f}: {error}")
+            stats.errors += 1
+            continue
+        stats.add(1, seconds)
+        if not chunks:
+            continue
+        log.info(f"  📄 {f} → {len(chunks)} chunks")
+        buf.extend(chunks)
+        if len(buf) >= batch_size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def _collect_md_files(docs_dirs: list[str]) -> list[Path]:
+    md_files = []
+    for docs_dir in docs_dirs:
+        # 跳过 .preprocess 目录下的文件
+        found = [f for f in sorted(Path(docs_dir).rglob("*.md")) if ".preprocess" not in f.parts]
+        if not found:
+            log.info(f"目录 {docs_dir} 下没有 .md 文件")
+        md_files.extend(found)
+    return md_files
+
+
+def index_full(docs_dirs: str | list[str], force: bool = False,
+               workers: Optional[int] = None) -> None:
+    """全量重建：parse → encode → upsert 流式流水线，内存占用与语料规模无关。
+
+    解析在 workers 个进程中并行（默认 INDEX_PARSE_WORKERS），结果按文件顺序流入
+    encode。多个目录共用一个进程池和一条流水线，不再逐目录串行等待。
+    未变更的 chunk 按内容指纹跳过；force=True 时全部重新编码（如更换模型后）。
+    """
+    if isinstance(docs_dirs, str):
+        docs_dirs = [docs_dirs]
+    md_files = _collect_md_files(docs_dirs)
+    if not md_files:
         return
 
-    # Phase 2: 批量删除旧 chunks
+    workers = workers or PARSE_WORKERS
+    log.info(f"全量索引: {len(md_files)} 个文件 ({', '.join(docs_dirs)}), "
+             f"{workers} 个解析进程")
+
+    parse_stats = StageStats("parse", unit="files")
+    batches = _iter_doc_batches(md_files, PIPELINE_BATCH, parse_stats, workers)
+    counts = run_pipeline(batches, replace_docs=True, force=force, parse_stats=parse_stats)
     client = get_qdrant()
-    ensure_collection(client)
-    for doc_id in doc_ids:
-        try:
-            client.delete(
-                collection_name=COLLECTION,
-                points_selector=models.FilterSelector(
-                    filter=models.Filter(must=[
-                        models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))
-                    ])
-                ),
-            )
-        except Exception:
-            pass
-    log.info(f"已清理 {len(doc_ids)} 个旧文档的 chunks")
+    if not has_path_fields(client):
+        # 未变更的旧 chunk 不会重写，payload 由迁移补齐
+        migrate_payload(client)
 
-    # Phase 3: 一次性批量编码 + 写入
-    index_chunks(all_chunks)
-    log.info(f"✅ 全量索引完成: {len(md_files) - errors} 文件, {len(all_chunks)} chunks")
+    log.info(f"✅ 全量索引完成: {len(md_files) - parse_stats.errors} 文件, "
+             f"{counts['chunks']} chunks")
 
 
-def index_incremental() -> None:
-    """增量更新：基于 git diff 找出变更的 .md 文件。"""
+def index_incremental(force: bool = False) -> None:
+    """增量更新：基于 git diff 找出变更的 .md 文件，文件内再按 chunk 指纹只编码变更部分。"""
     try:
         # 找出最近一次 commit 到工作区的变更
         result = subprocess.run(
@@ -492,25 +1330,303 @@ def index_incremental() -> None:
         return
 
     log.info(f"增量索引: {len(all_changed)} 个变更文件")
-    total_chunks = 0
-    for f in all_changed:
-        if not os.path.exists(f):
-            # 文件被删除，尝试删除索引
-            doc_id = hashlib.md5(f.encode()).hexdigest()[:8]
-            try:
-                delete_doc(doc_id)
-                log.info(f"  🗑️ {f} (已删除)")
-            except Exception:
-                pass
-            continue
-        try:
-            n = index_file(f)
-            total_chunks += n
-            log.info(f"  {f} → {n} chunks")
-        except Exception as e:
-            log.error(f"  ❌ {f}: {e}")
+    removed = [f for f in sorted(all_changed) if not os.path.exists(f)]
+    existing_files = [Path(f) for f in sorted(all_changed) if os.path.exists(f)]
+
+    # 已删除文件的 chunks 在后台批量删除，与解析重叠；第一批写入前等待删除完成
+    client = get_qdrant()
+    parse_stats = StageStats("parse", unit="files")
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-delete") as pool:
+        deleting = pool.submit(delete_where, client, "doc_id",
+                               [_stable_doc_id(f) for f in removed])
+        batches = _iter_doc_batches(existing_files, PIPELINE_BATCH, parse_stats, PARSE_WORKERS)
+        counts = run_pipeline(_after(batches, deleting), replace_docs=True, force=force,
+                              parse_stats=parse_stats)
+    deleted = deleting.result()
+    if deleted:
+        bump_index_version(client)
+    for f in removed:
+        log.info(f"  🗑️ {f} (已删除)")
+    if removed:
+        log.info(f"  删除 {len(removed)} 个已移除文件的 {deleted} 个 chunks")
+
+    log.info(f"✅ 增量索引完成: {len(all_changed)} 文件, {counts['chunks']} chunks")
+
+
+# ── 蓝绿重建 ──────────────────────────────────────────────────────
+#
+# COLLECTION 是 alias，指向实际的版本化 collection "<COLLECTION>-v<UTC 时间戳(微秒)>"，
+# 名字按字典序即时间序。
+# 重建写入新版本，线上查询始终经 alias 访问旧版本、不受影响；新版本通过点数校验和
+# golden query 冒烟测试后，一次 update_collection_aliases 原子切换，再回收旧版本。
+# 未变更 chunk 的向量按内容指纹从线上版本复制，不重新编码。
+
+REBUILD_MIN_RATIO = float(os.environ.get("INDEX_REBUILD_MIN_RATIO", "0.5"))
+REBUILD_KEEP = int(os.environ.get("INDEX_REBUILD_KEEP", "0"))
+REBUILD_GC_DELAY = float(os.environ.get("INDEX_REBUILD_GC_DELAY", "5"))
+SMOKE_TOP_K = 5
+
+
+def live_collection(client: QdrantClient, alias: Optional[str] = None) -> Optional[str]:
+    """alias 当前指向的 collection；旧部署中 COLLECTION 是实体 collection 时返回它本身。"""
+    alias = alias or COLLECTION
+    target = resolve_alias(client, alias)
+    if target is not None:
+        return target
+    return alias if client.collection_exists(alias) else None
+
+
+def _track_ids(batches: Iterable[list[dict]], ids: set) -> Iterator[list[dict]]:
+    for chunks in batches:
+        ids.update(_point_id(c["chunk_id"]) for c in chunks)
+        yield chunks
+
+
+def _smoke_cases() -> list[dict]:
+    """golden 检索用例（eval_retrieval 的 golden 子集）；取不到时返回空列表。"""
+    try:
+        from eval_retrieval import load_test_cases
+        return load_test_cases(golden_only=True)
+    except Exception as e:
+        log.warning(f"  golden 用例不可用，跳过冒烟测试: {e}")
+        return []
+
+
+def _golden_hits(client: QdrantClient, collection: str, cases: list[dict]) -> int:
+    """dense 检索 top-k 命中 expected_paths 的用例数。"""
+    from eval_retrieval import check_hit
+    provider = get_provider()
+    params = collection_profiles.search_params(
+        collection_profiles.collection_profile(client, collection))
+    hits = 0
+    for tc in cases:
+        vec = provider.encode_query(tc["question"])["dense_vec"]
+        points = client.query_points(collection_name=collection, query=vec, using="dense",
+                                     limit=SMOKE_TOP_K, with_payload=["path"],
+                                     search_params=params).points
+        hits += check_hit([{"path": (p.payload or {}).get("path", "")} for p in points],
+                          tc["expected_paths"])
+    return hits
+
+
+def validate_rebuild(client: QdrantClient, target: str, live: Optional[str],
+                     expected: int, smoke: bool = True) -> None:
+    """切换前校验新 collection，不通过时抛 RuntimeError。
+
+    - 点数与写入的 chunk 数一致，且不为 0
+    - 不少于线上版本的 REBUILD_MIN_RATIO（防止目录写错导致索引大幅缩水）
+    - golden query 命中数不低于线上版本
+    """
+    n = client.count(target, exact=True).count
+    if n == 0 or n != expected:
+        raise RuntimeError(f"{target} 有 {n} 个点，预期 {expected}")
+    if live is not None:
+        live_n = client.count(live, exact=True).count
+        if n < live_n * REBUILD_MIN_RATIO:
+            raise RuntimeError(f"{target} 只有 {n} 个点，线上 {live} 有 {live_n} 个"
+                               f"（下限 {REBUILD_MIN_RATIO:.0%}）")
+    log.info(f"  点数校验通过: {n}")
+    if not smoke:
+        return
+    cases = _smoke_cases()
+    if not cases:
+        return
+    new_hits = _golden_hits(client, target, cases)
+    live_hits = _golden_hits(client, live, cases) if live is not None else 0
+    log.info(f"  golden 冒烟测试: 新版本 {new_hits}/{len(cases)}, 线上 {live_hits}/{len(cases)}")
+    if new_hits < live_hits:
+        raise RuntimeError(f"golden 命中数下降: {live_hits} → {new_hits}")
+
+
+def swap_alias(client: QdrantClient, target: str, alias: Optional[str] = None) -> None:
+    """把 alias 原子地指向 target。"""
+    alias = alias or COLLECTION
+    ops = []
+    if resolve_alias(client, alias) is not None:
+        ops.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    elif client.collection_exists(alias):
+        # 旧部署：同名实体 collection 必须先删掉才能建 alias，中间有一次请求的空窗
+        log.warning(f"  {alias} 是实体 collection，删除后改为 alias（仅首次迁移）")
+        client.delete_collection(alias)
+    ops.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=target, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+
+
+def gc_collections(client: QdrantClient, keep: int = REBUILD_KEEP,
+                   alias: Optional[str] = None) -> list[str]:
+    """删除比线上版本旧的版本化 collection，保留最近 keep 个用于回滚。
+
+    比线上版本新的（可能是正在进行的另一次重建）不动。返回删除的名字。
+    """
+    alias = alias or COLLECTION
+    current = resolve_alias(client, alias)
+    if current is None:
+        return []
+    prefix = f"{alias}-v"
+    older = sorted((c.name for c in client.get_collections().collections
+                    if c.name.startswith(prefix) and c.name < current), reverse=True)
+    removed = older[keep:]
+    for name in removed:
+        client.delete_collection(name)
+        log.info(f"  🗑️ 回收旧版本 {name}")
+    return removed
+
+
+def index_rebuild(docs_dirs: str | list[str], force: bool = False, smoke: bool = True,
+                  keep: int = REBUILD_KEEP) -> Optional[str]:
+    """蓝绿重建：写入新版本 collection → 校验 → 原子切换 alias → 回收旧版本。
+
+    返回新 collection 名。校验失败时 alias 不变，新 collection 保留供排查。
+    重建期间对线上版本的增量写入不会进入新版本，应避免并发执行。
+    """
+    if isinstance(docs_dirs, str):
+        docs_dirs = [docs_dirs]
+    md_files = _collect_md_files(docs_dirs)
+    if not md_files:
+        return None
+
+    client = get_qdrant()
+    live = live_collection(client)
+    target = _new_version(client)
+    log.info(f"蓝绿重建: {len(md_files)} 个文件 → {target}（线上: {live or '无'}）")
+    # 沿用线上版本的存储档位，显式设置 COLLECTION_PROFILE 时以它为准
+    ensure_collection(client, target, profile=collection_profiles.COLLECTION_PROFILE or (
+        live and collection_profiles.collection_profile(client, live)))
+
+    parse_stats = StageStats("parse", unit="files")
+    ids: set = set()
+    batches = _track_ids(_iter_doc_batches(md_files, PIPELINE_BATCH, parse_stats, PARSE_WORKERS),
+                         ids)
+    run_pipeline(batches, replace_docs=True, force=force, parse_stats=parse_stats,
+                 target=target, copy_from=live)
+    _promote(client, target, live, len(ids), smoke, keep)
+    return target
+
+
+def _new_version(client: QdrantClient) -> str:
+    target = f"{COLLECTION}-v{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}"
+    if client.collection_exists(target):
+        raise RuntimeError(f"collection {target} 已存在")
+    return target
+
+
+def _promote(client: QdrantClient, target: str, live: Optional[str], expected: int,
+             smoke: bool, keep: int) -> None:
+    """校验新版本 → 原子切换 alias → 回收旧版本。校验失败时抛 RuntimeError，alias 不变。"""
+    try:
+        validate_rebuild(client, target, live, expected, smoke=smoke)
+    except RuntimeError as e:
+        log.error(f"❌ 校验失败，{COLLECTION} 未切换，保留 {target} 供排查: {e}")
+        raise
+    swap_alias(client, target)
+    log.info(f"✅ {COLLECTION} → {target}")
+
+    if live is not None and live != COLLECTION:
+        time.sleep(REBUILD_GC_DELAY)  # 等切换前发出的查询结束
+    gc_collections(client, keep)
+
+
+# ── 存储档位迁移 ──────────────────────────────────────────────────
+
+MIGRATE_BATCH = 256
+
+
+def migrate_profile(profile: str, smoke: bool = True, keep: int = REBUILD_KEEP,
+                    batch_size: int = MIGRATE_BATCH) -> str:
+    """按新的存储档位（见 collection_profiles.py）重建线上 collection，不重新编码。
+
+    新版本按 profile 建库（是否带 colbert 多向量随线上版本），scroll 读回线上版本的
+    全部向量和 payload 原样写入；线上版本缺少 bm25 向量时按 payload 补算。之后与
+    --rebuild 相同：校验点数和 golden 命中 → 原子切换 alias → 回收旧版本。
+    返回新 collection 名。迁移期间对线上版本的写入不会进入新版本，应避免并发索引。
+    """
+    collection_profiles.get_profile(profile)  # 档位名写错时在建库前报错
+    client = get_qdrant()
+    live = live_collection(client)
+    if live is None:
+        log.error(f"❌ {COLLECTION} 不存在，没有可迁移的向量")
+        raise RuntimeError(f"{COLLECTION} 不存在")
+    target = _new_version(client)
+    old = collection_profiles.collection_profile(client, live) or "default"
+    log.info(f"档位迁移: {live}（{old}）→ {target}（{profile}）")
+    with_colbert = colbert.has_colbert(client, live)
+    ensure_collection(client, target, profile=profile, with_colbert=with_colbert)
+    if with_colbert:
+        batch_size = min(batch_size, colbert.upsert_batch_size())
+
+    copied = 0
+    offset = None
+    while True:
+        records, offset = client.scroll(collection_name=live, limit=batch_size, offset=offset,
+                                        with_payload=True, with_vectors=True)
+        points = []
+        for r in records:
+            vector = dict(r.vector)
+            if bm25.VECTOR_NAME not in vector:
+                vector[bm25.VECTOR_NAME] = bm25.payload_vector(r.payload or {})
+            points.append(models.PointStruct(id=r.id, vector=vector, payload=r.payload))
+        if points:
+            _with_retries(lambda: client.upsert(collection_name=target, points=points,
+                                                wait=False), "upsert")
+            copied += len(points)
+        if offset is None:
+            break
+    _consistency_barrier(client, target)
+    if not has_path_fields(client, live):
+        # 原样复制的旧 payload 缺少路径字段，切换前回填
+        migrate_payload(client, target)
+    bump_index_version(client, target)
+    log.info(f"  复制 {copied} 个 points（未重新编码）")
+    _promote(client, target, live, copied, smoke, keep)
+    return target
+
 
-    log.info(f"✅ 增量索引完成: {len(all_changed)} 文件, {total_chunks} chunks")
+# ── payload 迁移 ──────────────────────────────────────────────────
+
+def migrate_payload(client: QdrantClient, collection: Optional[str] = None,
+                    batch_size: int = 1000) -> int:
+    """为旧 collection 补建 payload 索引，并给缺少结构化路径字段的 points 回填。
+
+    只改 payload（set_payload），不重新编码、不传向量。返回回填的 point 数。
+    """
+    collection = collection or COLLECTION
+    ensure_payload_indexes(client, collection)
+    updated = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["path", "scope", "tags"],
+            with_vectors=False,
+        )
+        by_payload: dict[str, tuple[dict, list]] = {}
+        for p in points:
+            payload = p.payload or {}
+            tags = payload.get("tags")
+            if "scope" in payload and (tags is None or isinstance(tags, list)):
+                continue
+            fields = path_fields(payload.get("path", ""))
+            if tags is not None:
+                fields["tags"] = _normalize_tags(tags)
+            key = json.dumps(fields, sort_keys=True)
+            by_payload.setdefault(key, (fields, []))[1].append(p.id)
+        for fields, ids in by_payload.values():
+            client.set_payload(collection_name=collection, payload=fields, points=ids, wait=False)
+            updated += len(ids)
+        if offset is None:
+            break
+    _consistency_barrier(client, collection)
+    try:
+        client.update_collection(collection, metadata={PATH_FIELDS_FLAG: True})
+    except Exception as e:
+        log.debug(f"写入 {PATH_FIELDS_FLAG} 标记失败: {e}")
+    if updated:
+        bump_index_version(client, collection)
+    log.info(f"✅ payload 迁移完成: 回填 {updated} 个 points")
+    return updated
 
 
 # ── 状态 ──────────────────────────────────────────────────────────
@@ -520,7 +1636,8 @@ def show_status() -> None:
     client = get_qdrant()
     try:
         info = client.get_collection(COLLECTION)
-        log.info(f"Collection: {COLLECTION}")
+        target = resolve_alias(client, COLLECTION)
+        log.info(f"Collection: {COLLECTION}" + (f" (alias → {target})" if target else ""))
         log.info(f"  向量数: {info.points_count}")
         log.info(f"  状态: {info.status}")
 
@@ -553,50 +1670,73 @@ def show_status() -> None:
 
 
 def drop_collection() -> None:
-    """删除整个 collection。"""
+    """删除整个 collection（COLLECTION 是 alias 时连同 alias 和它指向的 collection）。"""
     client = get_qdrant()
     try:
+        target = resolve_alias(client, COLLECTION)
+        if target is not None:
+            client.update_collection_aliases(change_aliases_operations=[
+                models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=COLLECTION))])
+            client.delete_collection(target)
+            log.info(f"✅ 已删除 alias {COLLECTION} 和 collection: {target}")
+            return
         client.delete_collection(COLLECTION)
         log.info(f"✅ 已删除 collection: {COLLECTION}")
     except Exception:
         log.info(f"Collection '{COLLECTION}' 不存在，无需删除")
 
 
-def snapshot_export(output_path: str) -> None:
-    """导出 Qdrant collection 快照到指定路径。"""
-    import shutil
-    import tempfile
-    import urllib.request
+def _require_qdrant_snapshots() -> None:
+    """快照走 Qdrant 的快照接口，numpy 后端没有：给出替代办法后退出。"""
+    if VECTOR_BACKEND == "numpy":
+        log.error("❌ VECTOR_BACKEND=numpy 不支持快照，备份 / 恢复直接复制 NUMPY_BACKEND_PATH 目录")
+        sys.exit(1)
 
-    client = get_qdrant()
-    snapshot_info = client.create_snapshot(COLLECTION)
-    snapshot_name = snapshot_info.name
 
-    # 通过 HTTP 下载快照文件
-    url = f"{QDRANT_URL}/collections/{COLLECTION}/snapshots/{snapshot_name}"
+def snapshot_export(output_path: str) -> None:
+    """导出 Qdrant collection 快照到指定路径（流式下载、断点续传、写 SHA-256 清单）。"""
+    _require_qdrant_snapshots()
+    client = get_qdrant()
+    collection = live_collection(client) or COLLECTION  # 快照接口需要实体 collection 名
     out = Path(output_path)
-    out.parent.mkdir(parents=True, exist_ok=True)
-
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp_path = tmp.name
-    try:
-        urllib.request.urlretrieve(url, tmp_path)
-        shutil.move(tmp_path, str(out))
-    except Exception:
-        Path(tmp_path).unlink(missing_ok=True)
-        raise
 
-    size_mb = out.stat().st_size / (1024 * 1024)
-    log.info(f"✅ 快照已导出: {out} ({size_mb:.1f} MB)")
+    # 上次下载中断且服务端快照还在时，复用同一个快照续传
+    state = load_resume_state(out)
+    snapshot_name = None
+    if state and state.get("collection") == collection:
+        names = {s.name for s in client.list_snapshots(collection)}
+        if state.get("snapshot") in names:
+            snapshot_name = state["snapshot"]
+            log.info(f"续传未完成的快照下载: {snapshot_name}")
+    if snapshot_name is None:
+        snapshot_name = client.create_snapshot(collection).name
+
+    url = f"{QDRANT_URL}/collections/{collection}/snapshots/{snapshot_name}"
+    manifest = download_snapshot(url, out, collection=collection, snapshot=snapshot_name)
+    log.info(f"✅ 快照已导出: {out} ({manifest['size'] / (1024 * 1024):.1f} MB, "
+             f"sha256 {manifest['sha256'][:12]}…)")
 
     # 清理服务端快照
-    client.delete_snapshot(COLLECTION, snapshot_name)
+    client.delete_snapshot(collection, snapshot_name)
 
 
-def snapshot_import(snapshot_path: str) -> None:
-    """从快照文件恢复 Qdrant collection。"""
-    import urllib.request
+def snapshot_verify(snapshot_path: str) -> None:
+    """按 SHA-256 清单校验快照文件。"""
+    snap = Path(snapshot_path)
+    try:
+        digest = verify_snapshot(snap)
+    except (OSError, ValueError) as e:
+        log.error(f"❌ {e}")
+        sys.exit(1)
+    if digest is None:
+        log.error(f"❌ 缺少清单: {manifest_path(snap)}")
+        sys.exit(1)
+    log.info(f"✅ 快照校验通过: {snap} (sha256 {digest[:12]}…)")
+
 
+def snapshot_import(snapshot_path: str) -> None:
+    """从快照文件恢复 Qdrant collection（先按清单校验，再流式上传）。"""
+    _require_qdrant_snapshots()
     snap = Path(snapshot_path)
     if not snap.exists():
         log.error(f"快照文件不存在: {snap}")
@@ -604,29 +1744,19 @@ def snapshot_import(snapshot_path: str) -> None:
 
     size_mb = snap.stat().st_size / (1024 * 1024)
     log.info(f"正在恢复快照: {snap} ({size_mb:.1f} MB)")
+    try:
+        checksum = verify_snapshot(snap)
+    except ValueError as e:
+        log.error(f"❌ {e}")
+        sys.exit(1)
+    if checksum is None:
+        log.info(f"  未找到清单 {manifest_path(snap).name}，跳过校验")
 
-    # 使用 Qdrant REST API 上传快照恢复
-    url = f"{QDRANT_URL}/collections/{COLLECTION}/snapshots/upload"
-    boundary = "----SnapshotBoundary"
-    filename = snap.name
-
-    with open(str(snap), "rb") as f:
-        file_data = f.read()
-
-    body = (
-        f"--{boundary}\r\n"
-        f'Content-Disposition: form-data; name="snapshot"; filename="{filename}"\r\n'
-        f"Content-Type: application/octet-stream\r\n\r\n"
-    ).encode() + file_data + f"\r\n--{boundary}--\r\n".encode()
-
-    req = urllib.request.Request(
-        url,
-        data=body,
-        method="POST",
-        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
-    )
-    urllib.request.urlopen(req)
-    log.info(f"✅ 快照已恢复到 collection: {COLLECTION}")
+    # COLLECTION 是 alias 时恢复到它指向的 collection
+    collection = live_collection(get_qdrant()) or COLLECTION
+    url = f"{QDRANT_URL}/collections/{collection}/snapshots/upload"
+    upload_snapshot(url, snap, checksum=checksum)
+    log.info(f"✅ 快照已恢复到 collection: {collection}")
 
 
 # ── CLI ───────────────────────────────────────────────────────────
@@ -635,35 +1765,63 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="知识库索引工具")
     parser.add_argument("--file", help="索引单个 Markdown 文件")
     parser.add_argument("--full", metavar="DIR", nargs="+", help="全量重建指定目录（支持多个）")
+    parser.add_argument("--rebuild", metavar="DIR", nargs="+",
+                        help="蓝绿重建：写入新版本 collection，校验后原子切换 alias（零停机）")
+    parser.add_argument("--migrate-profile", metavar="PROFILE",
+                        choices=list(collection_profiles.PROFILES),
+                        help="按新的存储档位重建 collection（复制已有向量，不重新编码）")
+    parser.add_argument("--no-smoke", action="store_true",
+                        help="--rebuild / --migrate-profile 时跳过 golden 冒烟测试")
+    parser.add_argument("--keep", type=int, default=REBUILD_KEEP,
+                        help="--rebuild / --migrate-profile 后保留的旧版本数"
+                             "（用于回滚，默认 INDEX_REBUILD_KEEP）")
     parser.add_argument("--incremental", action="store_true", help="增量更新（基于 git diff）")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略 chunk 内容指纹，全部重新编码（更换 embedding 模型后使用）")
     parser.add_argument("--delete", action="store_true", help="删除文档")
     parser.add_argument("--doc-id", help="要删除的 doc_id")
     parser.add_argument("--delete-by-repo", metavar="REPO_URL", help="按 source_repo 批量删除某仓库的所有 chunks")
     parser.add_argument("--drop", action="store_true", help="删除整个 collection（清空索引）")
     parser.add_argument("--status", action="store_true", help="查看索引状态")
+    parser.add_argument("--migrate-payload", action="store_true",
+                        help="为已有 collection 补建 payload 索引并回填路径字段（不重新编码）")
     parser.add_argument("--snapshot-export", metavar="PATH", help="导出 collection 快照到指定路径")
     parser.add_argument("--snapshot-import", metavar="PATH", help="从快照文件恢复 collection")
+    parser.add_argument("--snapshot-verify", metavar="PATH", help="按 SHA-256 清单校验快照文件")
     args = parser.parse_args()
 
     if args.snapshot_export:
         snapshot_export(args.snapshot_export)
     elif args.snapshot_import:
         snapshot_import(args.snapshot_import)
+    elif args.snapshot_verify:
+        snapshot_verify(args.snapshot_verify)
     elif args.drop:
         drop_collection()
     elif args.status:
         show_status()
+    elif args.migrate_payload:
+        migrate_payload(get_qdrant())
     elif args.delete_by_repo:
         delete_by_source_repo(args.delete_by_repo)
     elif args.delete and args.doc_id:
         delete_doc(args.doc_id)
     elif args.file:
-        index_file(args.file)
+        index_file(args.file, force=args.force)
+    elif args.migrate_profile:
+        try:
+            migrate_profile(args.migrate_profile, smoke=not args.no_smoke, keep=args.keep)
+        except RuntimeError:
+            sys.exit(1)
+    elif args.rebuild:
+        try:
+            index_rebuild(args.rebuild, force=args.force, smoke=not args.no_smoke, keep=args.keep)
+        except RuntimeError:
+            sys.exit(1)
     elif args.full:
-        for d in args.full:
-            index_full(d)
+        index_full(args.full, force=args.force)
     elif args.incremental:
-        index_incremental()
+        index_incremental(force=args.force)
     else:
         # 从 stdin 读取 chunks JSON
         data = sys.stdin.read().strip()
@@ -4,183 +4,467 @@
 提供向量检索能力，通过 MCP 协议供 Claude Code 调用。
 这是项目中唯一需要常驻的服务（BGE-M3 模型 + Qdrant 连接）。
 
-启动: python scripts/mcp_server.py
-"""
+启动: python scripts/mcp_server.py             # stdio，每个 Agent 会话一个进程
+      python scripts/mcp_server.py --daemon    # 本机常驻 daemon（streamable HTTP）
+
+daemon 模式下多个会话共享同一份模型和结果缓存，会话侧通过 mcp_shim.py
+（stdio → HTTP 转发）或直接用 HTTP 配置连接，见 mcp_shim.py。GET /daemon 返回
+pid、代码版本和检索配置，shim 据此拒绝复用配置不一致的 daemon。
+
+  MCP_DAEMON_HOST=127.0.0.1 MCP_DAEMON_PORT=8765
+
+每次 hybrid_search 记录分阶段耗时和 Qdrant 往返次数（见 search_metrics.py），
+search_metrics 工具返回滚动 p50/p95/p99；include_timings=True 时在结果末尾附加本次耗时。
+
+检索本身是一次 query_points：dense / sparse / bm25 各路 prefetch + RRF 融合（+ 可选
+重打分）由 query_plan.QueryPlan 编译成嵌套查询，在 Qdrant 服务端完成。
 
-import json
-import logging
-import os
+  HYBRID_SIGNALS=dense,sparse,bm25   # 参与 RRF 的召回信号
+  HYBRID_RESCORE=                    # dense = 融合候选按 dense 余弦重排；colbert = 按 BGE-M3
+                                     # ColBERT 多向量 MaxSim 重排（COLBERT_VECTORS=1 时默认）
+  RERANKER_MODEL=none                # 不加载 cross-encoder，直接按检索分数排序
 
-from FlagEmbedding import FlagReranker
-from mcp.server.fastmcp import FastMCP
-from qdrant_client import QdrantClient, models
+ColBERT 重排与 dense / sparse 来自同一次 BGE-M3 前向计算，配合 RERANKER_MODEL=none
+常驻内存的只有一个模型，查询路径上没有第二次前向计算（见 colbert.py）。
 
-from embedding_provider import EmbeddingProvider, get_embedding_provider
+冷启动：torch / FlagEmbedding 等重量级依赖只在加载模型时导入。作为 MCP 进程启动后
+立即在后台线程预热 embedding 模型和 reranker（如启用），期间 keyword_search / index_status
+照常响应，hybrid_search 最多等待 SEARCH_READY_TIMEOUT 秒。index_status 返回
+readiness 状态和各启动阶段耗时。
+
+  MCP_WARMUP=1              # 0 关闭后台预热（首次 hybrid_search 时同步加载）
+  SEARCH_READY_TIMEOUT=20   # 预热期间 hybrid_search 的最长等待秒数
+"""
+
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import argparse  # noqa: E402
+import functools  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import threading  # noqa: E402
+from typing import Optional  # noqa: E402
+
+import anyio  # noqa: E402
+from mcp.server.fastmcp import FastMCP  # noqa: E402
+from qdrant_client import QdrantClient, models  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import bm25  # noqa: E402
+import colbert  # noqa: E402
+import collection_profiles  # noqa: E402
+from embedding_provider import EmbeddingProvider, get_embedding_provider  # noqa: E402
+from mcp_shim import DAEMON_INFO_PATH, daemon_identity  # noqa: E402
+from qdrant_pool import get_qdrant_client  # noqa: E402
+from query_plan import QueryPlan  # noqa: E402
+from rerank import RERANK_BUDGET_MS, adaptive_rerank  # noqa: E402
+from search_cache import TTLCache, normalize_query  # noqa: E402
+from search_metrics import SearchMetrics, StageTimer  # noqa: E402
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger(__name__)
 
-QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION = os.environ.get("COLLECTION_NAME", "knowledge-base")
 RERANKER_NAME = os.environ.get("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANK_ENABLED = RERANKER_NAME.lower() != "none"
+
+# 两级缓存：查询向量 + 最终结果（见 search_cache.py）
+SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE", "1") != "0"
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "600"))
+# collection 版本（points_count + index_version）最多每隔这么多秒查一次
+VERSION_CHECK_SEC = float(os.environ.get("SEARCH_CACHE_VERSION_CHECK_SEC", "5"))
+MCP_WARMUP = os.environ.get("MCP_WARMUP", "1") != "0"
+SEARCH_READY_TIMEOUT = float(os.environ.get("SEARCH_READY_TIMEOUT", "20"))
+MCP_DAEMON_HOST = os.environ.get("MCP_DAEMON_HOST", "127.0.0.1")
+MCP_DAEMON_PORT = int(os.environ.get("MCP_DAEMON_PORT", "8765"))
+# hybrid_search 的召回信号（dense 总是启用；sparse 需要 bge-m3，bm25 需要带 bm25 向量的
+# collection）和融合后的重打分（dense = 按 dense 余弦重排融合候选；colbert = 按 MaxSim 重排，
+# 需要带 colbert 多向量的 collection；空 = 直接用 RRF 分数）
+HYBRID_SIGNALS = {
+    s.strip() for s in os.environ.get("HYBRID_SIGNALS", "dense,sparse,bm25").split(",")
+}
+HYBRID_RESCORE = os.environ.get("HYBRID_RESCORE",
+                                "colbert" if colbert.COLBERT_ENABLED else "")
 
 # 初始化
-mcp = FastMCP("knowledge-base")
+mcp = FastMCP("knowledge-base", host=MCP_DAEMON_HOST, port=MCP_DAEMON_PORT)
 _provider = None
 _reranker = None
 _qdrant = None
+_query_cache = TTLCache(
+    int(os.environ.get("QUERY_CACHE_SIZE", "4096")) if SEARCH_CACHE_ENABLED else 0,
+    SEARCH_CACHE_TTL,
+)
+_result_cache = TTLCache(
+    int(os.environ.get("RESULT_CACHE_SIZE", "1024")) if SEARCH_CACHE_ENABLED else 0,
+    SEARCH_CACHE_TTL,
+)
+# index.py 写入的 collection metadata 标记：全部 points 都带 path_segments / scope
+PATH_FIELDS_FLAG = "path_fields"
+_collection_version = None
+_version_checked_at = 0.0
+_has_bm25 = False  # COLLECTION 是否带 bm25 向量，由 collection_version 更新
+_has_colbert = False  # 同上，colbert 多向量
+_search_params = None  # 同上，按 collection 存储档位的 dense 量化检索参数
+_has_path_segments = False  # 同上，points 是否都带 path_segments（见 path_segments_ready）
+_metrics = SearchMetrics()
+# 模型加载锁：预热线程和请求线程不会重复加载
+_provider_lock = threading.Lock()
+_reranker_lock = threading.Lock()
+
+# 启动状态：cold（未预热）→ warming → ready / error
+_startup = {"state": "cold", "error": "", "phases_ms": {}}
+_ready = threading.Event()
+
+
+def _record_phase(name: str) -> None:
+    """记录从进程启动到该阶段完成的耗时（毫秒）。"""
+    _startup["phases_ms"][name] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+
+
+_record_phase("imports")
 
 
 def get_provider() -> EmbeddingProvider:
     """延迟加载 embedding provider。"""
     global _provider
     if _provider is None:
-        _provider = get_embedding_provider()
+        with _provider_lock:
+            if _provider is None:
+                _provider = get_embedding_provider()
     return _provider
 
 
 def get_reranker():
     global _reranker
     if _reranker is None:
-        log.info(f"加载 reranker 模型: {RERANKER_NAME}")
-        _reranker = FlagReranker(RERANKER_NAME, use_fp16=True)
+        with _reranker_lock:
+            if _reranker is None:
+                log.info(f"加载 reranker 模型: {RERANKER_NAME}")
+                if os.environ.get("EMBEDDING_PROVIDER", "local") == "onnx":
+                    from onnx_backend import OnnxReranker
+                    _reranker = OnnxReranker(RERANKER_NAME)
+                else:
+                    from FlagEmbedding import FlagReranker
+                    _reranker = FlagReranker(RERANKER_NAME, use_fp16=True)
     return _reranker
 
 
+def warm_up() -> None:
+    """加载并预热 embedding 模型和 reranker（RERANKER_MODEL=none 时跳过），逐阶段记录耗时。"""
+    _startup["state"] = "warming"
+    try:
+        get_qdrant()
+        _record_phase("qdrant_client")
+        provider = get_provider()
+        _record_phase("embedding_model")
+        provider.encode_query("warm up")
+        _record_phase("embedding_warm")
+        if RERANK_ENABLED:
+            reranker = get_reranker()
+            _record_phase("reranker_model")
+            reranker.compute_score([("warm up", "warm up")])
+            _record_phase("reranker_warm")
+        _startup["state"] = "ready"
+        log.info(f"✅ 模型预热完成: {_startup['phases_ms']}")
+    except Exception as e:
+        _startup["state"] = "error"
+        _startup["error"] = str(e)
+        log.error(f"模型预热失败: {e}")
+    finally:
+        _ready.set()
+
+
+def start_warm_up() -> None:
+    threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
+
+
+def readiness() -> dict:
+    return {
+        "state": _startup["state"],
+        "error": _startup["error"],
+        "phases_ms": dict(_startup["phases_ms"]),
+    }
+
+
+def tool(fn):
+    """注册 MCP 工具：在线程池中执行同步实现，不阻塞事件循环。
+
+    daemon 模式下多个会话的请求因此可以并发（模型推理释放 GIL），
+    预热期间等待模型的 hybrid_search 也不会卡住 keyword_search。
+    返回原函数，进程内调用（simple_rag_worker、测试）不受影响。
+    """
+    @functools.wraps(fn)
+    async def run_in_thread(*args, **kwargs):
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+
+    mcp.tool()(run_in_thread)
+    return fn
+
+
 def get_qdrant():
     global _qdrant
     if _qdrant is None:
-        _qdrant = QdrantClient(url=QDRANT_URL)
+        _qdrant = get_qdrant_client()
     return _qdrant
 
 
-@mcp.tool()
+def encode_query(query: str) -> dict:
+    """编码查询，命中查询向量缓存时跳过模型。"""
+    key = normalize_query(query)
+    q = _query_cache.get(key)
+    if q is None:
+        q = get_provider().encode_query(key)
+        _query_cache.put(key, q)
+    return q
+
+
+def collection_version(client: QdrantClient, timer: Optional[StageTimer] = None):
+    """返回 (points_count, index_version)，变化时清空结果缓存。查询失败返回 None。
+
+    index_version 由 index.py 每次写入/删除后写进 collection metadata。同一次
+    get_collection 顺带记录 collection 是否带 bm25 词法向量 / colbert 多向量
+    （见 bm25_ready / colbert_ready）、payload 是否已迁移（见 path_segments_ready）和
+    存储档位对应的量化检索参数。
+    """
+    global _collection_version, _version_checked_at, _has_bm25, _has_colbert, _search_params
+    global _has_path_segments
+    now = time.monotonic()
+    if _collection_version is not None and now - _version_checked_at < VERSION_CHECK_SEC:
+        return _collection_version
+    if timer is not None:
+        timer.round_trips += 1
+    try:
+        info = client.get_collection(COLLECTION)
+    except Exception:
+        return None
+    _has_bm25 = bm25.VECTOR_NAME in (info.config.params.sparse_vectors or {})
+    _has_colbert = colbert.VECTOR_NAME in (info.config.params.vectors or {})
+    metadata = getattr(info.config, "metadata", None) or {}
+    _search_params = collection_profiles.search_params(metadata.get("profile"))
+    _has_path_segments = bool(metadata.get(PATH_FIELDS_FLAG))
+    version = (info.points_count, metadata.get("index_version", ""))
+    if version != _collection_version:
+        if _collection_version is not None:
+            log.info(f"collection 版本变化 {_collection_version} → {version}，清空结果缓存")
+        if not _has_path_segments and info.points_count:
+            log.warning(f"collection {COLLECTION} 未完成 payload 迁移，scope 过滤退回 path "
+                        f"全文匹配；运行 index.py --migrate-payload 后走 path_segments 索引")
+        _result_cache.clear()
+        _collection_version = version
+    _version_checked_at = now
+    return version
+
+
+def bm25_ready(client: QdrantClient, timer: Optional[StageTimer] = None) -> bool:
+    """COLLECTION 是否带 bm25 词法向量（随 collection_version 每 VERSION_CHECK_SEC 秒刷新，
+    蓝绿切换后可能变化）。
+
+    建库早于 bm25 的 collection 需 index.py --rebuild 后才有，此前退回 MatchText 全文过滤。
+    """
+    collection_version(client, timer)
+    return _has_bm25
+
+
+def colbert_ready(client: QdrantClient, timer: Optional[StageTimer] = None) -> bool:
+    """COLLECTION 是否带 colbert 多向量（COLBERT_VECTORS=1 建库或 --rebuild 后才有）。"""
+    collection_version(client, timer)
+    return _has_colbert
+
+
+def path_segments_ready(client: QdrantClient, timer: Optional[StageTimer] = None) -> bool:
+    """COLLECTION 的全部 points 是否都带 path_segments（随 collection_version 刷新）。
+
+    以 collection metadata 中的 PATH_FIELDS_FLAG 为准（新建 collection 或 --migrate-payload
+    后写入）。path_segments 索引不能作为依据：旧 collection 上 index.py --file /
+    --incremental 会补建索引，而未重新索引的旧 points 仍没有该字段。
+    """
+    collection_version(client, timer)
+    return _has_path_segments
+
+
+def scope_filter(scope: str, indexed: bool = True):
+    """scope → 走 path_segments keyword 索引的精确匹配过滤条件（index.py 写入该字段）。
+
+    单级 scope（runbook）只需一个索引条件；多级（concepts/workloads/pods）对每级
+    目录名各加一个索引条件，再用 path 上的 MatchPhrase 检查各级相邻且有序（path 无
+    全文索引时按单词切分比对），只在索引筛出的候选上执行。
+    indexed=False（旧 collection 没有 path_segments，index.py --migrate-payload 前）
+    退回 path 上的 MatchText("/scope/") 全文过滤。
+    """
+    segments = [s for s in scope.replace("\\", "/").split("/") if s and s != "."]
+    if not segments:
+        return None
+    if not indexed:
+        return models.Filter(must=[models.FieldCondition(
+            key="path", match=models.MatchText(text=f"/{'/'.join(segments)}/"))])
+    must = [models.FieldCondition(key="path_segments", match=models.MatchValue(value=s))
+            for s in dict.fromkeys(segments)]
+    if len(segments) > 1:
+        must.append(models.FieldCondition(
+            key="path", match=models.MatchPhrase(phrase="/".join(segments))))
+    return models.Filter(must=must)
+
+
+@tool
 def hybrid_search(
     query: str,
     top_k: int = 5,
     min_score: float = 0.3,
     scope: str = "",
+    rerank_budget_ms: float = RERANK_BUDGET_MS,
+    rerank_candidates: int = 0,
+    include_timings: bool = False,
 ) -> str:
-    """混合检索：dense + sparse 向量检索 + RRF 融合 + rerank。
+    """混合检索：dense + sparse（外部 API 模式为 BM25）向量检索 + RRF 融合 + rerank。
 
     Args:
         query: 搜索查询
         top_k: 返回结果数
         min_score: 最低 rerank 得分
         scope: 限定目录范围，如 runbook/adr/api
+        rerank_budget_ms: rerank 时间预算（毫秒），0 表示不限
+        rerank_candidates: 最多 rerank 的候选数，0 表示 top_k * 3
+        include_timings: 在结果末尾附加本次各阶段耗时（[TIMINGS] 行，评测用）
+    """
+    timer = StageTimer()
+    result = _hybrid_search(query, top_k, min_score, scope, rerank_budget_ms,
+                            rerank_candidates, timer)
+    timings = timer.finish()
+    _metrics.record(timings, cache_hit=timer.cache_hit, round_trips=timer.round_trips,
+                    rerank=timer.rerank)
+    if include_timings:
+        result += "\n\n[TIMINGS] " + json.dumps(
+            {**timings, "cache_hit": timer.cache_hit, "round_trips": timer.round_trips,
+             "plan": timer.plan, "rerank": timer.rerank}, ensure_ascii=False)
+    return result
+
+
+def build_plan(client: QdrantClient, query: str, q: dict, limit: int,
+               filter_cond: Optional[models.Filter] = None,
+               timer: Optional[StageTimer] = None) -> QueryPlan:
+    """按 HYBRID_SIGNALS / HYBRID_RESCORE 和当前 collection 的能力组装检索计划。
+
+    - dense：总是启用
+    - sparse：bge-m3 的 lexical 权重（外部 API 模式下没有）
+    - bm25：BM25F 词法向量；旧 collection 没有时，外部 API 模式改用 MatchText 全文
+      过滤后的 dense 排序作为词法信号（同样在这一次查询内完成）
+    - 重打分：colbert 需要查询的多向量和带 colbert 多向量的 collection，缺一则不重打分
+    - 量化档位的 collection（见 collection_profiles.py）上 dense 检索带 oversampling + rescore
     """
-    model = get_provider()
-    reranker = get_reranker()
+    plan = QueryPlan(limit=limit, filter=filter_cond)
+    dense_vec, sparse_vec = q["dense_vec"], q["sparse_vec"]
+    collection_version(client, timer)
+    params = _search_params
+    plan.add("dense", dense_vec, "dense", params=params)
+    if sparse_vec is not None and "sparse" in HYBRID_SIGNALS:
+        plan.add("sparse", sparse_vec, "sparse")
+    if "bm25" in HYBRID_SIGNALS:
+        if bm25_ready(client, timer):
+            bm25_vec = bm25.query_vector(query)
+            if bm25_vec.indices:
+                plan.add("bm25", bm25_vec, bm25.VECTOR_NAME)
+        elif sparse_vec is None:
+            plan.add("text", dense_vec, "dense", params=params, filter=models.Filter(must=[
+                models.FieldCondition(key="text", match=models.MatchText(text=query)),
+            ]))
+    if HYBRID_RESCORE == "dense":
+        plan.rescore(dense_vec, "dense", params=params)
+    elif HYBRID_RESCORE == "colbert" and q.get("colbert_vec") and colbert_ready(client, timer):
+        plan.rescore(q["colbert_vec"], colbert.VECTOR_NAME)
+    return plan
+
+
+def _hybrid_search(query: str, top_k: int, min_score: float, scope: str,
+                   rerank_budget_ms: float, rerank_candidates: int, timer: StageTimer) -> str:
     client = get_qdrant()
 
+    # 结果缓存：collection 版本变化后自动失效
+    with timer.stage("cache"):
+        version = collection_version(client, timer)
+        cache_key = (normalize_query(query), top_k, min_score, scope,
+                     rerank_budget_ms, rerank_candidates, version)
+        cached = _result_cache.get(cache_key) if version is not None else None
+    if cached is not None:
+        timer.cache_hit = True
+        return cached
+
+    # 预热期间最多等待 SEARCH_READY_TIMEOUT 秒，超时提示 Agent 改用 keyword_search 或稍后重试
+    if _startup["state"] == "warming":
+        with timer.stage("wait_ready"):
+            ready = _ready.wait(SEARCH_READY_TIMEOUT)
+        if not ready:
+            return json.dumps({
+                "error": "模型正在加载，请稍后重试或先用 keyword_search",
+                "readiness": readiness(),
+            }, ensure_ascii=False)
+
     # 编码查询
-    q = model.encode_query(query)
-    dense_vec = q["dense_vec"]
-    sparse_vec = q["sparse_vec"]  # 可能为 None（外部 API 模式）
-
-    # 过滤条件
-    filter_cond = None
-    if scope:
-        filter_cond = models.Filter(must=[
-            models.FieldCondition(
-                key="path",
-                match=models.MatchText(text=f"/{scope}/"),
-            )
-        ])
+    with timer.stage("encode"):
+        q = encode_query(query)  # sparse_vec 可能为 None（外部 API 模式）
 
-    # Qdrant hybrid search — sparse_vec 为 None 时用 BM25 全文检索替代
+    # 检索计划：各路召回 + RRF 融合（+ 可选重打分）编译成一次 query_points
+    scoped = scope_filter(scope, path_segments_ready(client, timer)) if scope else None
+    plan = build_plan(client, query, q, top_k * 3, scoped, timer)
     try:
-        prefetch_list = [
-            models.Prefetch(
-                query=dense_vec, using="dense",
-                limit=20, filter=filter_cond,
-            ),
-        ]
-        if sparse_vec is not None:
-            prefetch_list.append(
-                models.Prefetch(
-                    query=sparse_vec, using="sparse",
-                    limit=20, filter=filter_cond,
-                ),
-            )
-
-        if len(prefetch_list) > 1:
-            # hybrid: dense + sparse → RRF 融合
-            results = client.query_points(
-                collection_name=COLLECTION,
-                prefetch=prefetch_list,
-                query=models.FusionQuery(fusion=models.Fusion.RRF),
-                limit=top_k * 3,
-            )
-        else:
-            # dense + BM25 全文检索 → RRF 融合
-            # Qdrant 的 MatchText 用 multilingual tokenizer 做 BM25-like 匹配
-            bm25_filter = models.Filter(must=[
-                models.FieldCondition(
-                    key="text",
-                    match=models.MatchText(text=query),
-                )
-            ])
-            if filter_cond and filter_cond.must:
-                bm25_filter.must.extend(filter_cond.must)
-
-            # 先用 BM25 拿候选，再和 dense 做 RRF
-            bm25_results = client.scroll(
-                collection_name=COLLECTION,
-                scroll_filter=bm25_filter,
-                limit=20,
-                with_vectors=False,
-            )
-            bm25_ids = [p.id for p in bm25_results[0]] if bm25_results[0] else []
-
-            if bm25_ids:
-                # 有 BM25 命中：用 dense prefetch + BM25 ID 过滤做 RRF
-                bm25_prefetch = models.Prefetch(
-                    query=dense_vec, using="dense",
-                    limit=20,
-                    filter=models.Filter(must=[
-                        models.HasIdCondition(has_id=bm25_ids),
-                    ]),
-                )
-                results = client.query_points(
-                    collection_name=COLLECTION,
-                    prefetch=[prefetch_list[0], bm25_prefetch],
-                    query=models.FusionQuery(fusion=models.Fusion.RRF),
-                    limit=top_k * 3,
-                )
-            else:
-                # BM25 无命中：降级为 dense-only
-                results = client.query_points(
-                    collection_name=COLLECTION,
-                    query=dense_vec,
-                    using="dense",
-                    limit=top_k * 3,
-                    query_filter=filter_cond,
-                )
+        with timer.stage("qdrant"):
+            timer.round_trips += 1
+            results = plan.run(client, COLLECTION)
     except Exception as e:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
+    timer.plan = plan.describe()
 
     if not results.points:
         return json.dumps([], ensure_ascii=False)
 
-    # Rerank — 拼接 title + text 提升短文档的匹配质量
+    # Rerank — 拼接 title + 最匹配段落，提升短文档的匹配质量
     # 注意：reranker 只做排序，不做过滤。最终判断权交给 Agent。
-    pairs = []
-    for p in results.points:
-        title = p.payload.get("title", "")
-        text = p.payload.get("text", "")
-        rerank_text = f"{title}\n{text}" if title else text
-        pairs.append((query, rerank_text))
-    scores = reranker.compute_score(pairs)
-    if isinstance(scores, (int, float)):
-        scores = [scores]
+    # 自适应：RRF 分差悬殊时跳过；否则按 RRF 顺序渐进打分，top_k 稳定或超预算即停。
+    # RERANKER_MODEL=none 时直接用检索分数（RRF 或 ColBERT MaxSim）。
+    points = results.points
+    if not RERANK_ENABLED:
+        with timer.stage("serialize"):
+            result = _format_results(points, [(i, p.score) for i, p in enumerate(points)],
+                                     top_k)
+        if version is not None:
+            _result_cache.put(cache_key, result)
+        return result
+
+    def score_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+        scores = get_reranker().compute_score(pairs)
+        return [scores] if isinstance(scores, (int, float)) else scores
+
+    with timer.stage("rerank"):
+        scored, timer.rerank = adaptive_rerank(
+            query,
+            texts=[p.payload.get("text", "") for p in points],
+            rrf_scores=[p.score for p in points],
+            score_fn=score_pairs,
+            top_k=top_k,
+            titles=[p.payload.get("title", "") for p in points],
+            max_candidates=rerank_candidates or None,
+            budget_ms=rerank_budget_ms,
+        )
+
+    with timer.stage("serialize"):
+        result = _format_results(points, scored, top_k)
+    if version is not None:
+        _result_cache.put(cache_key, result)
+    return result
 
+
+def _format_results(points, scored: list[tuple[int, float]], top_k: int) -> str:
+    """RRF top-N 保护排序 + 输出格式化（JSON + agentic hint）。"""
     # RRF top-N 保护：reranker 不够可靠（对短文档/标题匹配评分过低），
     # 保证 RRF 排名靠前的结果不会被 reranker 完全淹没。
     # 策略：RRF top-3 必定保留，其余按 rerank 分数排序，合并去重取 top_k。
+    # 未被打分的候选（渐进式提前停止）不参与排序。
     RRF_PROTECT = 3
-    indexed = list(zip(results.points, scores))
-    # RRF 顺序就是 results.points 的原始顺序
+    # scored 保持 RRF 顺序
+    indexed = [(points[i], score) for i, score in scored]
     rrf_top = indexed[:RRF_PROTECT]
     rest = indexed[RRF_PROTECT:]
     # 对剩余按 rerank 分数排序
@@ -234,13 +518,13 @@ def hybrid_search(
     hint = ("[SEARCH NOTE] 以上为文档片段（chunks），可能不完整。"
             "如果 chunk 内容不足以完整回答问题（缺少具体步骤、命令、配置、代码），"
             "请用 Read(path) 读取对应文件获取完整上下文，严禁用通用知识补充。")
-    result = json.dumps(output, ensure_ascii=False, indent=2)
-    return result + "\n\n" + hint
+    return json.dumps(output, ensure_ascii=False, indent=2) + "\n\n" + hint
 
 
-@mcp.tool()
+@tool
 def keyword_search(query: str, top_k: int = 10) -> str:
-    """关键词全文检索（Qdrant multilingual tokenizer）。
+    """关键词检索：BM25F 排序（title / section_path / text 加权，中文按二元组切分），
+    适合精确命令、配置项、报错信息，如 CONFIG SET maxmemory-policy。
 
     Args:
         query: 搜索关键词
@@ -249,47 +533,107 @@ def keyword_search(query: str, top_k: int = 10) -> str:
     client = get_qdrant()
 
     try:
-        results = client.scroll(
-            collection_name=COLLECTION,
-            scroll_filter=models.Filter(must=[
-                models.FieldCondition(
-                    key="text",
-                    match=models.MatchText(text=query),
-                )
-            ]),
-            limit=top_k,
-        )
+        if bm25_ready(client):
+            query_vec = bm25.query_vector(query)
+            if not query_vec.indices:
+                return json.dumps([], ensure_ascii=False)
+            points = client.query_points(
+                collection_name=COLLECTION,
+                query=query_vec,
+                using=bm25.VECTOR_NAME,
+                limit=top_k,
+            ).points
+        else:
+            # 旧 collection（无 bm25 向量）：全文过滤，按存储顺序返回
+            points, _ = client.scroll(
+                collection_name=COLLECTION,
+                scroll_filter=models.Filter(must=[
+                    models.FieldCondition(
+                        key="text",
+                        match=models.MatchText(text=query),
+                    )
+                ]),
+                limit=top_k,
+            )
     except Exception as e:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
     output = []
-    for point in results[0]:
-        output.append({
+    for point in points:
+        item = {
             "doc_id": point.payload.get("doc_id", ""),
             "chunk_id": point.payload.get("chunk_id", ""),
             "path": point.payload.get("path", ""),
             "title": point.payload.get("title", ""),
             "text": point.payload.get("text", "")[:500],
-        })
+        }
+        score = getattr(point, "score", None)  # 旧 collection 的 scroll 结果没有分数
+        output.append({"score": round(score, 4), **item} if score is not None else item)
 
     return json.dumps(output, ensure_ascii=False, indent=2)
 
 
-@mcp.tool()
+@tool
 def index_status() -> str:
     """查看索引状态：collection 信息、文档数、向量数。"""
     client = get_qdrant()
 
     try:
         info = client.get_collection(COLLECTION)
+        metadata = getattr(info.config, "metadata", None) or {}
         return json.dumps({
             "collection": COLLECTION,
             "points_count": info.points_count,
             "status": str(info.status),
+            "index_version": metadata.get("index_version", ""),
+            "readiness": readiness(),
+            "cache": {
+                "query_vectors": _query_cache.stats(),
+                "results": _result_cache.stats(),
+            },
         }, ensure_ascii=False, indent=2)
     except Exception as e:
-        return json.dumps({"error": str(e)}, ensure_ascii=False)
+        return json.dumps({"error": str(e), "readiness": readiness()}, ensure_ascii=False)
+
+
+@tool
+def search_metrics(reset: bool = False) -> str:
+    """hybrid_search 各阶段耗时的滚动 p50/p95/p99（毫秒），用于定位延迟回归。
+
+    Args:
+        reset: 返回当前统计后清空
+    """
+    summary = _metrics.summary()
+    if reset:
+        _metrics.reset()
+    return json.dumps(summary, ensure_ascii=False, indent=2)
+
+
+_DAEMON_IDENTITY = daemon_identity()
+
+
+@mcp.custom_route(DAEMON_INFO_PATH, methods=["GET"])
+async def daemon_info(request):
+    """daemon 身份：shim 复用前比对代码版本和配置，--stop-daemon 按 pid 停止。"""
+    return JSONResponse({"pid": os.getpid(), **_DAEMON_IDENTITY})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="知识库检索 MCP Server")
+    parser.add_argument("--daemon", action="store_true",
+                        help=f"以本机 daemon 运行（streamable HTTP，"
+                             f"{MCP_DAEMON_HOST}:{MCP_DAEMON_PORT}）")
+    args = parser.parse_args()
+
+    if MCP_WARMUP:
+        start_warm_up()
+    if args.daemon:
+        log.info(f"MCP daemon 监听 http://{MCP_DAEMON_HOST}:{MCP_DAEMON_PORT}"
+                 f"{mcp.settings.streamable_http_path}")
+        mcp.run(transport="streamable-http")
+    else:
+        mcp.run()
 
 
 if __name__ == "__main__":
-    mcp.run()
+    main()
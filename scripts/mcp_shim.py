@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""MCP stdio shim：把 Agent 会话的工具调用转发给本机常驻的 mcp_server daemon。
+
+每个 stdio mcp_server.py 进程都会加载一份 BGE-M3 + reranker（数 GB）。N 个并发会话
+改为每个会话启动一个只做转发的 shim，模型、结果缓存由 daemon 共享，并发度取决于
+CPU 而不是内存。daemon 未运行时 shim 会自动拉起（文件锁保证只启动一个）。
+
+用法:
+  python scripts/mcp_server.py --daemon     # 手动启动 daemon（可选）
+  python scripts/mcp_shim.py                # stdio MCP Server（会话侧使用）
+  python scripts/mcp_shim.py --ensure-daemon  # 只确保 daemon 已启动后退出
+  python scripts/mcp_shim.py --stop-daemon    # 停止 daemon
+
+会话配置统一用 mcp_servers_config() 生成，按 MCP_MODE 选择:
+  MCP_MODE=stdio   # 默认：每个会话独立的 mcp_server.py
+  MCP_MODE=shim    # stdio shim → 共享 daemon
+  MCP_MODE=http    # 会话直接用 HTTP 连接 daemon（客户端支持 http 类型时）
+
+daemon 是独立会话的常驻进程，拉起它的会话结束后也不会退出，需要显式停止
+（--stop-daemon / stop_daemon()）；评测脚本用 stop_spawned_daemons() 回收自己拉起的。
+
+daemon 使用拉起它的进程的环境。复用已有 daemon 前先请求 GET /daemon，比对代码
+版本（scripts/*.py 的指纹）和 DAEMON_CONFIG_KEYS 中影响检索结果的配置
+（QDRANT_URL、COLLECTION_NAME、模型等），不一致时拒绝连接并提示先停掉旧 daemon
+或换一个 MCP_DAEMON_PORT，而不是静默查询错误的 collection。
+
+环境变量:
+  MCP_DAEMON_HOST=127.0.0.1  MCP_DAEMON_PORT=8765
+  MCP_DAEMON_START_TIMEOUT=60   # 等待 daemon 端口就绪的秒数
+  MCP_DAEMON_LOG=...            # daemon 日志（默认 ~/.cache/knowledge-base-search/mcp-daemon.log）
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Mapping, Optional
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+MCP_MODE = os.environ.get("MCP_MODE", "stdio")
+MCP_DAEMON_HOST = os.environ.get("MCP_DAEMON_HOST", "127.0.0.1")
+MCP_DAEMON_PORT = int(os.environ.get("MCP_DAEMON_PORT", "8765"))
+MCP_DAEMON_START_TIMEOUT = float(os.environ.get("MCP_DAEMON_START_TIMEOUT", "60"))
+MCP_DAEMON_LOG = Path(os.environ.get(
+    "MCP_DAEMON_LOG", str(Path.home() / ".cache" / "knowledge-base-search" / "mcp-daemon.log")))
+
+# stdout 是 MCP 协议通道，日志只能写 stderr
+logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+log = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+DAEMON_INFO_PATH = "/daemon"
+# 影响检索结果的配置：shim 与 daemon 不一致时拒绝复用
+DAEMON_CONFIG_KEYS = (
+    "QDRANT_URL", "COLLECTION_NAME", "VECTOR_BACKEND", "NUMPY_BACKEND_PATH",
+    "EMBEDDING_PROVIDER", "EMBEDDING_MODEL", "EMBEDDING_BASE_URL", "BGE_M3_MODEL",
+    "RERANKER_MODEL", "HYBRID_SIGNALS", "HYBRID_RESCORE", "COLBERT_VECTORS",
+)
+
+# 本进程拉起的 daemon，见 stop_spawned_daemons
+_spawned: set[tuple[str, int]] = set()
+
+
+def daemon_url(host: str = MCP_DAEMON_HOST, port: int = MCP_DAEMON_PORT) -> str:
+    return f"http://{host}:{port}/mcp"
+
+
+def daemon_alive(host: str = MCP_DAEMON_HOST, port: int = MCP_DAEMON_PORT) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def code_version() -> str:
+    """scripts/*.py 的内容指纹：代码更新后旧 daemon 不会被继续复用。"""
+    digest = hashlib.sha256()
+    for path in sorted(SCRIPTS_DIR.glob("*.py")):
+        digest.update(path.name.encode() + b"\0" + path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def daemon_identity(env: Optional[Mapping[str, str]] = None) -> dict:
+    """daemon 的代码版本和检索配置（未设置的变量不列出，即取默认值）。"""
+    env = os.environ if env is None else env
+    return {"version": code_version(),
+            "config": {k: env[k] for k in DAEMON_CONFIG_KEYS if env.get(k)}}
+
+
+def daemon_info(host: str = MCP_DAEMON_HOST, port: int = MCP_DAEMON_PORT) -> Optional[dict]:
+    """GET /daemon → {"pid", "version", "config"}；端口上不是本项目的 daemon 时返回 None。"""
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}{DAEMON_INFO_PATH}",
+                                    timeout=2) as resp:
+            return json.loads(resp.read())
+    except (OSError, ValueError):
+        return None
+
+
+def check_daemon(host: str, port: int, expected: dict) -> None:
+    """daemon 的代码版本或检索配置与 expected 不一致时抛 RuntimeError。"""
+    info = daemon_info(host, port)
+    if info is None:
+        raise RuntimeError(f"{host}:{port} 上的服务不是 mcp_server daemon"
+                           f"（没有 {DAEMON_INFO_PATH}），换一个 MCP_DAEMON_PORT")
+    problems = []
+    if info.get("version") != expected["version"]:
+        problems.append(f"代码版本 {info.get('version')} ≠ {expected['version']}")
+    config = info.get("config") or {}
+    keys = sorted(k for k in set(config) | set(expected["config"])
+                  if config.get(k) != expected["config"].get(k))
+    if keys:
+        problems.append(f"配置不同: {', '.join(keys)}")
+    if problems:
+        raise RuntimeError(
+            f"{host}:{port} 上已有的 MCP daemon (pid {info.get('pid')}) 与本会话不一致："
+            f"{'; '.join(problems)}。先运行 python scripts/mcp_shim.py --stop-daemon，"
+            f"或为这组配置设置另一个 MCP_DAEMON_PORT")
+
+
+def ensure_daemon(host: str = MCP_DAEMON_HOST, port: int = MCP_DAEMON_PORT,
+                  timeout: float = MCP_DAEMON_START_TIMEOUT,
+                  python: Optional[str] = None,
+                  env: Optional[Mapping[str, str]] = None) -> str:
+    """确保与本会话配置一致的 daemon 在监听，必要时在后台启动。返回 daemon URL。
+
+    env 是会话额外设置的环境变量（叠加在 os.environ 上），daemon 按它启动和校验。
+    已有 daemon 的代码版本或配置不一致时抛 RuntimeError。
+    """
+    env = {**os.environ, **(env or {})}
+    expected = daemon_identity(env)
+    if daemon_alive(host, port):
+        check_daemon(host, port, expected)
+        return daemon_url(host, port)
+
+    MCP_DAEMON_LOG.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = MCP_DAEMON_LOG.with_suffix(".lock")
+    with open(lock_path, "w") as lock:
+        # 并发会话同时启动时只有持锁者拉起 daemon，其余等它就绪
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not daemon_alive(host, port):
+                env.update(MCP_DAEMON_HOST=host, MCP_DAEMON_PORT=str(port))
+                with open(MCP_DAEMON_LOG, "ab") as out:
+                    proc = subprocess.Popen(
+                        [python or sys.executable, str(SCRIPTS_DIR / "mcp_server.py"), "--daemon"],
+                        stdin=subprocess.DEVNULL, stdout=out, stderr=out,
+                        env=env, start_new_session=True,
+                    )
+                _spawned.add((host, port))
+                log.info(f"启动 MCP daemon (pid {proc.pid})，日志: {MCP_DAEMON_LOG}")
+                deadline = time.monotonic() + timeout
+                while not daemon_alive(host, port):
+                    if proc.poll() is not None:
+                        raise RuntimeError(
+                            f"MCP daemon 启动失败（exit {proc.returncode}），见 {MCP_DAEMON_LOG}")
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"MCP daemon {timeout:.0f}s 内未就绪，见 {MCP_DAEMON_LOG}")
+                    time.sleep(0.2)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    check_daemon(host, port, expected)
+    return daemon_url(host, port)
+
+
+def stop_daemon(host: str = MCP_DAEMON_HOST, port: int = MCP_DAEMON_PORT,
+                timeout: float = 10.0) -> bool:
+    """停止 host:port 上的 daemon（SIGTERM，超时后 SIGKILL）。没有 daemon 时返回 False。"""
+    info = daemon_info(host, port)
+    if info is None:
+        return False
+    pid = int(info["pid"])
+    try:
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while daemon_alive(host, port):
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                break
+            time.sleep(0.1)
+    except ProcessLookupError:
+        pass
+    _spawned.discard((host, port))
+    log.info(f"已停止 MCP daemon (pid {pid})")
+    return True
+
+
+def stop_spawned_daemons() -> None:
+    """停止本进程拉起的 daemon（评测 / 测试结束时调用，不动别人启动的 daemon）。"""
+    for host, port in list(_spawned):
+        stop_daemon(host, port)
+
+
+def mcp_servers_config(python: Optional[str] = None, env: Optional[dict] = None,
+                       mode: str = MCP_MODE) -> dict:
+    """生成 ClaudeAgentOptions.mcp_servers 中 knowledge-base 的配置。
+
+    http 模式会先确保 daemon 已启动（按 env 校验配置）；shim 模式由 shim 进程按需拉起。
+    """
+    python = python or sys.executable
+    if mode == "http":
+        return {"knowledge-base": {"type": "http",
+                                   "url": ensure_daemon(python=python, env=env)}}
+    script = "mcp_server.py" if mode == "stdio" else "mcp_shim.py"
+    config = {"command": python, "args": [str(SCRIPTS_DIR / script)]}
+    if env:
+        config["env"] = env
+    return {"knowledge-base": config}
+
+
+async def serve(url: str) -> None:
+    """stdio MCP Server，tools/list 和 tools/call 原样转发给 daemon。"""
+    from mcp import types
+    from mcp.client.session import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+    from mcp.server.lowlevel import Server
+    from mcp.server.stdio import stdio_server
+
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as upstream:
+            await upstream.initialize()
+            server = Server("knowledge-base")
+
+            @server.list_tools()
+            async def list_tools() -> list[types.Tool]:
+                return (await upstream.list_tools()).tools
+
+            @server.call_tool(validate_input=False)
+            async def call_tool(name: str, arguments: dict) -> types.CallToolResult:
+                return await upstream.call_tool(name, arguments)
+
+            async with stdio_server() as (stdin, stdout):
+                await server.run(stdin, stdout, server.create_initialization_options())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MCP stdio → daemon 转发")
+    parser.add_argument("--ensure-daemon", action="store_true", help="只确保 daemon 已启动")
+    parser.add_argument("--stop-daemon", action="store_true", help="停止 daemon 后退出")
+    args = parser.parse_args()
+
+    if args.stop_daemon:
+        if not stop_daemon():
+            log.info(f"{MCP_DAEMON_HOST}:{MCP_DAEMON_PORT} 上没有 MCP daemon")
+        return
+    try:
+        url = ensure_daemon()
+    except (RuntimeError, TimeoutError) as e:
+        log.error(f"❌ {e}")
+        sys.exit(1)
+    if args.ensure_daemon:
+        print(url)
+        return
+
+    import anyio
+    anyio.run(serve, url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1014 @@
+#!/usr/bin/env python3
+"""进程内 NumPy 向量后端：QdrantClient 接口子集，单 KB 小规模部署 / 测试 / 评测免 Qdrant。
+
+几十万 chunk 以内的知识库，一次 HTTP 往返加 JSON 浮点编解码比检索本身还贵。
+NumpyVectorClient 实现 index.py / mcp_server.py / eval_retrieval.py 用到的 QdrantClient
+方法（collection / alias / upsert / delete / scroll / count / retrieve / set_payload /
+query_points），qdrant_pool.get_qdrant_client() 在 VECTOR_BACKEND=numpy 时返回它，
+调用方不需要改动。
+
+存储（每个 collection 一个目录，只追加 + 墓碑，删除多了再整体压缩）:
+  dense-<name>.npy   dense 向量矩阵（float32 / float16，写入时已 L2 归一化），
+                     np.load(mmap_mode) 内存映射，容量不够时倍增重写
+  sparse-<name>.*    sparse 向量的 CSR：indptr(.npy) + indices / values(追加写的原始数组)
+  multi-<name>.*     多向量（MaxSim）：每行 token 区间 indptr(.npy) + 归一化后的 token 向量
+                     (.data，追加写的原始数组，内存映射，只在打分时读候选行)
+  payloads.jsonl     每行一个 {"id", "payload"}
+  alive.npy          行是否有效（upsert 同 id / set_payload 会追加新行并作废旧行）
+  meta.json          行数、各文件长度、向量配置、payload 索引、collection metadata，
+                     最后原子替换，作为提交点；其他进程据其 version 变化重新加载
+检索:
+  dense   分块矩阵乘 + argpartition top-k（float16 存储按块转 float32，全库扫描约慢 7 倍，
+          换一半的磁盘 / page cache 占用）
+  sparse  indices 按 token 排序的倒排视图，searchsorted 取 posting，bincount 累加打分
+  多向量  逐候选行 MaxSim（Σ_i max_j q_i·d_j），用于 prefetch 后的重打分（ColBERT）
+  融合    prefetch + FusionQuery(RRF) 按 Qdrant 的公式 1/(rank + 2) 融合；
+          prefetch + 向量查询 = 只在 prefetch 候选上重新打分
+  过滤    keyword / integer payload 索引字段的 MatchValue / MatchAny、HasId 用倒排直接
+          求候选，其余条件在候选上逐条用 qdrant_client 本地模式的 check_filter 判定，
+          语义与 Qdrant 一致
+
+写入：wait=False 的写只改内存和映射文件，wait=True 的操作（index.py 的一致性屏障）
+落盘提交。同一目录只允许一个写进程（flock）。不支持快照接口，备份直接复制目录。
+
+并发：读操作（query_points / count / scroll / retrieve / get_collection）共享读锁，
+MCP daemon 的多个工具线程可以同时检索（矩阵乘释放 GIL）；写操作独占。其他进程提交
+新版本时整个 _Collection 换成新对象，正在执行的读继续使用旧对象。
+
+环境变量:
+  VECTOR_BACKEND=qdrant          # numpy = 使用本后端（见 qdrant_pool.py）
+  NUMPY_BACKEND_PATH=~/.cache/knowledge-base-search/vectors
+  NUMPY_BACKEND_DTYPE=float32    # dense 向量存储精度：float32 / float16（省一半空间，检索更慢）
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterable, Optional, Union
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from qdrant_client import models
+from qdrant_client.http.models import QueryResponse  # models.QueryResponse 是 fastembed 的同名类
+from qdrant_client.local.payload_filters import check_filter
+
+NUMPY_BACKEND_PATH = os.path.expanduser(
+    os.environ.get("NUMPY_BACKEND_PATH", "~/.cache/knowledge-base-search/vectors"))
+NUMPY_BACKEND_DTYPE = os.environ.get("NUMPY_BACKEND_DTYPE", "float32")
+
+RRF_K = 2                 # 与 Qdrant 的 RRF 常数一致：score = Σ 1 / (rank + RRF_K)
+DENSE_BLOCK = 2048        # dense 打分每块行数（float16 转 float32 的临时块放得进 CPU 缓存）
+RELOAD_CHECK_SEC = 1.0    # 读进程检查 meta.json 变化的间隔
+COMPACT_RATIO = 0.5       # 墓碑占比超过此值时落盘前压缩
+
+_INDEXED_TYPES = {"keyword", "integer", "uuid"}
+
+
+def _normalize_id(pid) -> Union[str, int]:
+    if isinstance(pid, str):
+        return str(uuid.UUID(pid))
+    return int(pid)
+
+
+def _schema_name(field_schema) -> str:
+    if isinstance(field_schema, str):
+        return field_schema
+    value = getattr(field_schema, "value", None)
+    if isinstance(value, str):
+        return value
+    return getattr(getattr(field_schema, "type", None), "value", "text")
+
+
+def _select_payload(payload: dict, with_payload) -> Optional[dict]:
+    if with_payload is True:
+        return payload
+    if not with_payload:
+        return None
+    fields = (with_payload if isinstance(with_payload, list)
+              else getattr(with_payload, "include", []))
+    return {k: payload[k] for k in fields if k in payload}
+
+
+class _RWLock:
+    """读写锁：读并发、写独占，写者优先（等待中的写阻止新的读）。
+
+    写锁可重入，持有写锁的线程也可以再取读锁。读路径上的惰性整理（_concat、sparse
+    倒排视图）是幂等的，并发读重复计算得到相同结果。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+        self._waiting = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            nested = self._writer == me
+            if not nested:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class _Sparse:
+    """可追加的 CSR：行 i 的非零元是 indices/values[indptr[i]:indptr[i+1]]。"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray):
+        self.indptr = [indptr]
+        self.indices = [indices]
+        self.values = [values]
+        self._inverted = None
+
+    def _concat(self) -> None:
+        if len(self.indptr) > 1:
+            self.indptr = [np.concatenate(self.indptr)]
+            self.indices = [np.concatenate(self.indices)]
+            self.values = [np.concatenate(self.values)]
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1][-1])
+
+    def append(self, vectors: list) -> None:
+        lens = np.fromiter((len(v.indices) if v is not None else 0 for v in vectors),
+                           dtype=np.int64, count=len(vectors))
+        self.indptr.append(self.nnz + np.cumsum(lens))
+        self.indices.append(np.fromiter(
+            (i for v in vectors if v is not None for i in v.indices), dtype=np.int32,
+            count=int(lens.sum())))
+        self.values.append(np.fromiter(
+            (x for v in vectors if v is not None for x in v.values), dtype=np.float32,
+            count=int(lens.sum())))
+        self._inverted = None
+
+    def row(self, r: int) -> models.SparseVector:
+        self._concat()
+        lo, hi = self.indptr[0][r], self.indptr[0][r + 1]
+        return models.SparseVector(indices=self.indices[0][lo:hi].tolist(),
+                                   values=self.values[0][lo:hi].tolist())
+
+    def rows(self, rows: np.ndarray) -> list[models.SparseVector]:
+        return [self.row(int(r)) for r in rows]
+
+    def scores(self, query: models.SparseVector, n_rows: int,
+               alive: Optional[np.ndarray] = None) -> np.ndarray:
+        """点积打分；没有任何重叠 token 的行为 NaN（sparse 检索不返回它们）。
+
+        传入 alive 时按 Qdrant 的 IDF modifier 给查询权重乘 idf，N 与文档频率只统计有效行
+        （空向量也计入 N，与 Qdrant 一致）：idf = ln((N - df + 0.5) / (df + 0.5) + 1)。
+        """
+        self._concat()
+        if self._inverted is None:
+            order = np.argsort(self.indices[0], kind="stable")
+            row_of = np.repeat(np.arange(len(self.indptr[0]) - 1, dtype=np.int64),
+                               np.diff(self.indptr[0]))
+            self._inverted = (self.indices[0][order], row_of[order], self.values[0][order])
+        tokens, rows, vals = self._inverted
+        q_idx = np.asarray(query.indices, dtype=np.int32)
+        q_val = np.asarray(query.values, dtype=np.float32)
+        lo = np.searchsorted(tokens, q_idx, "left")
+        hi = np.searchsorted(tokens, q_idx, "right")
+        lens = hi - lo
+        if not lens.sum():
+            return np.full(n_rows, np.nan, dtype=np.float32)
+        # 把各 token 的 posting 区间展开成一个下标数组
+        starts = np.repeat(lo - np.concatenate([[0], np.cumsum(lens)[:-1]]), lens)
+        pos = starts + np.arange(lens.sum())
+        if alive is not None:
+            live = alive[rows[pos]]
+            df = np.bincount(np.repeat(np.arange(len(q_idx)), lens), weights=live,
+                             minlength=len(q_idx))
+            n_docs = np.count_nonzero(alive)
+            q_val = q_val * np.log((n_docs - df + 0.5) / (df + 0.5) + 1).astype(np.float32)
+        weights = vals[pos] * np.repeat(q_val, lens)
+        scores = np.bincount(rows[pos], weights=weights, minlength=n_rows)[:n_rows]
+        hit = np.bincount(rows[pos], minlength=n_rows)[:n_rows] > 0
+        return np.where(hit, scores, np.nan).astype(np.float32)
+
+
+class _Multi:
+    """可追加的多向量存储：行 i 的 token 向量是 data[indptr[i]:indptr[i+1]]（已 L2 归一化）。
+
+    已落盘的部分是内存映射的 base，新追加的留在内存（tail），flush 时追加写入文件。
+    """
+
+    def __init__(self, indptr: np.ndarray, base: np.ndarray):
+        self.indptr = [indptr]
+        self.base = base
+        self.tail: list[np.ndarray] = []
+
+    @property
+    def dim(self) -> int:
+        return self.base.shape[1]
+
+    @property
+    def n_tokens(self) -> int:
+        return int(self.indptr[-1][-1])
+
+    def _concat(self) -> None:
+        if len(self.indptr) > 1:
+            self.indptr = [np.concatenate(self.indptr)]
+        if len(self.tail) > 1:
+            self.tail = [np.concatenate(self.tail)]
+
+    def append(self, vectors: list) -> None:
+        mats = [np.asarray(v, dtype=np.float32).reshape(-1, self.dim) if v is not None
+                else np.zeros((0, self.dim), dtype=np.float32) for v in vectors]
+        lens = np.fromiter((len(m) for m in mats), dtype=np.int64, count=len(mats))
+        self.indptr.append(self.n_tokens + np.cumsum(lens))
+        if lens.sum():
+            data = np.concatenate(mats)
+            norms = np.linalg.norm(data, axis=1, keepdims=True)
+            self.tail.append((data / np.where(norms > 0, norms, 1)).astype(self.base.dtype))
+
+    def pending(self) -> np.ndarray:
+        """尚未写入文件的 token 向量。"""
+        self._concat()
+        return self.tail[0] if self.tail else np.zeros((0, self.dim), dtype=self.base.dtype)
+
+    def tokens(self, lo: int, hi: int) -> np.ndarray:
+        self._concat()
+        n_base = len(self.base)
+        if hi <= n_base:
+            return self.base[lo:hi]
+        tail = self.tail[0]
+        if lo >= n_base:
+            return tail[lo - n_base:hi - n_base]
+        return np.concatenate([self.base[lo:], tail[:hi - n_base]])
+
+    def rows(self, rows: np.ndarray) -> list[list]:
+        self._concat()
+        indptr = self.indptr[0]
+        return [np.asarray(self.tokens(indptr[r], indptr[r + 1]), dtype=np.float32).tolist()
+                for r in rows.tolist()]
+
+    def scores(self, query, rows: np.ndarray) -> np.ndarray:
+        """MaxSim：查询每个向量取与该行 token 向量的最大余弦，再求和。没有向量的行为 NaN。"""
+        q = np.asarray(query, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms > 0, norms, 1)
+        self._concat()
+        indptr = self.indptr[0]
+        out = np.full(len(rows), np.nan, dtype=np.float32)
+        for i, r in enumerate(rows.tolist()):
+            lo, hi = indptr[r], indptr[r + 1]
+            if hi > lo:
+                sims = q @ np.asarray(self.tokens(lo, hi), dtype=np.float32).T
+                out[i] = sims.max(axis=1).sum()
+        return out
+
+
+class _Collection:
+    """一个 collection 的内存状态 + 目录持久化。"""
+
+    def __init__(self, path: Path, writable_lock):
+        self.path = path
+        self._lock_writer = writable_lock
+        self.load()
+
+    # ── 加载 / 持久化 ──
+
+    def load(self) -> None:
+        meta = json.loads((self.path / "meta.json").read_text())
+        self.meta = meta
+        self.version = meta["version"]
+        self.rows = meta["rows"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.dense: dict[str, np.ndarray] = {}
+        self.writable = False
+        for name, cfg in meta["vectors"].items():
+            f = self.path / f"dense-{name}.npy"
+            self.dense[name] = np.load(f, mmap_mode="r") if f.exists() else np.zeros(
+                (0, cfg["size"]), dtype=self.dtype)
+        self.sparse: dict[str, _Sparse] = {}
+        for name in meta["sparse_vectors"]:
+            nnz = meta["sparse_nnz"].get(name, 0)
+            indptr_f = self.path / f"sparse-{name}.indptr.npy"
+            indptr = np.load(indptr_f)[:self.rows + 1] if indptr_f.exists() else np.zeros(
+                1, dtype=np.int64)
+            self.sparse[name] = _Sparse(
+                indptr,
+                np.fromfile(self.path / f"sparse-{name}.indices", dtype=np.int32, count=nnz)
+                if nnz else np.zeros(0, dtype=np.int32),
+                np.fromfile(self.path / f"sparse-{name}.values", dtype=np.float32, count=nnz)
+                if nnz else np.zeros(0, dtype=np.float32),
+            )
+        self.multi: dict[str, _Multi] = {}
+        for name, cfg in meta.get("multivectors", {}).items():
+            indptr_f = self.path / f"multi-{name}.indptr.npy"
+            indptr = np.load(indptr_f)[:self.rows + 1] if indptr_f.exists() else np.zeros(
+                1, dtype=np.int64)
+            tokens = meta.get("multi_tokens", {}).get(name, 0)
+            self.multi[name] = _Multi(indptr, self._map_multi(name, cfg["size"], tokens))
+        self.alive = np.zeros(self.rows, dtype=bool)
+        alive_f = self.path / "alive.npy"
+        if alive_f.exists():
+            saved = np.load(alive_f)
+            self.alive[:len(saved)] = saved[:self.rows]
+        self.ids: list = []
+        self.payloads: list[dict] = []
+        with open(self.path / "payloads.jsonl", "rb") as f:
+            data = f.read(meta["payload_bytes"])
+        for line in data.splitlines()[:self.rows]:
+            rec = json.loads(line)
+            self.ids.append(rec["id"])
+            self.payloads.append(rec["payload"])
+        self.id_to_row = {pid: r for r, pid in enumerate(self.ids) if self.alive[r]}
+        self._pending_payload: list[bytes] = []
+        self._flushed_rows = self.rows
+        self._flushed_nnz = dict(meta["sparse_nnz"])
+        self._flushed_tokens = dict(meta.get("multi_tokens", {}))
+        self._build_field_indexes()
+        self._mtime = (self.path / "meta.json").stat().st_mtime_ns
+
+    def _map_multi(self, name: str, dim: int, tokens: int) -> np.ndarray:
+        """多向量数据文件中已提交的前 tokens 行（只读内存映射）。"""
+        if not tokens:
+            return np.zeros((0, dim), dtype=self.dtype)
+        return np.memmap(self.path / f"multi-{name}.data", dtype=self.dtype, mode="r",
+                         shape=(tokens, dim))
+
+    def _build_field_indexes(self) -> None:
+        self.field_index: dict[str, dict] = {
+            f: {} for f, t in self.meta["payload_schema"].items() if t in _INDEXED_TYPES}
+        for r in range(self.rows):
+            if self.alive[r]:
+                self._index_row(r)
+
+    def _index_row(self, r: int) -> None:
+        payload = self.payloads[r]
+        for field, idx in self.field_index.items():
+            value = payload.get(field)
+            for v in value if isinstance(value, list) else [value]:
+                if v is not None:
+                    idx.setdefault(v, []).append(r)
+
+    def _make_writable(self) -> None:
+        if self.writable:
+            return
+        self._lock_writer()
+        for name, cfg in self.meta["vectors"].items():
+            f = self.path / f"dense-{name}.npy"
+            if f.exists():
+                self.dense[name] = np.load(f, mmap_mode="r+")
+            else:
+                self.dense[name] = open_memmap(f, mode="w+", dtype=self.dtype,
+                                               shape=(1024, cfg["size"]))
+        # 截掉上次崩溃时已追加但未提交的数据
+        for name in self.sparse:
+            nnz = self.meta["sparse_nnz"].get(name, 0)
+            for suffix in ("indices", "values"):
+                f = self.path / f"sparse-{name}.{suffix}"
+                with open(f, "ab") as fh:
+                    fh.truncate(nnz * 4)
+        for name, mv in self.multi.items():
+            with open(self.path / f"multi-{name}.data", "ab") as fh:
+                fh.truncate(self._flushed_tokens.get(name, 0) * mv.dim * self.dtype.itemsize)
+        with open(self.path / "payloads.jsonl", "ab") as fh:
+            fh.truncate(self.meta["payload_bytes"])
+        self.writable = True
+
+    def _ensure_capacity(self, n: int) -> None:
+        for name, arr in self.dense.items():
+            if arr.shape[0] >= n:
+                continue
+            cap = max(n, arr.shape[0] * 2, 1024)
+            f = self.path / f"dense-{name}.npy"
+            tmp = f.with_suffix(".tmp.npy")
+            grown = open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(cap, arr.shape[1]))
+            grown[:self.rows] = arr[:self.rows]
+            grown.flush()
+            del grown
+            os.replace(tmp, f)
+            self.dense[name] = np.load(f, mmap_mode="r+")
+
+    def flush(self) -> None:
+        if not self.writable:
+            return
+        dead = self.rows - int(self.alive.sum())
+        if dead > 1000 and dead > self.rows * COMPACT_RATIO:
+            self.compact()
+            return
+        for arr in self.dense.values():
+            if isinstance(arr, np.memmap):
+                arr.flush()
+        for name, sp in self.sparse.items():
+            sp._concat()
+            start = self._flushed_nnz.get(name, 0)
+            with open(self.path / f"sparse-{name}.indices", "ab") as fh:
+                fh.write(sp.indices[0][start:].tobytes())
+            with open(self.path / f"sparse-{name}.values", "ab") as fh:
+                fh.write(sp.values[0][start:].tobytes())
+            np.save(self.path / f"sparse-{name}.indptr.npy", sp.indptr[0])
+            self._flushed_nnz[name] = sp.nnz
+        for name, mv in self.multi.items():
+            with open(self.path / f"multi-{name}.data", "ab") as fh:
+                fh.write(mv.pending().tobytes())
+            np.save(self.path / f"multi-{name}.indptr.npy", mv.indptr[0])
+            self._flushed_tokens[name] = mv.n_tokens
+            mv.base, mv.tail = self._map_multi(name, mv.dim, mv.n_tokens), []
+        with open(self.path / "payloads.jsonl", "ab") as fh:
+            fh.write(b"".join(self._pending_payload))
+            payload_bytes = fh.tell()
+        self._pending_payload = []
+        np.save(self.path / "alive.npy", self.alive)
+        self._commit(payload_bytes)
+
+    def _commit(self, payload_bytes: int) -> None:
+        self.meta.update(rows=self.rows, payload_bytes=payload_bytes,
+                         sparse_nnz=dict(self._flushed_nnz),
+                         multi_tokens=dict(self._flushed_tokens), version=self.version + 1)
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta, ensure_ascii=False))
+        os.replace(tmp, self.path / "meta.json")
+        self.version = self.meta["version"]
+        self._flushed_rows = self.rows
+        self._mtime = (self.path / "meta.json").stat().st_mtime_ns
+
+    def commit_meta(self) -> None:
+        """只改了 meta（metadata / payload 索引）时落盘。"""
+        self._make_writable()
+        self.flush()
+
+    def compact(self) -> None:
+        """去掉墓碑行，整体重写各文件。"""
+        keep = np.flatnonzero(self.alive)
+        for name, arr in self.dense.items():
+            f = self.path / f"dense-{name}.npy"
+            tmp = f.with_suffix(".tmp.npy")
+            out = open_memmap(tmp, mode="w+", dtype=self.dtype,
+                              shape=(max(len(keep), 1024), arr.shape[1]))
+            out[:len(keep)] = arr[keep]
+            out.flush()
+            del out
+            os.replace(tmp, f)
+            self.dense[name] = np.load(f, mmap_mode="r+")
+        for name, sp in self.sparse.items():
+            sp._concat()
+            lens = np.diff(sp.indptr[0])[keep]
+            nnz_rows = np.repeat(np.arange(len(sp.indptr[0]) - 1), np.diff(sp.indptr[0]))
+            sel = self.alive[nnz_rows]
+            indices, values = sp.indices[0][sel], sp.values[0][sel]
+            indptr = np.concatenate([[0], np.cumsum(lens)]).astype(np.int64)
+            for suffix, data in (("indices", indices), ("values", values)):
+                tmp = self.path / f"sparse-{name}.{suffix}.tmp"
+                data.tofile(tmp)
+                os.replace(tmp, self.path / f"sparse-{name}.{suffix}")
+            np.save(self.path / f"sparse-{name}.indptr.npy", indptr)
+            self.sparse[name] = _Sparse(indptr, indices, values)
+            self._flushed_nnz[name] = len(indices)
+        for name, mv in self.multi.items():
+            mv._concat()
+            starts, ends = mv.indptr[0][keep], mv.indptr[0][keep + 1]
+            tmp = self.path / f"multi-{name}.data.tmp"
+            with open(tmp, "wb") as fh:
+                for lo, hi in zip(starts.tolist(), ends.tolist()):
+                    fh.write(np.ascontiguousarray(mv.tokens(lo, hi)).tobytes())
+            os.replace(tmp, self.path / f"multi-{name}.data")
+            indptr = np.concatenate([[0], np.cumsum(ends - starts)]).astype(np.int64)
+            np.save(self.path / f"multi-{name}.indptr.npy", indptr)
+            self._flushed_tokens[name] = int(indptr[-1])
+            self.multi[name] = _Multi(indptr, self._map_multi(name, mv.dim, int(indptr[-1])))
+        self.ids = [self.ids[r] for r in keep]
+        self.payloads = [self.payloads[r] for r in keep]
+        tmp = self.path / "payloads.jsonl.tmp"
+        with open(tmp, "wb") as fh:
+            for pid, payload in zip(self.ids, self.payloads):
+                fh.write(_payload_line(pid, payload))
+            payload_bytes = fh.tell()
+        os.replace(tmp, self.path / "payloads.jsonl")
+        self._pending_payload = []
+        self.rows = len(keep)
+        self.alive = np.ones(self.rows, dtype=bool)
+        np.save(self.path / "alive.npy", self.alive)
+        self.id_to_row = {pid: r for r, pid in enumerate(self.ids)}
+        self._build_field_indexes()
+        self._commit(payload_bytes)
+
+    # ── 写 ──
+
+    def append(self, ids: list, vectors: dict[str, list], payloads: list[Optional[dict]]) -> None:
+        self._make_writable()
+        n = len(ids)
+        start = self.rows
+        self._ensure_capacity(start + n)
+        for name, arr in self.dense.items():
+            vecs = vectors.get(name)
+            if vecs is None:
+                arr[start:start + n] = 0
+                continue
+            mat = np.asarray(vecs, dtype=np.float32).reshape(n, -1)
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            arr[start:start + n] = mat / np.where(norms > 0, norms, 1)
+        for name, sp in self.sparse.items():
+            sp.append(vectors.get(name) or [None] * n)
+        for name, mv in self.multi.items():
+            mv.append(vectors.get(name) or [None] * n)
+        self.alive = np.concatenate([self.alive, np.ones(n, dtype=bool)])
+        for i, (pid, payload) in enumerate(zip(ids, payloads)):
+            r = start + i
+            old = self.id_to_row.get(pid)
+            if old is not None:
+                self.alive[old] = False
+            self.id_to_row[pid] = r
+            self.ids.append(pid)
+            self.payloads.append(payload or {})
+            self._pending_payload.append(_payload_line(pid, payload or {}))
+        self.rows += n
+        for r in range(start, self.rows):
+            if self.alive[r]:
+                self._index_row(r)
+
+    def delete_rows(self, rows: np.ndarray) -> None:
+        if len(rows):
+            self._make_writable()
+            self.alive[rows] = False
+            for r in rows.tolist():
+                self.id_to_row.pop(self.ids[r], None)
+
+    def vectors_of(self, rows: np.ndarray) -> dict[str, list]:
+        out: dict[str, list] = {name: np.asarray(arr[rows], dtype=np.float32).tolist()
+                                for name, arr in self.dense.items()}
+        for name, sp in self.sparse.items():
+            out[name] = sp.rows(rows)
+        for name, mv in self.multi.items():
+            out[name] = mv.rows(rows)
+        return out
+
+    # ── 过滤 ──
+
+    def mask(self, flt: Optional[models.Filter]) -> np.ndarray:
+        """有效且满足 flt 的行。索引字段的 must 条件直接查倒排，其余逐行判定。"""
+        mask = self.alive.copy()
+        if flt is None:
+            return mask
+        must = flt.must if isinstance(flt.must, list) else ([flt.must] if flt.must else [])
+        rest = []
+        for cond in must:
+            rows = self._indexed_rows(cond)
+            if rows is None:
+                rest.append(cond)
+                continue
+            sel = np.zeros(self.rows, dtype=bool)
+            sel[rows] = True
+            mask &= sel
+        min_should = getattr(flt, "min_should", None)
+        remaining = models.Filter(must=rest or None, should=flt.should, must_not=flt.must_not,
+                                  **({"min_should": min_should} if min_should else {}))
+        if rest or flt.should is not None or flt.must_not is not None or min_should:
+            for r in np.flatnonzero(mask).tolist():
+                if not check_filter(remaining, self.payloads[r], self.ids[r], {}):
+                    mask[r] = False
+        return mask
+
+    def _indexed_rows(self, cond) -> Optional[np.ndarray]:
+        if isinstance(cond, models.HasIdCondition):
+            rows = [self.id_to_row.get(_normalize_id(pid)) for pid in cond.has_id]
+            return np.asarray([r for r in rows if r is not None], dtype=np.int64)
+        if not isinstance(cond, models.FieldCondition) or cond.key not in self.field_index:
+            return None
+        idx = self.field_index[cond.key]
+        if isinstance(cond.match, models.MatchValue):
+            values = [cond.match.value]
+        elif isinstance(cond.match, models.MatchAny):
+            values = cond.match.any
+        else:
+            return None
+        lists = [idx.get(v, ()) for v in values]
+        return np.fromiter((r for rows in lists for r in rows), dtype=np.int64)
+
+    # ── 打分 ──
+
+    def dense_scores(self, name: str, query, rows: np.ndarray) -> np.ndarray:
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        arr = self.dense[name]
+        if len(rows) < self.rows // 4:
+            return np.asarray(arr[rows], dtype=np.float32) @ q
+        out = np.empty(self.rows, dtype=np.float32)
+        for s in range(0, self.rows, DENSE_BLOCK):
+            e = min(s + DENSE_BLOCK, self.rows)
+            out[s:e] = np.asarray(arr[s:e], dtype=np.float32) @ q
+        return out[rows]
+
+
+def _payload_line(pid, payload: dict) -> bytes:
+    return (json.dumps({"id": pid, "payload": payload}, ensure_ascii=False) + "\n").encode()
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, k: int,
+           tie: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+    """按分数降序取前 k；同分按 tie（默认行号）升序。NaN 视为未命中。"""
+    tie = rows if tie is None else tie
+    valid = ~np.isnan(scores)
+    rows, scores, tie = rows[valid], scores[valid], tie[valid]
+    if len(rows) > k:
+        # 第 k 名的分数为界，同分的都留下，再按 tie 排序截断
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        keep = scores >= kth
+        rows, scores, tie = rows[keep], scores[keep], tie[keep]
+    order = np.lexsort((tie, -scores))[:k]
+    return rows[order], scores[order]
+
+
+def rrf_fuse(results: list[tuple[np.ndarray, np.ndarray]],
+             limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """多路 (rows, scores)（各自已按分数降序）按名次做 RRF 融合，同分按首次出现的先后。"""
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.concatenate([r for r, _ in results])
+    contrib = np.concatenate([1.0 / (np.arange(len(r)) + RRF_K) for r, _ in results])
+    uniq, inv = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inv, weights=contrib, minlength=len(uniq)).astype(np.float32)
+    first = np.full(len(uniq), len(rows), dtype=np.int64)
+    np.minimum.at(first, inv, np.arange(len(rows)))
+    return _top_k(uniq, fused, limit, tie=first)
+
+
+class NumpyVectorClient:
+    """QdrantClient 接口子集的 NumPy 实现，数据持久化在 path 目录。"""
+
+    def __init__(self, path: str = NUMPY_BACKEND_PATH, dtype: str = NUMPY_BACKEND_DTYPE):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self._lock = _RWLock()
+        self._collections: dict[str, _Collection] = {}
+        self._checked_at: dict[str, float] = {}
+        self._lock_file = None
+
+    # ── 内部 ──
+
+    def _acquire_writer(self) -> None:
+        if self._lock_file is not None:
+            return
+        fh = open(self.path / ".write.lock", "w")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fh.close()
+            raise RuntimeError(f"另一个进程正在写入 {self.path}（numpy 后端只支持单写进程）")
+        self._lock_file = fh
+
+    def _aliases(self) -> dict[str, str]:
+        f = self.path / "aliases.json"
+        return json.loads(f.read_text()) if f.exists() else {}
+
+    def _save_aliases(self, aliases: dict[str, str]) -> None:
+        tmp = self.path / "aliases.json.tmp"
+        tmp.write_text(json.dumps(aliases, ensure_ascii=False))
+        os.replace(tmp, self.path / "aliases.json")
+
+    def _resolve(self, name: str) -> str:
+        return self._aliases().get(name, name)
+
+    def _col(self, name: str) -> _Collection:
+        name = self._resolve(name)
+        col = self._collections.get(name)
+        if col is None:
+            if not (self.path / name / "meta.json").exists():
+                raise ValueError(f"Collection {name} not found")
+            col = self._collections[name] = _Collection(self.path / name, self._acquire_writer)
+            self._checked_at[name] = time.monotonic()
+        elif (not col.writable
+              and time.monotonic() - self._checked_at.get(name, 0) > RELOAD_CHECK_SEC):
+            # 只读进程：其他进程提交了新版本则重新加载
+            self._checked_at[name] = time.monotonic()
+            meta_f = col.path / "meta.json"
+            if not meta_f.exists():
+                del self._collections[name]
+                raise ValueError(f"Collection {name} not found")
+            if meta_f.stat().st_mtime_ns != col._mtime:
+                # 换新对象而不是原地 load()：并发的读仍持有旧对象
+                col = self._collections[name] = _Collection(col.path, self._acquire_writer)
+        return col
+
+    def _rows_of(self, col: _Collection, selector) -> np.ndarray:
+        if isinstance(selector, models.FilterSelector):
+            return np.flatnonzero(col.mask(selector.filter))
+        if isinstance(selector, models.Filter):
+            return np.flatnonzero(col.mask(selector))
+        ids = selector.points if isinstance(selector, models.PointIdsList) else selector
+        rows = [col.id_to_row.get(_normalize_id(pid)) for pid in ids]
+        return np.asarray([r for r in rows if r is not None], dtype=np.int64)
+
+    def _records(self, col: _Collection, rows: np.ndarray, with_payload, with_vectors,
+                 scores: Optional[np.ndarray] = None) -> list:
+        vectors = None
+        if with_vectors:
+            vectors = col.vectors_of(rows)
+            if isinstance(with_vectors, list):
+                vectors = {k: v for k, v in vectors.items() if k in with_vectors}
+        out = []
+        for i, r in enumerate(rows.tolist()):
+            vector = {k: v[i] for k, v in vectors.items()} if vectors is not None else None
+            payload = _select_payload(col.payloads[r], with_payload)
+            if scores is None:
+                out.append(models.Record.model_construct(id=col.ids[r], payload=payload,
+                                                         vector=vector, shard_key=None,
+                                                         order_value=None))
+            else:
+                out.append(models.ScoredPoint.model_construct(
+                    id=col.ids[r], version=0, score=float(scores[i]), payload=payload,
+                    vector=vector, shard_key=None, order_value=None))
+        return out
+
+    # ── collection / alias ──
+
+    def get_collections(self):
+        names = sorted(p.name for p in self.path.iterdir() if (p / "meta.json").exists())
+        return models.CollectionsResponse(
+            collections=[models.CollectionDescription(name=n) for n in names])
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return (self.path / self._resolve(collection_name) / "meta.json").exists()
+
+    def create_collection(self, collection_name: str, vectors_config=None,
+                          sparse_vectors_config=None, **kwargs) -> bool:
+        with self._lock.write():
+            self._acquire_writer()
+            if isinstance(vectors_config, models.VectorParams):
+                vectors_config = {"": vectors_config}
+            path = self.path / collection_name
+            if (path / "meta.json").exists():
+                raise ValueError(f"Collection {collection_name} already exists")
+            path.mkdir(parents=True, exist_ok=True)
+            (path / "payloads.jsonl").write_bytes(b"")
+            meta = {
+                "version": 0, "rows": 0, "payload_bytes": 0, "dtype": self.dtype,
+                "vectors": {name: {"size": p.size, "distance": str(p.distance.value)}
+                            for name, p in (vectors_config or {}).items()
+                            if p.multivector_config is None},
+                "multivectors": {name: {"size": p.size, "distance": str(p.distance.value),
+                                        "comparator": str(p.multivector_config.comparator.value)}
+                                 for name, p in (vectors_config or {}).items()
+                                 if p.multivector_config is not None},
+                "sparse_vectors": sorted(sparse_vectors_config or {}),
+                "sparse_modifiers": {
+                    name: str(p.modifier.value) for name, p in (sparse_vectors_config or {}).items()
+                    if getattr(p, "modifier", None) not in (None, models.Modifier.NONE)},
+                "sparse_nnz": {}, "multi_tokens": {}, "payload_schema": {},
+                "metadata": kwargs.get("metadata") or {},
+            }
+            for name, cfg in {**meta["vectors"], **meta["multivectors"]}.items():
+                if cfg["distance"] != "Cosine":
+                    raise ValueError(f"numpy 后端只支持 Cosine 距离: {name}")
+            (path / "meta.json").write_text(json.dumps(meta))
+            self._collections.pop(collection_name, None)
+            return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock.write():
+            self._acquire_writer()
+            path = self.path / collection_name
+            self._collections.pop(collection_name, None)
+            if not (path / "meta.json").exists():
+                return False
+            shutil.rmtree(path)
+            return True
+
+    def get_collection(self, collection_name: str):
+        with self._lock.read():
+            col = self._col(collection_name)
+            n = int(col.alive.sum())
+            schema = {f: SimpleNamespace(data_type=t, points=n)
+                      for f, t in col.meta["payload_schema"].items()}
+            return SimpleNamespace(
+                status=models.CollectionStatus.GREEN,
+                points_count=n,
+                indexed_vectors_count=n,
+                segments_count=1,
+                payload_schema=schema,
+                config=SimpleNamespace(metadata=col.meta["metadata"], params=SimpleNamespace(
+                    vectors={**col.meta["vectors"], **col.meta.get("multivectors", {})},
+                    sparse_vectors=col.meta["sparse_vectors"])),
+            )
+
+    def update_collection(self, collection_name: str, metadata: Optional[dict] = None,
+                          **kwargs) -> bool:
+        with self._lock.write():
+            col = self._col(collection_name)
+            if metadata:
+                col.meta["metadata"].update(metadata)
+                col.commit_meta()
+            return True
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None,
+                             wait: bool = True, **kwargs):
+        with self._lock.write():
+            col = self._col(collection_name)
+            col.meta["payload_schema"][field_name] = _schema_name(field_schema)
+            col._build_field_indexes()
+            col.commit_meta()
+
+    def get_aliases(self):
+        return models.CollectionsAliasesResponse(aliases=[
+            models.AliasDescription(alias_name=a, collection_name=c)
+            for a, c in sorted(self._aliases().items())])
+
+    def update_collection_aliases(self, change_aliases_operations: list, **kwargs) -> bool:
+        with self._lock.write():
+            self._acquire_writer()
+            aliases = self._aliases()
+            for op in change_aliases_operations:
+                if isinstance(op, models.DeleteAliasOperation):
+                    aliases.pop(op.delete_alias.alias_name, None)
+                elif isinstance(op, models.CreateAliasOperation):
+                    aliases[op.create_alias.alias_name] = op.create_alias.collection_name
+                elif isinstance(op, models.RenameAliasOperation):
+                    aliases[op.rename_alias.new_alias_name] = aliases.pop(
+                        op.rename_alias.old_alias_name)
+            self._save_aliases(aliases)
+            return True
+
+    # ── 写 ──
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs):
+        with self._lock.write():
+            col = self._col(collection_name)
+            if isinstance(points, models.Batch):
+                ids = [_normalize_id(p) for p in points.ids]
+                vectors = points.vectors if isinstance(points.vectors, dict) else {
+                    "": points.vectors}
+                payloads = points.payloads or [None] * len(ids)
+            else:
+                ids = [_normalize_id(p.id) for p in points]
+                vectors = {}
+                for i, p in enumerate(points):
+                    vec = p.vector if isinstance(p.vector, dict) else {"": p.vector}
+                    for name, v in vec.items():
+                        vectors.setdefault(name, [None] * len(points))[i] = v
+                payloads = [p.payload for p in points]
+            if ids:
+                col.append(ids, vectors, list(payloads))
+            if wait:
+                col.flush()
+            return models.UpdateResult(operation_id=col.version,
+                                       status=models.UpdateStatus.COMPLETED)
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        with self._lock.write():
+            col = self._col(collection_name)
+            col.delete_rows(self._rows_of(col, points_selector))
+            if wait:
+                col._make_writable()
+                col.flush()
+            return models.UpdateResult(operation_id=col.version,
+                                       status=models.UpdateStatus.COMPLETED)
+
+    def set_payload(self, collection_name: str, payload: dict, points=None, wait: bool = True,
+                    key: Optional[str] = None, **kwargs):
+        """合并写入 payload：作废旧行，追加带新 payload 的行（向量原样复制）。"""
+        with self._lock.write():
+            col = self._col(collection_name)
+            rows = self._rows_of(col, points)
+            if len(rows):
+                vectors = col.vectors_of(rows)
+                ids = [col.ids[r] for r in rows.tolist()]
+                payloads = [{**col.payloads[r], **payload} for r in rows.tolist()]
+                col.delete_rows(rows)
+                col.append(ids, vectors, payloads)
+            if wait:
+                col.flush()
+            return models.UpdateResult(operation_id=col.version,
+                                       status=models.UpdateStatus.COMPLETED)
+
+    # ── 读 ──
+
+    def count(self, collection_name: str, count_filter: Optional[models.Filter] = None,
+              exact: bool = True, **kwargs):
+        with self._lock.read():
+            mask = self._col(collection_name).mask(count_filter)
+            return models.CountResult(count=int(mask.sum()))
+
+    def retrieve(self, collection_name: str, ids: Iterable, with_payload=True,
+                 with_vectors=False, **kwargs) -> list:
+        with self._lock.read():
+            col = self._col(collection_name)
+            return self._records(col, self._rows_of(col, list(ids)), with_payload, with_vectors)
+
+    def scroll(self, collection_name: str, scroll_filter: Optional[models.Filter] = None,
+               limit: int = 10, offset=None, with_payload=True, with_vectors=False, **kwargs):
+        """按行号顺序翻页；offset 是上一页返回的不透明游标。"""
+        with self._lock.read():
+            col = self._col(collection_name)
+            rows = np.flatnonzero(col.mask(scroll_filter))
+            if offset is not None:
+                rows = rows[rows >= int(offset)]
+            page, rest = rows[:limit], rows[limit:]
+            next_offset = int(rest[0]) if len(rest) else None
+            return self._records(col, page, with_payload, with_vectors), next_offset
+
+    def query_points(self, collection_name: str, query=None, using: Optional[str] = None,
+                     prefetch=None, query_filter: Optional[models.Filter] = None,
+                     limit: int = 10, with_payload=True, with_vectors=False,
+                     score_threshold: Optional[float] = None, **kwargs):
+        with self._lock.read():
+            col = self._col(collection_name)
+            rows, scores = self._execute(col, query, using, prefetch, query_filter, limit)
+            if score_threshold is not None:
+                keep = scores >= score_threshold
+                rows, scores = rows[keep], scores[keep]
+            return QueryResponse(
+                points=self._records(col, rows, with_payload, with_vectors, scores))
+
+    def query_batch_points(self, collection_name: str, requests: list, **kwargs) -> list:
+        return [self.query_points(collection_name, query=r.query, using=r.using,
+                                  prefetch=r.prefetch, query_filter=r.filter,
+                                  limit=r.limit or 10, with_payload=r.with_payload or False,
+                                  with_vectors=r.with_vector or False,
+                                  score_threshold=r.score_threshold)
+                for r in requests]
+
+    def _execute(self, col: _Collection, query, using: Optional[str], prefetch,
+                 flt: Optional[models.Filter], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        if prefetch is not None and not isinstance(prefetch, list):
+            prefetch = [prefetch]
+        if prefetch:
+            subs = []
+            for p in prefetch:
+                # 外层 filter 同样作用于 prefetch
+                sub_filter = p.filter if flt is None else (
+                    flt if p.filter is None else models.Filter(must=[flt, p.filter]))
+                subs.append(self._execute(col, p.query, p.using, p.prefetch, sub_filter,
+                                          p.limit or 10))
+            if isinstance(query, models.FusionQuery):
+                if query.fusion != models.Fusion.RRF:
+                    raise ValueError(f"numpy 后端只支持 RRF 融合，不支持 {query.fusion}")
+                return rrf_fuse(subs, limit)
+            candidates = np.unique(np.concatenate([r for r, _ in subs]))
+            if query is None:
+                return _top_k(candidates, np.zeros(len(candidates), dtype=np.float32), limit)
+            return self._score(col, query, using, candidates, limit)
+        candidates = np.flatnonzero(col.mask(flt))
+        if query is None:
+            return candidates[:limit], np.zeros(min(limit, len(candidates)), dtype=np.float32)
+        return self._score(col, query, using, candidates, limit)
+
+    def _score(self, col: _Collection, query, using: Optional[str], rows: np.ndarray,
+               limit: int) -> tuple[np.ndarray, np.ndarray]:
+        if isinstance(query, models.NearestQuery):
+            query = query.nearest
+        if using in col.multi:
+            scores = col.multi[using].scores(query, rows)
+        elif isinstance(query, models.SparseVector):
+            idf = col.meta.get("sparse_modifiers", {}).get(using) == "idf"
+            scores = col.sparse[using].scores(query, col.rows,
+                                              col.alive if idf else None)[rows]
+        else:
+            scores = col.dense_scores(using or "", query, rows)
+        return _top_k(rows, scores, limit)
+
+    # ── 不支持的接口 ──
+
+    def create_snapshot(self, *args, **kwargs):
+        raise ValueError(f"numpy 后端不支持快照，直接复制目录 {self.path}")
+
+    list_snapshots = delete_snapshot = create_snapshot
+
+    def close(self, **kwargs) -> None:
+        with self._lock.write():
+            for col in self._collections.values():
+                col.flush()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""ONNX Runtime CPU 推理后端（BGE-M3 + bge-reranker-v2-m3）。
+
+无 GPU 的检索节点上，PyTorch fp16 权重没有加速甚至更慢。这里用 ONNX Runtime
+加载同一模型的导出版本（默认 INT8 动态量化），输出与 LocalBGEM3Provider /
+FlagReranker 保持同样的格式：
+  - dense: CLS 向量 L2 归一化
+  - sparse: relu(sparse_linear(hidden)) 按 token id 取最大值，去掉特殊 token
+  - colbert: colbert_linear(hidden[1:]) 逐 token L2 归一化（COLBERT_VECTORS=1 时，见 colbert.py）
+  - rerank: 分类 logits（与 FlagReranker.compute_score(normalize=False) 同尺度）
+
+运行时只依赖 onnxruntime + transformers（tokenizer），不需要 torch。onnxruntime 是
+可选依赖：pip install -e ".[onnx]"。
+
+用法:
+  # 一次性导出（需要 torch，可在另一台机器上执行后拷贝目录）
+  python scripts/onnx_backend.py --export
+  python scripts/onnx_backend.py --export --no-quantize   # 只导出 fp32
+
+  # 使用
+  EMBEDDING_PROVIDER=onnx python scripts/mcp_server.py
+
+环境变量:
+  ONNX_MODEL_DIR=...     # 导出目录（默认 ~/.cache/knowledge-base-search/onnx）
+  ONNX_QUANTIZED=1       # 1 使用 INT8 模型（默认），0 使用 fp32
+  ONNX_THREADS=0         # intra-op 线程数，0 由 onnxruntime 决定
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from qdrant_client import models
+
+from colbert import COLBERT_ENABLED, pool
+from embedding_provider import EMBEDDING_BATCH_TOKENS, EmbeddingProvider, token_budget_batches
+
+log = logging.getLogger(__name__)
+
+ONNX_MODEL_DIR = Path(os.environ.get(
+    "ONNX_MODEL_DIR", str(Path.home() / ".cache" / "knowledge-base-search" / "onnx")))
+ONNX_QUANTIZED = os.environ.get("ONNX_QUANTIZED", "1") != "0"
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+SPARSE_FILE = "sparse_linear.npz"
+COLBERT_FILE = "colbert_linear.npz"
+
+
+def _model_subdir(model_name: str) -> str:
+    return model_name.split("/")[-1]
+
+
+def _session(model_dir: Path, quantized: bool, threads: int):
+    import onnxruntime as ort
+
+    path = model_dir / (INT8_FILE if quantized else FP32_FILE)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"ONNX 模型不存在: {path}（先运行 python scripts/onnx_backend.py --export）")
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads > 0:
+        opts.intra_op_num_threads = threads
+    log.info(f"加载 ONNX 模型 {path}")
+    return ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+
+
+class OnnxBGEM3Provider(EmbeddingProvider):
+    """BGE-M3 的 ONNX Runtime 实现，支持 dense + sparse（+ 可选 ColBERT 多向量）。"""
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", model_dir: Optional[Path] = None,
+                 quantized: bool = ONNX_QUANTIZED, threads: int = ONNX_THREADS,
+                 max_length: int = 8192, batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+                 colbert: bool = COLBERT_ENABLED):
+        from transformers import AutoTokenizer
+
+        model_dir = model_dir or ONNX_MODEL_DIR / _model_subdir(model_name)
+        self._session = _session(model_dir, quantized, threads)
+        self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        sparse = np.load(model_dir / SPARSE_FILE)
+        self._sparse_w = sparse["weight"].astype(np.float32).reshape(-1)  # (hidden,)
+        self._sparse_b = float(sparse["bias"].reshape(-1)[0])
+        self.colbert = colbert
+        if colbert:
+            if not (model_dir / COLBERT_FILE).exists():
+                raise FileNotFoundError(
+                    f"缺少 {model_dir / COLBERT_FILE}（重新运行 python scripts/onnx_backend.py --export）")
+            head = np.load(model_dir / COLBERT_FILE)
+            self._colbert_w = head["weight"].astype(np.float32).T  # (hidden, dim)
+            self._colbert_b = head["bias"].astype(np.float32)
+        self._max_length = max_length
+        self._batch_tokens = batch_tokens
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        tok = self._tokenizer
+        self._unused_tokens = {
+            t for t in (tok.cls_token_id, tok.eos_token_id, tok.pad_token_id, tok.unk_token_id)
+            if t is not None
+        }
+        self.model_id = f"onnx:{model_name}:{'int8' if quantized else 'fp32'}"
+
+    def _forward(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        enc = self._tokenizer(texts, padding=True, truncation=True,
+                              max_length=self._max_length, return_tensors="np")
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+        hidden = self._session.run(None, feeds)[0]  # (B, L, H)
+        return hidden, enc["input_ids"], enc["attention_mask"]
+
+    def _lexical_weights(self, hidden: np.ndarray, input_ids: np.ndarray,
+                         attention_mask: np.ndarray) -> list[dict]:
+        token_w = np.maximum(hidden @ self._sparse_w + self._sparse_b, 0.0)  # (B, L)
+        out = []
+        for ids, weights, mask in zip(input_ids, token_w, attention_mask):
+            result: dict[str, float] = {}
+            for tid, w, m in zip(ids.tolist(), weights.tolist(), mask.tolist()):
+                if not m or tid in self._unused_tokens or w <= 0:
+                    continue
+                key = str(tid)
+                if w > result.get(key, 0.0):
+                    result[key] = w
+            out.append(result)
+        return out
+
+    def _colbert_vecs(self, hidden: np.ndarray, attention_mask: np.ndarray) -> list[np.ndarray]:
+        """与 FlagEmbedding 一致：去掉 CLS，保留其后 n_tokens - 1 个位置，逐个归一化。"""
+        out = []
+        for h, mask in zip(hidden, attention_mask):
+            vecs = h[1:int(mask.sum())] @ self._colbert_w + self._colbert_b
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            out.append(vecs / np.where(norms > 0, norms, 1))
+        return out
+
+    def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
+        # 与 LocalBGEM3Provider 相同：按 token 长度分桶，输出恢复输入顺序
+        if self._batch_tokens > 0:
+            lengths = [len(ids) for ids in self._tokenizer(
+                texts, truncation=True, max_length=self._max_length)["input_ids"]]
+        else:
+            lengths = [0] * len(texts)
+        dense = np.zeros((len(texts), self._sparse_w.shape[0]), dtype=np.float32)  # (N, hidden)
+        lexical: list = [None] * len(texts)
+        multi: list = [None] * len(texts)
+        for group in token_budget_batches(lengths, self._batch_tokens, batch_size):
+            hidden, ids, mask = self._forward([texts[i] for i in group])
+            cls = hidden[:, 0]
+            dense[group] = cls / np.linalg.norm(cls, axis=1, keepdims=True)
+            for i, weights in zip(group, self._lexical_weights(hidden, ids, mask)):
+                lexical[i] = weights
+            if self.colbert:
+                for i, tokens in zip(group, self._colbert_vecs(hidden, mask)):
+                    multi[i] = pool(tokens).astype(np.float16)
+        out = {"dense_vecs": dense, "lexical_weights": lexical}
+        return {**out, "colbert_vecs": multi} if self.colbert else out
+
+    def encode_query(self, query: str) -> dict:
+        out = self.encode_texts([query])
+        sparse = out["lexical_weights"][0]
+        q = {
+            "dense_vec": out["dense_vecs"][0].tolist(),
+            "sparse_vec": models.SparseVector(
+                indices=list(map(int, sparse.keys())),
+                values=list(sparse.values()),
+            ),
+        }
+        if self.colbert:
+            q["colbert_vec"] = out["colbert_vecs"][0].tolist()
+        return q
+
+
+class OnnxReranker:
+    """bge-reranker-v2-m3 的 ONNX Runtime 实现，接口与 FlagReranker.compute_score 一致。"""
+
+    def __init__(self, model_name: str = "BAAI/bge-reranker-v2-m3",
+                 model_dir: Optional[Path] = None, quantized: bool = ONNX_QUANTIZED,
+                 threads: int = ONNX_THREADS, max_length: int = 512):
+        from transformers import AutoTokenizer
+
+        model_dir = model_dir or ONNX_MODEL_DIR / _model_subdir(model_name)
+        self._session = _session(model_dir, quantized, threads)
+        self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self._max_length = max_length
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def compute_score(self, pairs, batch_size: int = 32, normalize: bool = False):
+        single = isinstance(pairs, tuple) or (pairs and isinstance(pairs[0], str))
+        if single:
+            pairs = [pairs]
+        scores: list[float] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            enc = self._tokenizer([q for q, _ in batch], [p for _, p in batch],
+                                  padding=True, truncation=True,
+                                  max_length=self._max_length, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            logits = self._session.run(None, feeds)[0].reshape(-1)
+            scores.extend(float(x) for x in logits)
+        if normalize:
+            scores = [float(1 / (1 + np.exp(-s))) for s in scores]
+        return scores[0] if single else scores
+
+
+# ── 导出 ──────────────────────────────────────────────────────────
+
+def _quantize(model_dir: Path) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    log.info(f"INT8 动态量化: {model_dir / INT8_FILE}")
+    quantize_dynamic(
+        str(model_dir / FP32_FILE), str(model_dir / INT8_FILE),
+        weight_type=QuantType.QInt8, use_external_data_format=True,
+    )
+
+
+def export_models(embedding_model: str, reranker_model: str, out_dir: Path,
+                  quantize: bool = True) -> None:
+    """把 BGE-M3（last_hidden_state + sparse_linear / colbert_linear 权重）和 reranker（logits）
+    导出为 ONNX。"""
+    import torch
+    from huggingface_hub import snapshot_download
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    sample = ("hello world", "passage")
+
+    # BGE-M3：encoder 输出 hidden states，dense/sparse 头在 NumPy 里计算
+    emb_dir = out_dir / _model_subdir(embedding_model)
+    emb_dir.mkdir(parents=True, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(embedding_model)
+    model = AutoModel.from_pretrained(embedding_model).eval()
+    enc = tok([sample[0]], return_tensors="pt")
+    log.info(f"导出 {embedding_model} → {emb_dir}")
+    torch.onnx.export(
+        model, (enc["input_ids"], enc["attention_mask"]), str(emb_dir / FP32_FILE),
+        input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "seq"},
+                      "attention_mask": {0: "batch", 1: "seq"},
+                      "last_hidden_state": {0: "batch", 1: "seq"}},
+        opset_version=17,
+    )
+    tok.save_pretrained(str(emb_dir))
+    weights_dir = Path(snapshot_download(embedding_model))
+    for pt_file, npz_file in (("sparse_linear.pt", SPARSE_FILE),
+                              ("colbert_linear.pt", COLBERT_FILE)):
+        state = torch.load(weights_dir / pt_file, map_location="cpu")
+        np.savez(emb_dir / npz_file, weight=state["weight"].numpy(),
+                 bias=state["bias"].numpy())
+
+    # reranker：直接导出分类 logits
+    rr_dir = out_dir / _model_subdir(reranker_model)
+    rr_dir.mkdir(parents=True, exist_ok=True)
+    rtok = AutoTokenizer.from_pretrained(reranker_model)
+    rmodel = AutoModelForSequenceClassification.from_pretrained(reranker_model).eval()
+    renc = rtok([sample[0]], [sample[1]], return_tensors="pt")
+    log.info(f"导出 {reranker_model} → {rr_dir}")
+    torch.onnx.export(
+        rmodel, (renc["input_ids"], renc["attention_mask"]), str(rr_dir / FP32_FILE),
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "seq"},
+                      "attention_mask": {0: "batch", 1: "seq"},
+                      "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    rtok.save_pretrained(str(rr_dir))
+
+    if quantize:
+        _quantize(emb_dir)
+        _quantize(rr_dir)
+    log.info(f"✅ ONNX 模型已导出到 {out_dir}")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="BGE-M3 / reranker ONNX 导出工具")
+    parser.add_argument("--export", action="store_true", help="导出 ONNX 模型")
+    parser.add_argument("--out", default=str(ONNX_MODEL_DIR), help="导出目录")
+    parser.add_argument("--no-quantize", action="store_true", help="不生成 INT8 量化模型")
+    args = parser.parse_args()
+
+    if not args.export:
+        parser.print_help()
+        return
+    export_models(
+        os.environ.get("BGE_M3_MODEL", "BAAI/bge-m3"),
+        os.environ.get("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3"),
+        Path(args.out),
+        quantize=not args.no_quantize,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""多进程数据并行 embedding：N 个模型 worker 进程，各自固定线程数并绑定 CPU。
+
+单个 BGEM3FlagModel.encode() 在多核机器上只能用满一小部分核（这种 batch 规模下
+torch intra-op 线程扩展性差）。DataParallelProvider 启动 N 个 worker，每个加载一份
+模型、独占 cores/N 个核；encode_texts 把文本按长度交错分片给各 worker，dense 向量
+由 worker 直接写进共享内存，lexical weights 打包成紧凑数组回传（ColBERT 多向量
+长度不一，原样 pickle 回传），按输入顺序拼回。
+对外是普通 EmbeddingProvider，index.py、CachedEmbeddingProvider 不需要改动。
+
+环境变量:
+  EMBEDDING_WORKERS=0            # worker 进程数；0/1 = 不启用（单进程）
+  EMBEDDING_WORKER_THREADS=0     # 每个 worker 的线程数；0 = 可用核数 / workers
+  EMBEDDING_PIN_CPUS=1           # 每个 worker 绑定互不重叠的核（仅 Linux）
+  EMBEDDING_WORKER_TIMEOUT=600   # 等待 worker 加载模型的秒数
+
+内存：每个 worker 各一份模型（BGE-M3 约 2.3 GB），按机器内存选择 worker 数。
+只建议索引时开启；mcp_server 的单条查询经过 IPC 反而更慢。
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+
+import numpy as np
+from qdrant_client import models
+
+from embedding_provider import EmbeddingProvider, estimate_tokens
+
+log = logging.getLogger(__name__)
+
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", "0"))
+EMBEDDING_WORKER_THREADS = int(os.environ.get("EMBEDDING_WORKER_THREADS", "0"))
+EMBEDDING_PIN_CPUS = os.environ.get("EMBEDDING_PIN_CPUS", "1") != "0"
+EMBEDDING_WORKER_TIMEOUT = float(os.environ.get("EMBEDDING_WORKER_TIMEOUT", "600"))
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+# ── worker 端 ─────────────────────────────────────────────────────
+
+def _local_factory(model_name: str, threads: int) -> EmbeddingProvider:
+    import torch
+    torch.set_num_threads(threads)
+    from embedding_provider import LocalBGEM3Provider
+    return LocalBGEM3Provider(model_name)
+
+
+def _onnx_factory(model_name: str, threads: int) -> EmbeddingProvider:
+    from onnx_backend import OnnxBGEM3Provider
+    return OnnxBGEM3Provider(model_name=model_name, threads=threads)
+
+
+def model_factory(provider_type: str, model_name: str) -> Callable[[int], EmbeddingProvider]:
+    """返回可 pickle 的 factory(threads) → provider，在 worker 进程内调用。"""
+    factory = _onnx_factory if provider_type == "onnx" else _local_factory
+    return partial(factory, model_name)
+
+
+def pack_lexical(weights: Optional[list[dict]]) -> Optional[tuple]:
+    """list[{token_id_str: weight}] → (每条长度, token ids, weights) 三个数组。"""
+    if weights is None:
+        return None
+    lens = np.fromiter((len(w) for w in weights), dtype=np.int32, count=len(weights))
+    total = int(lens.sum())
+    ids = np.fromiter((int(k) for w in weights for k in w), dtype=np.int32, count=total)
+    vals = np.fromiter((v for w in weights for v in w.values()), dtype=np.float32, count=total)
+    return lens, ids, vals
+
+
+def unpack_lexical(packed: tuple) -> list[dict]:
+    lens, ids, vals = packed
+    out, pos = [], 0
+    id_list, val_list = ids.tolist(), vals.tolist()
+    for n in lens.tolist():
+        out.append(dict(zip(map(str, id_list[pos:pos + n]), val_list[pos:pos + n])))
+        pos += n
+    return out
+
+
+def _worker_main(factory: Callable[[int], EmbeddingProvider], threads: int,
+                 cpus: Optional[list[int]], tasks, results) -> None:
+    # 必须在 import torch / onnxruntime 之前设置
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    try:
+        provider = factory(threads)
+        dim = np.asarray(provider.encode_texts(["warm up"])["dense_vecs"]).shape[1]
+    except BaseException:
+        results.put(("error", None, traceback.format_exc()))
+        return
+    results.put(("ready", None, (provider.model_id, dim, provider.colbert)))
+
+    shm = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job, shm_name, capacity, rows, texts, batch_size = task
+        try:
+            out = provider.encode_texts(texts, batch_size=batch_size)
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            dense = np.ndarray((capacity, dim), dtype=np.float32, buffer=shm.buf)
+            dense[rows] = out["dense_vecs"]
+            del dense  # 释放对 shm.buf 的引用，否则之后无法 close
+            results.put(("done", job, (rows, pack_lexical(out["lexical_weights"]),
+                                       out.get("colbert_vecs"))))
+        except BaseException:
+            results.put(("error", job, traceback.format_exc()))
+    if shm is not None:
+        shm.close()
+
+
+# ── 主进程端 ──────────────────────────────────────────────────────
+
+def _cpu_slices(workers: int, threads: int) -> list[list[int]]:
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    return [[cpus[(i * threads + k) % len(cpus)] for k in range(threads)] for i in range(workers)]
+
+
+class DataParallelProvider(EmbeddingProvider):
+    """N 个 worker 进程各持一份模型，encode_texts 分片并行、按输入顺序汇总。"""
+
+    def __init__(self, factory: Callable[[int], EmbeddingProvider], workers: int,
+                 threads: int = EMBEDDING_WORKER_THREADS, pin_cpus: bool = EMBEDDING_PIN_CPUS,
+                 start_timeout: float = EMBEDDING_WORKER_TIMEOUT):
+        ctx = multiprocessing.get_context("spawn")
+        available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (
+            os.cpu_count() or 1)
+        threads = threads or max(1, available // workers)
+        slices = _cpu_slices(workers, threads) if pin_cpus else [None] * workers
+        log.info(f"启动 {workers} 个 embedding worker，每个 {threads} 线程"
+                 f"{'（绑定 CPU）' if pin_cpus else ''}")
+
+        self._results = ctx.Queue()
+        self._tasks = []
+        self._procs = []
+        for cpus in slices:
+            tasks = ctx.Queue()
+            proc = ctx.Process(target=_worker_main, daemon=True,
+                               args=(factory, threads, cpus, tasks, self._results))
+            proc.start()
+            self._tasks.append(tasks)
+            self._procs.append(proc)
+
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._capacity = 0
+        self._job = 0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+        model_ids = set()
+        for _ in range(workers):
+            kind, _, payload = self._get(start_timeout)
+            if kind == "error":
+                self.close()
+                raise RuntimeError(f"embedding worker 启动失败:\n{payload}")
+            model_ids.add(payload[0])
+            self._dim = payload[1]
+            self.colbert = payload[2]
+        self.model_id = model_ids.pop()
+
+    def _get(self, timeout: Optional[float] = None):
+        """从结果队列取一条消息；worker 异常退出时报错而不是一直等。"""
+        waited = 0.0
+        while True:
+            try:
+                return self._results.get(timeout=1.0)
+            except queue.Empty:
+                waited += 1.0
+                dead = [p.pid for p in self._procs if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"embedding worker 进程退出: pid {dead}")
+                if timeout is not None and waited >= timeout:
+                    raise TimeoutError(f"embedding worker {timeout:.0f}s 内无响应")
+
+    def _buffer(self, n: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._capacity < n:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._capacity = max(n, self._capacity * 2)
+            self._shm = shared_memory.SharedMemory(create=True, size=self._capacity * self._dim * 4)
+        return self._shm
+
+    def encode_texts(self, texts: list[str], batch_size: int = 256) -> dict:
+        if not texts:
+            empty = {"dense_vecs": np.zeros((0, self._dim), dtype=np.float32),
+                     "lexical_weights": []}
+            return {**empty, "colbert_vecs": []} if self.colbert else empty
+        with self._lock:
+            shm = self._buffer(len(texts))
+            self._job += 1
+            # 按长度降序后轮流分给各 worker，每个分片的长度分布相近，负载均衡
+            order = sorted(range(len(texts)), key=lambda i: -estimate_tokens(texts[i]))
+            shards = [order[w::len(self._procs)] for w in range(len(self._procs))]
+            shards = [s for s in shards if s]
+            for tasks, shard in zip(self._tasks, shards):
+                tasks.put((self._job, shm.name, self._capacity, np.asarray(shard, dtype=np.int64),
+                           [texts[i] for i in shard], batch_size))
+
+            lexical: Optional[list] = [None] * len(texts)
+            multi: list = [None] * len(texts)
+            errors = []
+            pending = len(shards)
+            while pending:
+                kind, job, payload = self._get()
+                if job != self._job:
+                    continue
+                pending -= 1
+                if kind == "error":
+                    errors.append(payload)
+                    continue
+                rows, packed, colbert_vecs = payload
+                for i, vecs in zip(rows.tolist(), colbert_vecs or []):
+                    multi[i] = vecs
+                if packed is None:
+                    lexical = None
+                elif lexical is not None:
+                    for i, weights in zip(rows.tolist(), unpack_lexical(packed)):
+                        lexical[i] = weights
+            # 等所有分片结束再报错，避免迟到的写入污染下一次调用的共享内存
+            if errors:
+                raise RuntimeError(f"embedding worker 编码失败:\n{errors[0]}")
+            view = np.ndarray((self._capacity, self._dim), dtype=np.float32, buffer=shm.buf)
+            dense = view[:len(texts)].copy()
+            del view
+        out = {"dense_vecs": dense, "lexical_weights": lexical}
+        return {**out, "colbert_vecs": multi} if self.colbert else out
+
+    def encode_query(self, query: str) -> dict:
+        out = self.encode_texts([query])
+        sparse = out["lexical_weights"][0] if out["lexical_weights"] is not None else None
+        q = {
+            "dense_vec": out["dense_vecs"][0].tolist(),
+            "sparse_vec": models.SparseVector(
+                indices=list(map(int, sparse.keys())),
+                values=list(sparse.values()),
+            ) if sparse is not None else None,
+        }
+        if self.colbert:
+            q["colbert_vec"] = np.asarray(out["colbert_vecs"][0], dtype=np.float32).tolist()
+        return q
+
+    def close(self) -> None:
+        for tasks, proc in zip(self._tasks, self._procs):
+            if proc.is_alive():
+                tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+        self._tasks = []
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -78,8 +78,8 @@ if $DRY_RUN; then
     echo "[dry-run] 以下步骤将被执行:"
     $SKIP_PREPROCESS || echo "  1. LLM 预处理: $VENV scripts/doc_preprocess.py --dir $SOURCE_DIR"
     echo "  2. 同步文档: rsync $SOURCE_DIR/ → $KB_REPO/docs/$DOC_SUBDIR/"
-    $SKIP_INDEX || echo "  3. 全量索引: $VENV scripts/index.py --full $KB_REPO/docs/$DOC_SUBDIR"
-    echo "  4. 导出快照: $VENV scripts/index.py --snapshot-export $SNAPSHOT_PATH"
+    $SKIP_INDEX || echo "  3. 全量索引: $VENV scripts/index.py --rebuild $KB_REPO/docs/$DOC_SUBDIR"
+    echo "  4. 导出快照: $VENV scripts/index.py --snapshot-export $SNAPSHOT_PATH (+ --snapshot-verify)"
     echo "  5. Git commit + push: $KB_REPO"
     exit 0
 fi
@@ -102,11 +102,11 @@ rsync -a --delete "$SOURCE_DIR/" "$KB_REPO/docs/$DOC_SUBDIR/"
 DOC_COUNT=$(find "$KB_REPO/docs/$DOC_SUBDIR" -name "*.md" | wc -l)
 echo "同步完成: $DOC_COUNT 个 markdown 文件"
 
-# Step 3: 全量索引（从 KB 仓库路径索引，确保 Qdrant 中的 path 在本地和 CI 都可用）
+# Step 3: 全量索引（蓝绿重建，别名原子切换；从 KB 仓库路径索引，确保 Qdrant 中的 path 在本地和 CI 都可用）
 if ! $SKIP_INDEX; then
     echo ""
     echo "── Step 3/5: 全量索引 ──"
-    $VENV "$PROJECT_ROOT/scripts/index.py" --full "$KB_REPO/docs/$DOC_SUBDIR"
+    $VENV "$PROJECT_ROOT/scripts/index.py" --rebuild "$KB_REPO/docs/$DOC_SUBDIR"
 else
     echo ""
     echo "── Step 3/5: 全量索引 [跳过] ──"
@@ -116,7 +116,9 @@ fi
 echo ""
 echo "── Step 4/5: 导出 Qdrant 快照 ──"
 mkdir -p "$KB_REPO/snapshots"
+# 流式分块下载，中断后重跑会续传；旁边生成 knowledge-base.snapshot.manifest.json
 $VENV "$PROJECT_ROOT/scripts/index.py" --snapshot-export "$SNAPSHOT_PATH"
+$VENV "$PROJECT_ROOT/scripts/index.py" --snapshot-verify "$SNAPSHOT_PATH"
 
 # Step 5: Git commit + push
 echo ""
@@ -132,9 +134,10 @@ if git diff --cached --quiet; then
     echo "无变更，跳过 commit"
 else
     SNAP_SIZE=$(du -h "$SNAPSHOT_PATH" | cut -f1)
+    SNAP_SHA=$(sed -n 's/.*"sha256": "\([0-9a-f]*\)".*/\1/p' "$SNAPSHOT_PATH.manifest.json")
     git commit -m "$COMMIT_MSG
 
-$DOC_COUNT markdown files, snapshot $SNAP_SIZE
+$DOC_COUNT markdown files, snapshot $SNAP_SIZE (sha256 ${SNAP_SHA:0:12})
 
 Generated with [Claude Code](https://claude.ai/code)
 via [Happy](https://happy.engineering)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""共享 Qdrant client 工厂：进程内复用连接池，可选 gRPC 传输。
+
+QdrantClient 内部持有 httpx 连接池（gRPC 模式为 channel 池），每次新建 client
+都要重新建连接、做版本检查。index.py / mcp_server.py / eval_retrieval.py 统一
+通过 get_qdrant_client() 取进程内单例；workers 经 mcp_server 间接复用。
+
+gRPC 模式下向量以 protobuf 二进制传输，省掉 REST 的 JSON 浮点编解码，
+批量写入和带向量的查询收益最大（对比见 bench_qdrant.py）。
+
+环境变量:
+  QDRANT_URL=http://localhost:6333
+  QDRANT_API_KEY=               # 可选
+  QDRANT_PREFER_GRPC=0          # 1 = 走 gRPC（需 server 开放 QDRANT_GRPC_PORT）
+  QDRANT_GRPC_PORT=6334
+  QDRANT_POOL_SIZE=8            # REST 连接池大小 / gRPC channel 数
+  QDRANT_TIMEOUT=60             # 单次请求超时（秒）
+  VECTOR_BACKEND=qdrant         # numpy = 进程内 NumPy 后端
+
+快照上传/下载等 REST 专用接口仍直接使用 QDRANT_URL。
+
+VECTOR_BACKEND=numpy 时 get_qdrant_client() 改为返回进程内的 NumpyVectorClient
+（QdrantClient 接口子集，数据在 NUMPY_BACKEND_PATH，见 numpy_backend.py），
+不需要 Qdrant server。
+"""
+
+import os
+import threading
+from typing import Optional
+
+from qdrant_client import QdrantClient
+
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY") or None
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "0") == "1"
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", "6334"))
+QDRANT_POOL_SIZE = int(os.environ.get("QDRANT_POOL_SIZE", "8"))
+QDRANT_TIMEOUT = int(os.environ.get("QDRANT_TIMEOUT", "60"))
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "qdrant")
+
+_clients: dict[tuple, QdrantClient] = {}
+_lock = threading.Lock()
+
+
+def new_qdrant_client(url: Optional[str] = None, prefer_grpc: Optional[bool] = None,
+                      pool_size: int = QDRANT_POOL_SIZE) -> QdrantClient:
+    """新建一个 client（不缓存）。一般应使用 get_qdrant_client()。"""
+    return QdrantClient(
+        url=url or QDRANT_URL,
+        api_key=QDRANT_API_KEY,
+        prefer_grpc=QDRANT_PREFER_GRPC if prefer_grpc is None else prefer_grpc,
+        grpc_port=QDRANT_GRPC_PORT,
+        pool_size=pool_size,
+        timeout=QDRANT_TIMEOUT,
+    )
+
+
+def get_qdrant_client(url: Optional[str] = None,
+                      prefer_grpc: Optional[bool] = None) -> QdrantClient:
+    """返回进程内共享的 client，同一 (url, 传输方式) 只建一次，线程安全。
+
+    按 pid 区分，fork 出的子进程不会复用父进程的连接。
+    VECTOR_BACKEND=numpy 时忽略参数，返回进程内共享的 NumpyVectorClient。
+    """
+    if VECTOR_BACKEND == "numpy":
+        return _numpy_client()
+    url = url or QDRANT_URL
+    prefer_grpc = QDRANT_PREFER_GRPC if prefer_grpc is None else prefer_grpc
+    key = (url, prefer_grpc, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = new_qdrant_client(url, prefer_grpc)
+    return client
+
+
+def _numpy_client():
+    from numpy_backend import NUMPY_BACKEND_PATH, NumpyVectorClient
+    key = ("numpy", NUMPY_BACKEND_PATH, os.getpid())
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = NumpyVectorClient(NUMPY_BACKEND_PATH)
+    return client
+
+
+def close_qdrant_clients() -> None:
+    """关闭并清空本进程缓存的 client。"""
+    with _lock:
+        for key, client in list(_clients.items()):
+            if key[2] == os.getpid():
+                client.close()
+            del _clients[key]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""检索计划：多路召回 → 融合 → 可选重打分，编译成一次嵌套的 Qdrant query_points。
+
+  plan = QueryPlan(limit=15, filter=scope)
+  plan.add("dense", dense_vec, "dense", params=search_params)  # 可选：量化检索参数
+  plan.add("sparse", sparse_vec, "sparse")
+  plan.add("bm25", bm25_vec, "bm25")
+  plan.rescore(dense_vec, "dense")          # 可选：融合后的候选再按某路向量重打分
+  results = plan.run(client, COLLECTION)
+
+编译结果（两路以上召回、带重打分时）：
+
+  query_points(
+      prefetch=[Prefetch(prefetch=[dense, sparse, bm25], query=RRF, limit=fused_limit)],
+      query=<rescore 向量>, using=<rescore 向量名>, limit=limit)
+
+各路召回、融合、重打分都在 Qdrant 服务端完成，中间结果不回到 Python。只有一路召回时
+退化为普通的单向量查询（分数保持原始相似度）。新增召回信号只需再 add 一路，
+不增加往返次数。
+"""
+
+from typing import Optional
+
+from qdrant_client import models
+
+CANDIDATES = 20  # 每路召回的候选数
+
+
+def _and(*filters: Optional[models.Filter]) -> Optional[models.Filter]:
+    filters = [f for f in filters if f is not None]
+    if len(filters) <= 1:
+        return filters[0] if filters else None
+    return models.Filter(must=filters)
+
+
+class QueryPlan:
+    """一次 query_points 内完成的检索计划。"""
+
+    def __init__(self, limit: int, filter: Optional[models.Filter] = None,
+                 candidates: int = CANDIDATES, fusion: models.Fusion = models.Fusion.RRF):
+        self.limit = limit
+        self.filter = filter
+        self.candidates = candidates
+        self.fusion = fusion
+        self.signals: list[tuple[str, models.Prefetch]] = []
+        self._rescore: Optional[tuple] = None
+
+    def add(self, name: str, query, using: str, filter: Optional[models.Filter] = None,
+            limit: Optional[int] = None,
+            params: Optional[models.SearchParams] = None) -> "QueryPlan":
+        """加一路召回。filter 与计划的 filter 同时生效（AND）。
+
+        params 是这一路的检索参数，如量化 collection 的 oversampling / rescore
+        （见 collection_profiles.search_params）。
+        """
+        self.signals.append((name, models.Prefetch(
+            query=query, using=using, filter=_and(self.filter, filter),
+            limit=limit or self.candidates, params=params,
+        )))
+        return self
+
+    def rescore(self, query, using: str,
+                params: Optional[models.SearchParams] = None) -> "QueryPlan":
+        """融合后的候选按 using 向量重新打分排序（如 dense 余弦、多向量 MaxSim）。"""
+        self._rescore = (query, using, params)
+        return self
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name, _ in self.signals]
+
+    def request(self) -> dict:
+        """编译为 query_points 的关键字参数（不含 collection_name）。"""
+        if not self.signals:
+            raise ValueError("检索计划没有任何召回信号")
+        if len(self.signals) == 1:
+            stage = self.signals[0][1]
+            if self._rescore is None:
+                return {"query": stage.query, "using": stage.using,
+                        "query_filter": stage.filter, "limit": self.limit,
+                        **({"search_params": stage.params} if stage.params else {})}
+            prefetch = [stage]
+        else:
+            fused = {"prefetch": [p for _, p in self.signals],
+                     "query": models.FusionQuery(fusion=self.fusion)}
+            if self._rescore is None:
+                return {**fused, "limit": self.limit}
+            prefetch = [models.Prefetch(**fused, limit=max(self.limit, self.candidates))]
+        query, using, params = self._rescore
+        return {"prefetch": prefetch, "query": query, "using": using, "limit": self.limit,
+                **({"search_params": params} if params else {})}
+
+    def run(self, client, collection: str, **kwargs):
+        return client.query_points(collection_name=collection, **self.request(), **kwargs)
+
+    def describe(self) -> str:
+        """计划的简短描述，用于日志 / 耗时记录，如 "rrf(dense,sparse,bm25)>dense"。"""
+        text = self.names[0] if len(self.signals) == 1 else \
+            f"{self.fusion.value}({','.join(self.names)})"
+        return f"{text}>{self._rescore[1]}" if self._rescore else text
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Cross-encoder rerank 的自适应调度。
+
+CPU 上 reranker 是查询延迟的大头，这里尽量少送、送短：
+  1. RRF 分差已经足够悬殊（top_k 与其后的候选拉开 RERANK_SKIP_RATIO 倍）→ 跳过 rerank
+  2. 候选文本截取与查询词最匹配的段落窗口（RERANK_PASSAGE_CHARS），而不是整个 chunk
+  3. 按 RRF 顺序每批 top_k 个打分，新一批没有改变 top_k 集合即停止（候选通常只有
+     3×top_k 个，批大小倍增的话第二批就打完全部候选，提前停止永远不会发生）
+  4. 每次调用可设时间预算（毫秒）和候选数上限
+
+环境变量:
+  RERANK_SKIP_RATIO=2.0        # 0 关闭跳过逻辑
+  RERANK_PASSAGE_CHARS=1200    # 段落窗口长度，0 表示不截取
+  RERANK_BUDGET_MS=0           # 默认时间预算，0 表示不限
+"""
+
+import os
+import re
+import time
+from typing import Callable, Optional
+
+RERANK_SKIP_RATIO = float(os.environ.get("RERANK_SKIP_RATIO", "2.0"))
+RERANK_PASSAGE_CHARS = int(os.environ.get("RERANK_PASSAGE_CHARS", "1200"))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "0"))
+
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9_\-.]*")
+_CJK_RE = re.compile(r"[一-鿿]+")
+_PARA_RE = re.compile(r"\n\s*\n")
+
+
+def query_terms(query: str) -> set[str]:
+    """查询词：英文/数字单词（≥2 字符）+ 中文二元组。"""
+    q = query.lower()
+    terms = {w.strip(".-") for w in _WORD_RE.findall(q)}
+    terms = {w for w in terms if len(w) >= 2}
+    for run in _CJK_RE.findall(q):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def best_passage(text: str, query: str, window: int = RERANK_PASSAGE_CHARS) -> str:
+    """返回 text 中查询词命中最多的 window 字符窗口（从段落边界开始）。"""
+    if window <= 0 or len(text) <= window:
+        return text
+    terms = query_terms(query)
+    if not terms:
+        return text[:window]
+    lower = text.lower()
+    starts = [0] + [m.end() for m in _PARA_RE.finditer(text) if m.end() < len(text)]
+    best_start, best_hits = 0, -1
+    for start in starts:
+        segment = lower[start:start + window]
+        hits = sum(segment.count(t) for t in terms)
+        if hits > best_hits:
+            best_start, best_hits = start, hits
+    return text[best_start:best_start + window]
+
+
+def rrf_decisive(rrf_scores: list[float], top_k: int, ratio: float = RERANK_SKIP_RATIO) -> bool:
+    """top_k 候选与第 top_k+1 个候选的 RRF 分数相差 ratio 倍以上时，rerank 不会改变结果集合。"""
+    if ratio <= 0 or len(rrf_scores) <= top_k:
+        return False
+    boundary, challenger = rrf_scores[top_k - 1], rrf_scores[top_k]
+    if challenger <= 0:
+        return boundary > 0
+    return boundary / challenger >= ratio
+
+
+def adaptive_rerank(
+    query: str,
+    texts: list[str],
+    rrf_scores: list[float],
+    score_fn: Callable[[list[tuple[str, str]]], list[float]],
+    top_k: int,
+    titles: Optional[list[str]] = None,
+    max_candidates: Optional[int] = None,
+    budget_ms: float = RERANK_BUDGET_MS,
+    skip_ratio: float = RERANK_SKIP_RATIO,
+    passage_chars: int = RERANK_PASSAGE_CHARS,
+) -> tuple[list[tuple[int, float]], dict]:
+    """按 RRF 顺序渐进式 rerank。
+
+    texts / rrf_scores（/ titles）按 RRF 排名排列，title 不参与截取、拼在段落前。
+    返回 ([(候选下标, 分数), ...], 统计)，列表保持 RRF 顺序，只包含实际打过分的候选。
+    跳过 rerank 时分数为相对 RRF 第一名的比值（(0, 1]，第一名为 1）：RRF 原始分数
+    只有 0.03～0.5，与 rerank 分数不在一个量级，按 min_score 比较会被误判为低分。
+    第一批（top_k 个）总会打分，预算只用来决定是否继续下一批。
+
+    统计中 stop 记录结束原因：skipped（RRF 分差悬殊，未 rerank）、stable（top_k 稳定，
+    提前停止）、budget（超出时间预算）、exhausted（候选全部打分）。
+    """
+    n = len(texts) if max_candidates is None else min(len(texts), max_candidates)
+    stats = {"skipped": False, "stop": "exhausted", "scored": 0, "batches": 0,
+             "elapsed_ms": 0.0}
+    if n == 0:
+        return [], stats
+
+    if rrf_decisive(rrf_scores[:n], top_k, skip_ratio):
+        stats["skipped"] = True
+        stats["stop"] = "skipped"
+        top = rrf_scores[0]
+        return [(i, rrf_scores[i] / top) for i in range(min(top_k, n))], stats
+
+    t0 = time.perf_counter()
+    scored: list[tuple[int, float]] = []
+    top_set: set[int] = set()
+    batch = max(1, top_k)
+    while stats["scored"] < n:
+        start = stats["scored"]
+        end = min(n, start + batch)
+        pairs = []
+        for i in range(start, end):
+            passage = best_passage(texts[i], query, passage_chars)
+            title = titles[i] if titles else ""
+            pairs.append((query, f"{title}\n{passage}" if title else passage))
+        scores = score_fn(pairs)
+        scored.extend(zip(range(start, end), (float(s) for s in scores)))
+        stats["scored"] = end
+        stats["batches"] += 1
+
+        new_top = {i for i, _ in sorted(scored, key=lambda x: -x[1])[:top_k]}
+        stable = new_top == top_set
+        top_set = new_top
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if stats["batches"] > 1 and stable and end < n:
+            stats["stop"] = "stable"
+            break
+        if budget_ms and elapsed_ms >= budget_ms and end < n:
+            stats["stop"] = "budget"
+            break
+
+    stats["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return scored, stats
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""MCP Server 进程内缓存：带 TTL 和容量上限的 LRU。
+
+hybrid_search 使用两级缓存：
+  1. 查询向量缓存：归一化 query → encode_query() 结果（与索引内容无关）
+  2. 结果缓存：(query, top_k, scope, ...) → 最终排序结果，随 collection 版本失效
+
+环境变量:
+  SEARCH_CACHE=1                # 0 关闭两级缓存
+  SEARCH_CACHE_TTL=600          # 条目存活秒数
+  QUERY_CACHE_SIZE=4096         # 查询向量缓存条目上限
+  RESULT_CACHE_SIZE=1024        # 结果缓存条目上限
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_MISSING = object()
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """查询归一化：NFC + 折叠空白。不改大小写（BGE-M3 区分大小写）。"""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", query)).strip()
+
+
+class TTLCache:
+    """线程安全的 LRU 缓存，条目超过 ttl 秒视为未命中。"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                stored_at, value = entry
+                if time.monotonic() - stored_at <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
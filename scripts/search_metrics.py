@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""hybrid_search 分阶段耗时统计。
+
+每次调用用 StageTimer 记录各阶段毫秒数和 Qdrant 网络往返次数，SearchMetrics 按阶段
+保存最近 SEARCH_METRICS_WINDOW 次的样本，给出滚动 p50/p95/p99 和每次调用的平均往返数。
+自适应 rerank 的结束原因（skipped / stable / budget / exhausted，见 rerank.py）和打分
+候选数同样按窗口统计，用来判断 rerank 延迟是跳过、提前停止还是全量打分造成的。
+
+阶段:
+  cache        结果缓存查询（含 collection 版本检查）
+  wait_ready   预热期间等待模型
+  encode       查询编码（含查询向量缓存）
+  qdrant       Qdrant query_points（检索计划编译成的一次嵌套查询，见 query_plan.py）
+  rerank       cross-encoder 自适应 rerank
+  serialize    排序合并 + JSON 序列化
+  total        整次调用
+
+环境变量:
+  SEARCH_METRICS_WINDOW=1000   # 每个阶段保留的样本数
+"""
+
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+from contextlib import contextmanager
+
+SEARCH_METRICS_WINDOW = int(os.environ.get("SEARCH_METRICS_WINDOW", "1000"))
+
+STAGES = ("cache", "wait_ready", "encode", "qdrant", "rerank", "serialize", "total")
+
+
+class StageTimer:
+    """单次调用的分阶段计时器，同名阶段多次进入时累加。"""
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.cache_hit = False
+        self.round_trips = 0  # 本次调用对 Qdrant 的请求数（含 collection 版本检查）
+        self.plan = ""        # 执行的检索计划（QueryPlan.describe()）
+        self.rerank: Optional[dict] = None  # adaptive_rerank 的统计（未 rerank 时为 None）
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - t) * 1000
+
+    def finish(self) -> dict:
+        """补上 total（已有则保留），返回保留一位小数的耗时表。"""
+        self.timings.setdefault("total", (time.perf_counter() - self._t0) * 1000)
+        return {k: round(v, 1) for k, v in self.timings.items()}
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """最近秩百分位数，sorted_values 须已排序且非空。"""
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))  # ceil(q/100 * n)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class SearchMetrics:
+    """线程安全的滚动耗时直方图，每个阶段一个定长窗口。"""
+
+    def __init__(self, window: int = SEARCH_METRICS_WINDOW):
+        self.window = window
+        self.calls = 0
+        self.cache_hits = 0
+        self._samples: dict[str, deque] = {}
+        self._round_trips: deque = deque(maxlen=window)
+        self._rerank: deque = deque(maxlen=window)  # (stop, scored)
+        self._lock = threading.Lock()
+
+    def record(self, timings: dict, cache_hit: bool = False, round_trips: int = 0,
+               rerank: Optional[dict] = None) -> None:
+        with self._lock:
+            self.calls += 1
+            self.cache_hits += cache_hit
+            self._round_trips.append(round_trips)
+            for stage, ms in timings.items():
+                self._samples.setdefault(stage, deque(maxlen=self.window)).append(ms)
+            if rerank is not None:
+                self._rerank.append((rerank["stop"], rerank["scored"]))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.cache_hits = 0
+            self._samples.clear()
+            self._round_trips.clear()
+            self._rerank.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            snapshot = {stage: sorted(values) for stage, values in self._samples.items()}
+            calls, cache_hits = self.calls, self.cache_hits
+            trips = list(self._round_trips)
+            reranks = list(self._rerank)
+        order = {s: i for i, s in enumerate(STAGES)}
+        stages = {}
+        for stage in sorted(snapshot, key=lambda s: order.get(s, len(order))):
+            values = snapshot[stage]
+            stages[stage] = {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 1),
+                "p95": round(percentile(values, 95), 1),
+                "p99": round(percentile(values, 99), 1),
+                "mean": round(sum(values) / len(values), 1),
+            }
+        return {
+            "calls": calls,
+            "cache_hits": cache_hits,
+            "window": self.window,
+            "round_trips": {
+                "mean": round(sum(trips) / len(trips), 2) if trips else 0.0,
+                "max": max(trips, default=0),
+            },
+            "stages_ms": stages,
+            "rerank": {
+                "stop": dict(Counter(stop for stop, _ in reranks)),
+                "scored_mean": round(sum(n for _, n in reranks) / len(reranks), 1)
+                if reranks else 0.0,
+            },
+        }
+
+
+def format_table(summary: dict) -> str:
+    """把 summary() 格式化为文本表格（eval 报告用）。"""
+    lines = [f"{'stage':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}"]
+    for stage, st in summary["stages_ms"].items():
+        lines.append(f"{stage:<12}{st['count']:>6}{st['p50']:>10.1f}{st['p95']:>10.1f}"
+                     f"{st['p99']:>10.1f}{st['mean']:>10.1f}")
+    trips = summary.get("round_trips")
+    if trips:
+        lines.append(f"Qdrant round trips/query: mean {trips['mean']}, max {trips['max']}")
+    rerank = summary.get("rerank")
+    if rerank and rerank["stop"]:
+        stops = ", ".join(f"{k} {v}" for k, v in sorted(rerank["stop"].items()))
+        lines.append(f"rerank stop: {stops}; mean scored {rerank['scored_mean']}")
+    return "\n".join(lines)
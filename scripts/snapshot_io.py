@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Qdrant 快照流式传输：分块下载 / 上传、SHA-256 清单、断点续传。
+
+快照动辄数 GB，一次性读进内存拼 multipart 或整体 urlretrieve 都不可控。这里
+两个方向都按 SNAPSHOT_CHUNK_MB 分块读写，内存占用与快照大小无关：
+
+- 下载写入 <快照>.part，中断后按已有字节数发 Range 请求续传（服务端不支持
+  Range、返回 200 时从头重下）。完成后分块计算 SHA-256、改名，并在旁边写
+  <快照>.manifest.json（文件名、大小、sha256、来源 collection / 快照名）。
+- 上传前按清单校验本地文件，multipart body 分块发送（Content-Length 预先算好），
+  并把 sha256 作为 checksum 参数交给服务端再校验一次。
+
+断点续传信息（下载 URL、来源 collection / 快照名）记在 <快照>.part.json，index.py
+--snapshot-export 重跑时优先复用服务端仍存在的同一个快照。
+
+环境变量:
+  SNAPSHOT_CHUNK_MB=8        # 读写分块大小
+  SNAPSHOT_RETRIES=5         # 下载中断后的续传次数
+  SNAPSHOT_PROGRESS_SEC=5    # 进度日志间隔（秒）
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from qdrant_pool import QDRANT_API_KEY, QDRANT_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_CHUNK = int(os.environ.get("SNAPSHOT_CHUNK_MB", "8")) * 1024 * 1024
+SNAPSHOT_RETRIES = int(os.environ.get("SNAPSHOT_RETRIES", "5"))
+SNAPSHOT_PROGRESS_SEC = float(os.environ.get("SNAPSHOT_PROGRESS_SEC", "5"))
+
+_MB = 1024 * 1024
+
+
+def manifest_path(snapshot: Path) -> Path:
+    return snapshot.with_name(snapshot.name + ".manifest.json")
+
+
+def _state_path(snapshot: Path) -> Path:
+    return snapshot.with_name(snapshot.name + ".part.json")
+
+
+def _part_path(snapshot: Path) -> Path:
+    return snapshot.with_name(snapshot.name + ".part")
+
+
+def _headers() -> dict:
+    return {"api-key": QDRANT_API_KEY} if QDRANT_API_KEY else {}
+
+
+class Progress:
+    """按时间间隔输出传输进度（字节数 / 百分比 / 吞吐）。"""
+
+    def __init__(self, label: str, total: Optional[int], done: int = 0,
+                 interval: float = SNAPSHOT_PROGRESS_SEC):
+        self.label = label
+        self.total = total
+        self.done = done
+        self._start_done = done
+        self._interval = interval
+        self._t0 = self._last = time.monotonic()
+
+    def add(self, n: int) -> None:
+        self.done += n
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self._log(now)
+
+    def finish(self) -> None:
+        self._log(time.monotonic())
+
+    def _log(self, now: float) -> None:
+        rate = (self.done - self._start_done) / _MB / max(now - self._t0, 1e-6)
+        if self.total:
+            log.info(f"  {self.label} {self.done / _MB:.1f}/{self.total / _MB:.1f} MB "
+                     f"({self.done / self.total:.0%}) {rate:.1f} MB/s")
+        else:
+            log.info(f"  {self.label} {self.done / _MB:.1f} MB {rate:.1f} MB/s")
+
+
+def file_sha256(path: Path, chunk_size: int = SNAPSHOT_CHUNK) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(chunk_size):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_manifest(snapshot: Path, sha256: str, extra: Optional[dict] = None) -> dict:
+    manifest = {
+        "file": snapshot.name,
+        "size": snapshot.stat().st_size,
+        "sha256": sha256,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **(extra or {}),
+    }
+    manifest_path(snapshot).write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n")
+    return manifest
+
+
+def verify_snapshot(snapshot: Path, chunk_size: int = SNAPSHOT_CHUNK) -> Optional[str]:
+    """按清单校验快照，返回 sha256；没有清单时返回 None。大小或摘要不符时抛 ValueError。"""
+    mpath = manifest_path(snapshot)
+    if not mpath.exists():
+        return None
+    manifest = json.loads(mpath.read_text())
+    size = snapshot.stat().st_size
+    if size != manifest["size"]:
+        raise ValueError(f"快照大小不符: {snapshot} {size} != 清单 {manifest['size']}")
+    digest = file_sha256(snapshot, chunk_size)
+    if digest != manifest["sha256"]:
+        raise ValueError(f"快照 SHA-256 不符: {snapshot} {digest} != 清单 {manifest['sha256']}")
+    return digest
+
+
+def load_resume_state(snapshot: Path) -> Optional[dict]:
+    """上次未完成下载的信息（{"url", "collection", "snapshot"}）；没有 .part 文件时返回 None。"""
+    state, part = _state_path(snapshot), _part_path(snapshot)
+    if not state.exists() or not part.exists():
+        return None
+    try:
+        return json.loads(state.read_text())
+    except ValueError:
+        return None
+
+
+def _clear_partial(snapshot: Path) -> None:
+    _part_path(snapshot).unlink(missing_ok=True)
+    _state_path(snapshot).unlink(missing_ok=True)
+
+
+def download_snapshot(url: str, out: Path, chunk_size: int = SNAPSHOT_CHUNK,
+                      retries: int = SNAPSHOT_RETRIES, **manifest_extra) -> dict:
+    """流式下载快照到 out，支持断点续传，完成后写清单并返回清单内容。
+
+    manifest_extra 原样写进清单，也记入续传状态（如服务端快照名）。
+    """
+    out.parent.mkdir(parents=True, exist_ok=True)
+    part = _part_path(out)
+    state = load_resume_state(out)
+    if state is None or state.get("url") != url:
+        _clear_partial(out)
+    _state_path(out).write_text(json.dumps({"url": url, **manifest_extra}))
+
+    for attempt in range(retries + 1):
+        offset = part.stat().st_size if part.exists() else 0
+        req = urllib.request.Request(url, headers=_headers())
+        if offset:
+            req.add_header("Range", f"bytes={offset}-")
+        try:
+            with urllib.request.urlopen(req, timeout=QDRANT_TIMEOUT) as resp:
+                if offset and resp.status != 206:
+                    log.info("  服务端不支持断点续传，重新下载")
+                    offset = 0
+                length = resp.headers.get("Content-Length")
+                total = offset + int(length) if length else None
+                progress = Progress("↓", total, offset)
+                if offset:
+                    log.info(f"  从 {offset / _MB:.1f} MB 处续传")
+                with open(part, "ab" if offset else "wb") as f:
+                    while block := resp.read(chunk_size):
+                        f.write(block)
+                        progress.add(len(block))
+                progress.finish()
+            if total is not None and part.stat().st_size != total:
+                raise ConnectionError(f"下载不完整: {part.stat().st_size}/{total} 字节")
+            break
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                break  # .part 已是完整文件（上次在改名前中断）
+            if e.code < 500 or attempt == retries:
+                raise
+            wait = min(2 ** attempt, 30)
+            log.warning(f"  下载失败: HTTP {e.code}, {wait}s 后重试 (attempt {attempt + 1})")
+            time.sleep(wait)
+        except (ConnectionError, TimeoutError, http.client.HTTPException, urllib.error.URLError) as e:
+            if attempt == retries:
+                raise
+            wait = min(2 ** attempt, 30)
+            log.warning(f"  下载中断: {e}, {wait}s 后续传 (attempt {attempt + 1})")
+            time.sleep(wait)
+
+    # 续传时前半段已落盘，统一在完成后整体算一次摘要
+    digest = file_sha256(part, chunk_size)
+    os.replace(part, out)
+    _state_path(out).unlink(missing_ok=True)
+    return write_manifest(out, digest, manifest_extra)
+
+
+class _MultipartBody:
+    """multipart/form-data body 的分块迭代器，文件部分边读边发。"""
+
+    def __init__(self, path: Path, field: str, boundary: str, chunk_size: int):
+        self._path = path
+        self._chunk_size = chunk_size
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{path.name}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{boundary}--\r\n".encode()
+        self.length = len(self._head) + path.stat().st_size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self._path, "rb") as f:
+            while block := f.read(self._chunk_size):
+                yield block
+        yield self._tail
+
+
+def upload_snapshot(url: str, snapshot: Path, checksum: Optional[str] = None,
+                    chunk_size: int = SNAPSHOT_CHUNK) -> dict:
+    """流式 POST 快照到 Qdrant 的 snapshots/upload 接口，返回响应 JSON。"""
+    if checksum:
+        sep = "&" if "?" in url else "?"
+        url = f"{url}{sep}checksum={checksum}"
+    parsed = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    # 上传完成后服务端还要解包、恢复，超时放宽
+    conn = conn_cls(parsed.netloc, timeout=max(QDRANT_TIMEOUT, 600))
+
+    boundary = "----SnapshotBoundary" + os.urandom(8).hex()
+    body = _MultipartBody(snapshot, "snapshot", boundary, chunk_size)
+    path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+    try:
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Type", f"multipart/form-data; boundary={boundary}")
+        conn.putheader("Content-Length", str(body.length))
+        for k, v in _headers().items():
+            conn.putheader(k, v)
+        conn.endheaders()
+        progress = Progress("↑", body.length)
+        for block in body:
+            conn.send(block)
+            progress.add(len(block))
+        progress.finish()
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.status >= 300:
+            raise RuntimeError(f"快照上传失败: HTTP {resp.status} {data[:500]!r}")
+        return json.loads(data) if data else {}
+    finally:
+        conn.close()
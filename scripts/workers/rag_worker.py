@@ -23,10 +23,18 @@ import asyncio
 import json
 import logging
 import os
+import sys
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from claude_agent_sdk import query, ClaudeAgentOptions
 
+# 添加 scripts 目录到路径
+SCRIPT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from mcp_shim import mcp_servers_config
+
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger(__name__)
 
@@ -78,12 +86,8 @@ async def run_rag_task(
 
     # 启用 MCP Server (混合检索)
     if enable_mcp:
-        options.mcp_servers = {
-            "knowledge-base": {
-                "command": "python",
-                "args": [os.path.abspath("scripts/mcp_server.py")]
-            }
-        }
+        # 默认每会话独立的 stdio mcp_server；MCP_MODE=shim / http 共享一个 daemon
+        options.mcp_servers = mcp_servers_config(python="python")
 
     # 执行任务
     session_id = None
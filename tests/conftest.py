@@ -53,6 +53,19 @@ def pytest_collection_modifyitems(config, items):
                 item.add_marker(skip_qdrant)
 
 
+def pytest_sessionstart(session):
+    """记录测试开始前 MCP daemon 是否已在运行。"""
+    from mcp_shim import daemon_alive
+    session.config._mcp_daemon_preexisting = daemon_alive()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """停止测试期间（shim / http 模式的会话）拉起的 MCP daemon，避免 CI 残留常驻进程。"""
+    from mcp_shim import daemon_alive, stop_daemon
+    if not getattr(session.config, "_mcp_daemon_preexisting", True) and daemon_alive():
+        stop_daemon()
+
+
 @pytest.fixture(scope="session")
 def project_root():
     """Return the project root directory."""
@@ -28,6 +28,7 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent
 
 # 导入评测模块
 sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from mcp_shim import mcp_servers_config
 from eval_module import extract_contexts, gate_check, get_tools_used, get_retrieved_doc_paths, get_kb_commit, llm_judge, extract_turn_timings
 
 # 导入测试用例
@@ -188,16 +189,14 @@ hybrid_search 返回的 path 字段是文档的实际路径，用 Read(file_path
             "mcp__knowledge-base__index_status",
         ],
         disallowed_tools=["Bash", "Write", "Edit", "NotebookEdit", "Task"],
-        mcp_servers={
-            "knowledge-base": {
-                "command": sys.executable,
-                "args": [str(PROJECT_ROOT / "scripts" / "mcp_server.py")],
-                "env": {
-                    "QDRANT_URL": os.environ.get("QDRANT_URL", "http://localhost:6333"),
-                    "COLLECTION_NAME": os.environ.get("COLLECTION_NAME", "knowledge-base"),
-                },
-            }
-        },
+        # 默认每会话独立的 stdio mcp_server，MCP_MODE=shim 经 shim 共享一个 daemon
+        mcp_servers=mcp_servers_config(
+            python=sys.executable,
+            env={
+                "QDRANT_URL": os.environ.get("QDRANT_URL", "http://localhost:6333"),
+                "COLLECTION_NAME": os.environ.get("COLLECTION_NAME", "knowledge-base"),
+            },
+        ),
         system_prompt=SEARCH_SYSTEM_PROMPT,
         permission_mode="bypassPermissions",
         cwd=str(PROJECT_ROOT),
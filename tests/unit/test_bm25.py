@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""bm25 分词 / BM25F 向量，以及 keyword_search 与外部 API 模式 hybrid_search 的词法检索。"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+pytest.importorskip("mcp.server.fastmcp")
+
+import bm25  # noqa: E402
+import index  # noqa: E402
+import mcp_server  # noqa: E402
+from test_index_pipeline import FakeProvider, LockedClient  # noqa: E402
+
+DOCS = [
+    ("config", "CONFIG GET 可以读取任意配置项，CONFIG REWRITE 把配置写回 redis.conf。"),
+    ("policy", "Kubernetes 的 NetworkPolicy 限制 Pod 之间的流量，policy 按标签选择。"),
+    ("memory", "maxmemory 设置 Redis 可用内存上限，超过上限时按淘汰策略处理写入。"),
+    ("eviction", "运行时修改淘汰策略：CONFIG SET maxmemory-policy allkeys-lru，无需重启。"),
+]
+
+
+class CountingClient(LockedClient):
+    def __init__(self, client):
+        super().__init__(client)
+        self.calls: list[str] = []
+
+    def __getattr__(self, name):
+        if name in ("query_points", "scroll"):
+            self.calls.append(name)
+        return super().__getattr__(name)
+
+
+class QueryProvider:
+    """外部 API 模式：只有 dense 向量。"""
+
+    def encode_query(self, query):
+        return {"dense_vec": [1.0] + [0.0] * 1023, "sparse_vec": None}
+
+
+class FakeReranker:
+    def compute_score(self, pairs, batch_size=32, normalize=False):
+        return [0.0] * len(pairs)
+
+
+def _chunks():
+    return [{"doc_id": name, "chunk_id": f"{name}-000", "text": text,
+             "metadata": {"title": name, "section_path": name, "path": f"docs/{name}.md"}}
+            for name, text in DOCS]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    client = CountingClient(QdrantClient(":memory:"))
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: FakeProvider())
+    monkeypatch.setattr(mcp_server, "_qdrant", client)
+    monkeypatch.setattr(mcp_server, "_provider", QueryProvider())
+    monkeypatch.setattr(mcp_server, "_reranker", FakeReranker())
+    monkeypatch.setattr(mcp_server, "_collection_version", None)
+    monkeypatch.setattr(mcp_server, "_has_bm25", False)
+    monkeypatch.setattr(mcp_server, "_startup", {"state": "ready", "error": "", "phases_ms": {}})
+    mcp_server._query_cache.clear()
+    mcp_server._result_cache.clear()
+    return client
+
+
+def test_tokenize_cjk_bigrams_and_compound_terms():
+    assert bm25.tokenize("CONFIG SET maxmemory-policy") == [
+        "config", "set", "maxmemory-policy", "maxmemory", "policy"]
+    assert bm25.tokenize("淘汰策略，Ｒｅｄｉｓ 键") == ["淘汰", "汰策", "策略", "redis", "键"]
+    assert bm25.token_id("redis") == bm25.token_id("redis") < 2 ** 31
+
+
+def test_bm25f_weights_title_and_saturates_tf():
+    title = bm25.doc_vector({"title": "redis"})
+    body = bm25.doc_vector({"text": "redis"})
+    many = bm25.doc_vector({"text": "redis " * 50})
+    assert title.values[0] > body.values[0]
+    assert many.values[0] < bm25.BM25_K1 + 1
+
+
+def test_keyword_search_ranks_exact_command_first(server):
+    index.index_chunks(_chunks())
+    server.calls.clear()
+    out = json.loads(mcp_server.keyword_search("CONFIG SET maxmemory-policy", top_k=3))
+    assert [r["doc_id"] for r in out][0] == "eviction"
+    assert [r["score"] for r in out] == sorted((r["score"] for r in out), reverse=True)
+    assert server.calls == ["query_points"]
+
+
+def test_hybrid_fallback_uses_bm25_in_one_query(server):
+    index.index_chunks(_chunks())
+    server.calls.clear()
+    out = mcp_server.hybrid_search("maxmemory-policy 淘汰策略", top_k=2, include_timings=True)
+    assert "eviction" in out
+    assert server.calls == ["query_points"]
+    assert json.loads(out.split("[TIMINGS] ")[1])["plan"] == "rrf(dense,bm25)"
+
+
+def test_legacy_collection_falls_back_to_match_text(server):
+    server.create_collection(
+        index.COLLECTION,
+        vectors_config={"dense": models.VectorParams(size=1024, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    index.index_chunks(_chunks())
+    assert not bm25.has_bm25(server, index.COLLECTION)
+    out = json.loads(mcp_server.keyword_search("allkeys-lru"))
+    assert [r["doc_id"] for r in out] == ["eviction"]
+    assert "score" not in out[0]
@@ -7,7 +7,10 @@ from pathlib import Path
 # 让 import 能找到 scripts/
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
 
-from index import split_by_headings, merge_small_sections, _same_parent, _find_code_fence_ranges, _in_code_fence
+from index import (
+    split_by_headings, merge_small_sections, split_oversized_sections,
+    _same_parent, _find_code_fence_ranges, _in_code_fence, _split_blocks,
+)
 
 
 class TestSplitByHeadings:
@@ -242,3 +245,83 @@ class TestSameParent:
 
     def test_deep_different(self):
         assert _same_parent("A > B > C", "A > X > D") is False
+
+
+class TestSinglePassTokenizer:
+    """单遍分块：shortcode 清理、围栏状态。"""
+
+    def test_shortcodes_cleaned_in_same_pass(self):
+        content = ('## Pods\n\n{{< note >}}A {{< glossary_tooltip text="Pod" term_id="pod" >}} '
+                   'runs {{< glossary_tooltip term_id="container" >}}s.{{< /note >}}\n\n'
+                   '{{% code_sample file="pods/simple.yaml" %}}\n<!-- overview -->')
+        result = split_by_headings(content)
+        assert result == [{"text": "A Pod runs containers.\n\n[code: pods/simple.yaml]",
+                           "section_path": "Pods"}]
+
+    def test_shortcode_in_heading(self):
+        content = '## {{< glossary_tooltip text="Node" term_id="node" >}} status\n\ntext'
+        assert split_by_headings(content)[0]["section_path"] == "Node status"
+
+    def test_tilde_and_longer_fences(self):
+        content = "## A\n\n~~~\n# not heading\n~~~\n\n````md\n```\n# nested\n```\n````\n\n## B\n\nb"
+        paths = [s["section_path"] for s in split_by_headings(content)]
+        assert paths == ["A", "B"]
+
+    def test_unclosed_fence_does_not_swallow_headings(self):
+        content = "## A\n\n```\nstray fence\n\n## B\n\ntext b"
+        paths = [s["section_path"] for s in split_by_headings(content)]
+        assert paths == ["A", "B"]
+
+    def test_bare_hash_is_not_heading(self):
+        content = "## A\n\ntext\n\n#\n\nnext paragraph"
+        result = split_by_headings(content)
+        assert len(result) == 1
+        assert "next paragraph" in result[0]["text"]
+
+
+class TestSplitOversized:
+    """超长 section 按段落 / 代码块边界切分。"""
+
+    def test_short_sections_untouched(self):
+        sections = [{"text": "short", "section_path": "A"}]
+        assert split_oversized_sections(sections, max_chars=100) == sections
+
+    def test_split_on_paragraphs_with_overlap(self):
+        paras = [f"para {i} " + "x" * 40 for i in range(10)]
+        sections = [{"text": "\n\n".join(paras), "section_path": "A > B"}]
+        result = split_oversized_sections(sections, max_chars=150, overlap=60)
+        assert len(result) > 1
+        assert all(len(s["text"]) <= 150 for s in result)
+        assert all(s["section_path"] == "A > B" for s in result)
+        # 每个片段以完整段落开头，且与上一片段的结尾重叠
+        for prev, cur in zip(result, result[1:]):
+            first = cur["text"].split("\n\n")[0]
+            assert first in paras
+            assert prev["text"].endswith(first)
+        # 所有段落都被覆盖
+        joined = "\n\n".join(s["text"] for s in result)
+        assert all(p in joined for p in paras)
+
+    def test_code_block_not_split_on_blank_lines(self):
+        code = "```python\ndef a():\n    pass\n\n\ndef b():\n    pass\n```"
+        text = "intro " * 20 + "\n\n" + code + "\n\n" + "outro " * 20
+        result = split_oversized_sections([{"text": text, "section_path": ""}],
+                                          max_chars=130, overlap=0)
+        assert any(s["text"] == code for s in result)
+
+    def test_tilde_and_nested_fences_kept_whole(self):
+        tilde = "~~~yaml\n" + "\n\n".join(f"key{i}: v" for i in range(200)) + "\n~~~"
+        assert _split_blocks("intro\n\n" + tilde + "\n\nafter") == ["intro", tilde, "after"]
+        # ```` 围栏内的 ``` 不闭合外层围栏
+        nested = "````md\n```bash\nls\n```\n\ntext\n````"
+        assert _split_blocks(nested + "\n\nafter") == [nested, "after"]
+
+    def test_unclosed_fence_is_plain_text(self):
+        assert _split_blocks("a\n\n```\nb\n\nc") == ["a", "```\nb", "c"]
+
+    def test_huge_block_split_by_lines(self):
+        text = "\n".join("line %03d " % i + "y" * 30 for i in range(50))
+        result = split_oversized_sections([{"text": text, "section_path": ""}],
+                                          max_chars=200, overlap=0)
+        assert all(len(s["text"]) <= 200 for s in result)
+        assert "".join(s["text"] for s in result).count("line") == 50
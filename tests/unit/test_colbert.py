@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""ColBERT 多向量：token 池化、index.py 写入 / 复用，hybrid_search 按 MaxSim 重排（无 cross-encoder）。"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+pytest.importorskip("mcp.server.fastmcp")
+
+import bm25  # noqa: E402
+import colbert  # noqa: E402
+import index  # noqa: E402
+import mcp_server  # noqa: E402
+from test_bm25 import CountingClient  # noqa: E402
+from test_index_pipeline import FakeProvider  # noqa: E402
+
+DOCS = [
+    ("d1", "redis eviction policy"),
+    ("d2", "kubernetes pod restart"),
+    ("d3", "redis sentinel failover"),
+    ("d4", "mysql replication lag"),
+]
+
+
+def _token_vecs(text: str) -> np.ndarray:
+    """每个词一个 one-hot 向量：MaxSim = 查询词在文档中出现的个数。"""
+    words = text.lower().split()
+    vecs = np.zeros((len(words), 1024), dtype=np.float32)
+    for i, w in enumerate(words):
+        vecs[i, bm25.token_id(w) % 1024] = 1.0
+    return vecs
+
+
+class ColbertProvider(FakeProvider):
+    colbert = True
+
+    def encode_texts(self, texts, batch_size=256):
+        out = super().encode_texts(texts, batch_size)
+        return {**out, "colbert_vecs": [_token_vecs(t).astype(np.float16) for t in texts]}
+
+
+class ColbertQueryProvider:
+    colbert = True
+
+    def encode_query(self, query):
+        return {"dense_vec": [1.0] + [0.0] * 1023, "sparse_vec": None,
+                "colbert_vec": _token_vecs(query).tolist()}
+
+
+def _chunks():
+    return [{"doc_id": name, "chunk_id": f"{name}-000", "text": text,
+             "metadata": {"title": name, "path": f"docs/{name}.md"}}
+            for name, text in DOCS]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    client = CountingClient(QdrantClient(":memory:"))
+    monkeypatch.setattr(colbert, "COLBERT_ENABLED", True)
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: ColbertProvider())
+    monkeypatch.setattr(mcp_server, "_qdrant", client)
+    monkeypatch.setattr(mcp_server, "_provider", ColbertQueryProvider())
+    monkeypatch.setattr(mcp_server, "HYBRID_RESCORE", "colbert")
+    monkeypatch.setattr(mcp_server, "RERANK_ENABLED", False)
+    monkeypatch.setattr(mcp_server, "_collection_version", None)
+    monkeypatch.setattr(mcp_server, "_has_bm25", False)
+    monkeypatch.setattr(mcp_server, "_has_colbert", False)
+    monkeypatch.setattr(mcp_server, "_startup", {"state": "ready", "error": "", "phases_ms": {}})
+    mcp_server._query_cache.clear()
+    mcp_server._result_cache.clear()
+    return client
+
+
+def test_pool_bounds_vectors_and_renormalizes():
+    vecs = np.random.default_rng(0).standard_normal((300, 8)).astype(np.float32)
+    pooled = colbert.pool(vecs, max_vectors=128)
+    assert len(pooled) == 100  # 每 3 个一组
+    assert np.allclose(np.linalg.norm(pooled, axis=1), 1.0, atol=1e-5)
+    assert len(colbert.pool(vecs[:5], max_vectors=128)) == 5
+    assert colbert.upsert_batch_size(128) == 8
+
+
+def test_index_writes_multivectors_and_search_rescores_by_maxsim(server):
+    index.index_chunks(_chunks())
+    assert colbert.has_colbert(server, index.COLLECTION)
+    rec = server.retrieve(index.COLLECTION, [index._point_id("d3-000")], with_vectors=True)[0]
+    assert len(rec.vector[colbert.VECTOR_NAME]) == len("d3\nredis sentinel failover".split())
+
+    server.calls.clear()
+    out = mcp_server.hybrid_search("redis failover", top_k=2, include_timings=True)
+    results = json.loads(out.split("\n\n[SEARCH NOTE]")[0])
+    assert [r["doc_id"] for r in results] == ["d3", "d1"]
+    assert results[0]["score"] == pytest.approx(2.0, abs=1e-3)
+    assert server.calls == ["query_points"]
+    assert json.loads(out.split("[TIMINGS] ")[1])["plan"] == "rrf(dense,bm25)>colbert"
+
+
+def test_reuse_reembeds_chunks_without_multivectors(server):
+    server.create_collection(
+        "old", vectors_config={"dense": models.VectorParams(
+            size=1024, distance=models.Distance.COSINE)})
+    chunk = _chunks()[0]
+    pid = index._point_id(chunk["chunk_id"])
+    server.upsert("old", points=[models.PointStruct(id=pid, vector={"dense": [1.0] * 1024})])
+    extra = frozenset({bm25.VECTOR_NAME, colbert.VECTOR_NAME})
+    points, missing = index._reused_points(server, [(chunk, pid)], "old", extra)
+    assert points == [] and missing == [chunk]
+
+    points, missing = index._reused_points(server, [(chunk, pid)], "old",
+                                           frozenset({bm25.VECTOR_NAME}))
+    assert missing == [] and set(points[0].vector) == {"dense", bm25.VECTOR_NAME}
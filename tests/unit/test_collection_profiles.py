@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""collection 存储档位：建库配置、量化检索参数，以及 --migrate-profile 不重新编码地换档位。"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import bm25  # noqa: E402
+import collection_profiles  # noqa: E402
+import index  # noqa: E402
+from query_plan import QueryPlan  # noqa: E402
+from test_index_pipeline import FakeProvider, LockedClient, _chunks, _write_docs  # noqa: E402
+
+
+@pytest.fixture
+def env(monkeypatch):
+    client = LockedClient(QdrantClient(":memory:"))
+    provider = FakeProvider()
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: provider)
+    monkeypatch.setattr(index, "REBUILD_GC_DELAY", 0)
+    return client, provider
+
+
+def test_profiles_build_quantized_disk_configs():
+    default = collection_profiles.dense_params(collection_profiles.get_profile())
+    assert default.quantization_config is None and not default.on_disk
+    assert collection_profiles.search_params("default") is None
+    assert collection_profiles.search_params(None) is None
+
+    large = collection_profiles.get_profile("disk-large")
+    dense = collection_profiles.dense_params(large)
+    assert isinstance(dense.quantization_config, models.BinaryQuantization)
+    assert dense.on_disk and dense.hnsw_config.on_disk
+    assert dense.datatype == models.Datatype.FLOAT16
+    assert collection_profiles.sparse_index(large).on_disk
+    assert isinstance(collection_profiles.dense_params(
+        collection_profiles.get_profile("disk-pq")).quantization_config,
+        models.ProductQuantization)
+
+    params = collection_profiles.search_params("balanced")
+    assert params.quantization.rescore and params.quantization.oversampling == 2.0
+    with pytest.raises(ValueError, match="档位"):
+        collection_profiles.get_profile("huge")
+
+
+def test_plan_carries_search_params():
+    params = collection_profiles.search_params("ram-fast")
+    req = QueryPlan(limit=5).add("dense", [1.0, 0.0], "dense", params=params).request()
+    assert req["search_params"] is params
+    req = (QueryPlan(limit=5).add("dense", [1.0, 0.0], "dense", params=params)
+           .add("bm25", models.SparseVector(indices=[1], values=[1.0]), "bm25")
+           .rescore([1.0, 0.0], "dense", params=params).request())
+    assert [p.params for p in req["prefetch"][0].prefetch] == [params, None]
+    assert req["search_params"] is params
+
+
+def test_migrate_profile_copies_vectors_without_reembedding(env):
+    client, provider = env
+    # 建库早于 bm25 / 档位的旧 collection
+    client.create_collection(
+        index.COLLECTION,
+        vectors_config={"dense": models.VectorParams(size=1024, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    index.index_chunks(_chunks("a", 3) + _chunks("b", 2))
+    pid = index._point_id("a-001")
+    before = client.retrieve(index.COLLECTION, [pid], with_vectors=True)[0].vector
+    provider.calls.clear()
+
+    target = index.migrate_profile("disk-large", smoke=False)
+    assert provider.calls == []
+    assert index.resolve_alias(client, index.COLLECTION) == target
+    assert collection_profiles.collection_profile(client, index.COLLECTION) == "disk-large"
+    assert client.count(index.COLLECTION).count == 5
+    after = client.retrieve(index.COLLECTION, [pid], with_vectors=True)[0].vector
+    assert after["dense"] == pytest.approx(before["dense"])
+    assert after["sparse"] == before["sparse"]
+    # 旧 point 没有 bm25 向量，按 payload 补算
+    assert bm25.has_bm25(client, index.COLLECTION)
+    assert after[bm25.VECTOR_NAME].indices
+
+
+def test_rebuild_keeps_live_profile(env, tmp_path):
+    client, _ = env
+    docs = _write_docs(tmp_path, n_docs=2, sections=1)
+    index.index_rebuild(str(docs), smoke=False)
+    assert collection_profiles.collection_profile(client, index.COLLECTION) == "default"
+    index.migrate_profile("balanced", smoke=False)
+    index.index_rebuild(str(docs), smoke=False)
+    assert collection_profiles.collection_profile(client, index.COLLECTION) == "balanced"
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""embedding_cache 单元测试。"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from embedding_cache import CachedEmbeddingProvider, EmbeddingCache, cache_key
+from embedding_provider import EmbeddingProvider
+from qdrant_client import models
+
+
+class CountingProvider(EmbeddingProvider):
+    """记录送入模型的文本，按文本内容生成确定性向量。"""
+
+    def __init__(self, model_id="fake:m1", sparse=True):
+        self.model_id = model_id
+        self.sparse = sparse
+        self.encoded: list[str] = []
+
+    def _vec(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.random(8, dtype=np.float32)
+
+    def encode_texts(self, texts, batch_size=256):
+        self.encoded.extend(texts)
+        return {
+            "dense_vecs": np.stack([self._vec(t) for t in texts]),
+            "lexical_weights": [{"7": 0.25, str(len(t)): 0.5} for t in texts]
+            if self.sparse else None,
+        }
+
+    def encode_query(self, query):
+        self.encoded.append(query)
+        return {
+            "dense_vec": self._vec(query).tolist(),
+            "sparse_vec": models.SparseVector(indices=[7], values=[0.25])
+            if self.sparse else None,
+        }
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(tmp_path / "cache.sqlite", max_bytes=1 << 20)
+
+
+class TestCachedEmbeddingProvider:
+    def test_second_call_hits_cache(self, cache):
+        inner = CountingProvider()
+        provider = CachedEmbeddingProvider(inner, cache)
+        first = provider.encode_texts(["a", "b", "c"])
+        inner.encoded.clear()
+        second = provider.encode_texts(["c", "a", "b"])
+        assert inner.encoded == []
+        np.testing.assert_array_equal(second["dense_vecs"][0], first["dense_vecs"][2])
+        assert second["lexical_weights"][1] == first["lexical_weights"][0]
+
+    def test_only_misses_encoded_and_order_kept(self, cache):
+        inner = CountingProvider()
+        provider = CachedEmbeddingProvider(inner, cache)
+        provider.encode_texts(["a", "b"])
+        inner.encoded.clear()
+        out = provider.encode_texts(["x", "a", "x", "b"])
+        assert inner.encoded == ["x"]  # 未命中且去重
+        np.testing.assert_array_equal(out["dense_vecs"][0], out["dense_vecs"][2])
+        np.testing.assert_allclose(out["dense_vecs"][1], inner._vec("a"))
+
+    def test_normalized_text_shares_entry(self, cache):
+        inner = CountingProvider()
+        provider = CachedEmbeddingProvider(inner, cache)
+        provider.encode_texts(["hello"])
+        provider.encode_texts(["  hello\n"])
+        assert inner.encoded == ["hello"]
+
+    def test_models_do_not_share_entries(self, cache):
+        a = CountingProvider("fake:m1")
+        b = CountingProvider("fake:m2")
+        CachedEmbeddingProvider(a, cache).encode_texts(["t"])
+        CachedEmbeddingProvider(b, cache).encode_texts(["t"])
+        assert b.encoded == ["t"]
+
+    def test_dense_only_provider(self, cache):
+        inner = CountingProvider(sparse=False)
+        provider = CachedEmbeddingProvider(inner, cache)
+        provider.encode_texts(["a"])
+        out = provider.encode_texts(["a"])
+        assert out["lexical_weights"] is None
+
+    def test_query_roundtrip(self, cache):
+        inner = CountingProvider()
+        provider = CachedEmbeddingProvider(inner, cache)
+        first = provider.encode_query("what is redis")
+        second = provider.encode_query("what is redis")
+        assert inner.encoded == ["what is redis"]
+        np.testing.assert_allclose(second["dense_vec"], first["dense_vec"])
+        assert second["sparse_vec"].indices == [7]
+
+    def test_persists_across_instances(self, tmp_path):
+        path = tmp_path / "cache.sqlite"
+        CachedEmbeddingProvider(CountingProvider(), EmbeddingCache(path, 1 << 20)) \
+            .encode_texts(["a"])
+        inner = CountingProvider()
+        CachedEmbeddingProvider(inner, EmbeddingCache(path, 1 << 20)).encode_texts(["a"])
+        assert inner.encoded == []
+
+
+class TestEviction:
+    def test_size_bounded(self, tmp_path):
+        # 每条 8 floats dense + 1 项 sparse = 40 bytes
+        cache = EmbeddingCache(tmp_path / "c.sqlite", max_bytes=400)
+        for i in range(30):
+            cache.put_many([(f"k{i}", np.ones(8, dtype=np.float32), {"1": 0.5})])
+        stats = cache.stats()
+        assert stats["bytes"] <= 400
+        assert stats["entries"] < 30
+        # 最新写入的保留，最早的被淘汰
+        assert "k29" in cache.get_many(["k29"])
+        assert "k0" not in cache.get_many(["k0"])
+
+    def test_recent_hit_survives_eviction(self, tmp_path):
+        cache = EmbeddingCache(tmp_path / "c.sqlite", max_bytes=400)
+        for i in range(10):
+            cache.put_many([(f"k{i}", np.ones(8, dtype=np.float32), {"1": 0.5})])
+        assert "k0" in cache.get_many(["k0"])  # 访问时间随下一次写入提交
+        cache.put_many([("k10", np.ones(8, dtype=np.float32), {"1": 0.5})])
+        assert "k0" in cache.get_many(["k0"])
+        assert "k1" not in cache.get_many(["k1"])
+
+    def test_hot_path_skips_full_scans(self, tmp_path):
+        cache = EmbeddingCache(tmp_path / "c.sqlite", max_bytes=1 << 20)
+        cache.put_many([("a", np.ones(8, dtype=np.float32), None)])
+        statements: list[str] = []
+        cache._db.set_trace_callback(statements.append)
+        for _ in range(20):
+            cache.get_many(["a"])
+        assert not any(s.startswith("UPDATE") for s in statements)  # 命中不逐次写访问时间
+        for i in range(20):
+            cache.put_many([(f"k{i}", np.ones(8, dtype=np.float32), None)])
+        assert not any("SUM(" in s for s in statements)
+
+    def test_cache_key_depends_on_model(self):
+        assert cache_key("m1", "x") != cache_key("m2", "x")
+        assert cache_key("m1", "x") == cache_key("m1", " x ")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""embedding_provider 分桶批处理测试（用假模型 / 假 API client，不加载真实模型）。"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from embedding_provider import (  # noqa: E402
+    LocalBGEM3Provider, OpenAICompatibleProvider, estimate_tokens, token_budget_batches,
+)
+
+
+class TestTokenBudgetBatches:
+    def test_padded_cost_within_budget(self):
+        lengths = [5, 100, 7, 90, 6, 8, 95]
+        groups = token_budget_batches(lengths, max_tokens=200, max_batch=10)
+        assert sorted(i for g in groups for i in g) == list(range(len(lengths)))
+        for g in groups:
+            assert len(g) * max(lengths[i] for i in g) <= 200
+        # 按长度降序贪心装箱
+        assert groups == [[1, 6], [3, 5], [2, 4, 0]]
+
+    def test_unpadded_cost_and_max_batch(self):
+        groups = token_budget_batches([10] * 7, max_tokens=35, max_batch=2, padded=False)
+        assert all(len(g) <= 2 for g in groups)
+        assert len(groups) == 4
+
+    def test_oversized_text_gets_own_batch(self):
+        groups = token_budget_batches([500, 3, 4], max_tokens=100, max_batch=8)
+        assert groups[0] == [0]
+
+    def test_zero_budget_keeps_fixed_batches(self):
+        assert token_budget_batches([9, 1, 5, 3, 7], 0, 2) == [[0, 1], [2, 3], [4]]
+
+    def test_estimate_tokens_counts_cjk(self):
+        assert estimate_tokens("数据库连接池") > estimate_tokens("db pool")
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        return {"input_ids": [[0] * len(t.split()) for t in texts]}
+
+
+class FakeM3:
+    tokenizer = FakeTokenizer()
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.calls.append(list(texts))
+        return {
+            "dense_vecs": np.array([[float(len(t.split())), 0.0] for t in texts], dtype=np.float32),
+            "lexical_weights": [{"n": len(t.split())} for t in texts],
+        }
+
+
+def test_local_provider_restores_input_order():
+    p = object.__new__(LocalBGEM3Provider)
+    p._model = FakeM3()
+    p._max_length = 8192
+    p._batch_tokens = 12
+    texts = ["w " * n for n in (1, 6, 2, 5, 3)]
+    out = p.encode_texts(texts, batch_size=4)
+    assert out["dense_vecs"][:, 0].tolist() == [1, 6, 2, 5, 3]
+    assert [w["n"] for w in out["lexical_weights"]] == [1, 6, 2, 5, 3]
+    for batch in p._model.calls:
+        assert len(batch) * max(len(t.split()) for t in batch) <= 12
+
+
+def test_local_provider_empty_input_uses_model_width():
+    p = object.__new__(LocalBGEM3Provider)
+    p._model = FakeM3()
+    p._dense_dim = 2
+    p.colbert = False
+    assert p.encode_texts([])["dense_vecs"].shape == (0, 2)
+    assert p._model.calls == []
+
+
+def test_openai_provider_restores_input_order():
+    requests = []
+
+    def create(input, model):
+        requests.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t)), 1.0]) for t in input])
+
+    p = object.__new__(OpenAICompatibleProvider)
+    p._client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    p._model = "m"
+    p._dim = 2
+    p._concurrency = 2
+    p._batch_tokens = 30
+    texts = ["x" * n for n in (40, 4, 80, 8, 12)]
+    out = p.encode_texts(texts)
+    assert out["dense_vecs"][:, 0].tolist() == [40, 4, 80, 8, 12]
+    assert len(requests) > 1
+    assert sorted(t for r in requests for t in r) == sorted(texts)
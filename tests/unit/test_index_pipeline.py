@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""index.py 流式索引流水线的单元测试（假 embedding + Qdrant 内存模式）。"""
+
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import index
+from embedding_provider import EmbeddingProvider
+
+
+class FakeProvider(EmbeddingProvider):
+    """按文本长度生成确定性向量，记录每次 encode 的批大小。"""
+
+    def __init__(self):
+        self.calls: list[int] = []
+
+    def encode_texts(self, texts, batch_size=256):
+        self.calls.append(len(texts))
+        dense = np.zeros((len(texts), 1024), dtype=np.float32)
+        for i, t in enumerate(texts):
+            dense[i, len(t) % 1024] = 1.0
+        return {
+            "dense_vecs": dense,
+            "lexical_weights": [{str(len(t) % 97): 0.5} for t in texts],
+        }
+
+    def encode_query(self, query):
+        raise NotImplementedError
+
+
+class LockedClient:
+    """串行化调用的 QdrantClient 代理。
+
+    :memory: 本地模式不是线程安全的（并发 scroll + upsert 会读到半更新的数组），
+    真实 server 的 HTTP client 没有这个问题；流水线有 encode + 多个上传线程。
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+@pytest.fixture
+def env(monkeypatch):
+    client = LockedClient(QdrantClient(":memory:"))
+    provider = FakeProvider()
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: provider)
+    return client, provider
+
+
+def _chunks(doc_id: str, n: int) -> list[dict]:
+    return [
+        {"doc_id": doc_id, "chunk_id": f"{doc_id}-{i:03d}", "text": f"{doc_id} text {i}",
+         "metadata": {"title": doc_id, "section_path": f"S{i}"}}
+        for i in range(n)
+    ]
+
+
+def _write_docs(tmp_path: Path, n_docs: int, sections: int) -> Path:
+    for d in range(n_docs):
+        body = "\n\n".join(f"## Section {s}\n\n" + f"doc {d} section {s} " * 200
+                           for s in range(sections))
+        (tmp_path / f"doc{d}.md").write_text(f"---\nid: doc{d}\ntitle: Doc {d}\n---\n{body}")
+    return tmp_path
+
+
+class TestIndexChunks:
+    def test_batches_are_streamed(self, env):
+        client, provider = env
+        index.index_chunks(_chunks("a", 10), batch_size=4)
+        assert provider.calls == [4, 4, 2]
+        assert client.count(index.COLLECTION).count == 10
+
+    def test_empty_input(self, env):
+        _, provider = env
+        index.index_chunks([])
+        assert provider.calls == []
+
+    def test_parallel_upload_retries_and_barrier(self, env, monkeypatch):
+        client, _ = env
+        monkeypatch.setattr(index, "UPSERT_BATCH", 3)
+        monkeypatch.setattr(index, "UPLOAD_WORKERS", 3)
+        monkeypatch.setattr(index.time, "sleep", lambda s: None)
+        calls = {"upsert": 0, "waits": []}
+        real_upsert, real_delete = client.upsert, client.delete
+
+        def flaky_upsert(**kwargs):
+            calls["upsert"] += 1
+            calls["waits"].append(kwargs["wait"])
+            if calls["upsert"] == 2:
+                raise ConnectionError("transient")
+            return real_upsert(**kwargs)
+
+        def delete(**kwargs):
+            calls["barrier"] = kwargs["wait"]
+            return real_delete(**kwargs)
+
+        monkeypatch.setattr(client, "upsert", flaky_upsert)
+        monkeypatch.setattr(client, "delete", delete)
+        index.index_chunks(_chunks("a", 20), batch_size=8)
+        assert client.count(index.COLLECTION).count == 20
+        assert calls["upsert"] == 9  # (3+3+2)+(3+3+2)+(3+1) = 8 批 + 1 次重试
+        assert not any(calls["waits"])
+        assert calls["barrier"] is True
+        point = client.retrieve(index.COLLECTION, [index._point_id("a-005")], with_vectors=True)[0]
+        assert point.payload["chunk_id"] == "a-005"
+        assert point.vector["sparse"].values == [0.5]
+
+    def test_upload_gives_up_after_retries(self, env, monkeypatch):
+        client, _ = env
+        monkeypatch.setattr(index.time, "sleep", lambda s: None)
+
+        def broken(**kwargs):
+            raise ConnectionError("down")
+
+        monkeypatch.setattr(client, "upsert", broken)
+        with pytest.raises(ConnectionError):
+            index.index_chunks(_chunks("a", 5))
+
+
+class TestIndexFull:
+    def test_full_index_and_stale_chunks_removed(self, env, tmp_path, monkeypatch):
+        client, provider = env
+        monkeypatch.setattr(index, "PIPELINE_BATCH", 3)
+        docs = _write_docs(tmp_path, n_docs=4, sections=2)
+
+        index.index_full(str(docs))
+        assert client.count(index.COLLECTION).count == 8
+        # 每批按整文档凑满 3 个 chunks，不会一次编码全部
+        assert max(provider.calls) <= 4
+
+        # 文档变短后重建，旧的多余 chunk 应被删除，其余文档不重新编码
+        (docs / "doc0.md").write_text("---\nid: doc0\ntitle: Doc 0\n---\nshort")
+        provider.calls.clear()
+        index.index_full(str(docs))
+        assert client.count(index.COLLECTION).count == 7
+        assert provider.calls == [1]
+
+    def test_typo_fix_costs_one_embedding(self, env, tmp_path):
+        client, provider = env
+        docs = _write_docs(tmp_path, n_docs=1, sections=5)
+        index.index_full(str(docs))
+        provider.calls.clear()
+
+        doc = docs / "doc0.md"
+        doc.write_text(doc.read_text().replace("doc 0 section 3 ", "doc 0 sectoin 3 ", 1))
+        index.index_file(str(doc))
+        assert provider.calls == [1]
+        assert client.count(index.COLLECTION).count == 5
+
+    def test_force_reembeds_everything(self, env, tmp_path):
+        _, provider = env
+        docs = _write_docs(tmp_path, n_docs=1, sections=3)
+        index.index_full(str(docs))
+        provider.calls.clear()
+        index.index_full(str(docs), force=True)
+        assert provider.calls == [3]
+
+    def test_process_pool_parse(self, env, tmp_path):
+        client, _ = env
+        docs = _write_docs(tmp_path, n_docs=5, sections=2)
+        (docs / "broken.md").write_text("---\ntitle: [unclosed\n---\nbody")
+        index.index_full(str(docs), workers=2)
+        # 单文件解析失败被隔离，其余文件照常入库
+        assert client.count(index.COLLECTION).count == 10
+
+    def test_parsed_results_keep_file_order(self, tmp_path):
+        docs = _write_docs(tmp_path, n_docs=6, sections=1)
+        files = sorted(docs.glob("*.md"))
+        parsed = [r[0] for r in index._iter_parsed(files, workers=2)]
+        assert parsed == [str(f) for f in files]
+
+    def test_multiple_dirs_share_one_pipeline(self, env, tmp_path, monkeypatch):
+        client, _ = env
+        runs = []
+        real = index.run_pipeline
+        monkeypatch.setattr(index, "run_pipeline",
+                            lambda *a, **kw: runs.append(1) or real(*a, **kw))
+        a, b = tmp_path / "a", tmp_path / "b"
+        a.mkdir()
+        b.mkdir()
+        _write_docs(a, n_docs=2, sections=1)
+        (b / "other.md").write_text("---\nid: other\ntitle: Other\n---\n## S\n\ntext")
+        index.index_full([str(a), str(b)])
+        assert runs == [1]
+        assert client.count(index.COLLECTION).count == 3
+
+    def test_encode_failure_propagates(self, env, tmp_path):
+        _, provider = env
+
+        def boom(texts, batch_size=256):
+            raise RuntimeError("encode failed")
+
+        provider.encode_texts = boom
+        with pytest.raises(RuntimeError, match="encode failed"):
+            index.index_full(str(_write_docs(tmp_path, n_docs=2, sections=1)))
+
+
+class TestBulkDelete:
+    def test_delete_where_batches_match_any(self, env, monkeypatch):
+        client, _ = env
+        index.index_chunks([c for d in "abcde" for c in _chunks(d, 3)])
+        filters = []
+        real_delete = client.delete
+
+        def delete(**kwargs):
+            selector = kwargs["points_selector"]
+            if isinstance(selector, models.FilterSelector):
+                filters.append(selector.filter.must[0].match.any)
+            return real_delete(**kwargs)
+
+        monkeypatch.setattr(client, "delete", delete)
+        n = index.delete_where(client, "doc_id", ["a", "b", "c", "zz", "a"],
+                               batch_size=2, workers=2)
+        assert n == 9
+        assert sorted(map(sorted, filters)) == [["a", "b"], ["c", "zz"]]
+        assert client.count(index.COLLECTION).count == 6
+
+    def test_delete_by_source_repo(self, env):
+        client, _ = env
+        chunks = _chunks("a", 2) + _chunks("b", 3)
+        for c in chunks:
+            c["metadata"]["source_repo"] = "r1" if c["doc_id"] == "a" else "r2"
+        index.index_chunks(chunks)
+        index.delete_by_source_repo("r2")
+        assert client.count(index.COLLECTION).count == 2
+
+    def test_incremental_deletes_removed_files(self, env, tmp_path, monkeypatch):
+        client, _ = env
+        monkeypatch.chdir(tmp_path)
+        Path("kept.md").write_text("---\ntitle: Kept\n---\n## A\n\nkept body\n")
+        index.index_chunks(_chunks(index._stable_doc_id("gone.md"), 4))
+
+        def fake_git(cmd, **kwargs):
+            out = "kept.md\ngone.md\n" if cmd[1] == "diff" else ""
+            return subprocess.CompletedProcess(cmd, 0, stdout=out)
+
+        monkeypatch.setattr(index.subprocess, "run", fake_git)
+        monkeypatch.setattr(index, "PARSE_WORKERS", 1)
+        index.index_incremental()
+        payloads = [p.payload for p in client.scroll(index.COLLECTION, limit=100)[0]]
+        assert [p["path"] for p in payloads] == ["kept.md"]
+
+
+class TestRebuild:
+    """蓝绿重建：写新版本 → 校验 → 切换 alias → 回收旧版本。"""
+
+    @pytest.fixture(autouse=True)
+    def fast_gc(self, monkeypatch):
+        monkeypatch.setattr(index, "REBUILD_GC_DELAY", 0)
+
+    def test_first_rebuild_creates_alias(self, env, tmp_path):
+        client, _ = env
+        target = index.index_rebuild(str(_write_docs(tmp_path, n_docs=3, sections=2)), smoke=False)
+        assert index.resolve_alias(client, index.COLLECTION) == target
+        assert client.count(index.COLLECTION).count == 6
+
+    def test_rebuild_copies_unchanged_vectors_and_gcs_old(self, env, tmp_path):
+        client, provider = env
+        docs = _write_docs(tmp_path, n_docs=3, sections=2)
+        first = index.index_rebuild(str(docs), smoke=False)
+        (docs / "doc0.md").write_text("---\nid: doc0\ntitle: Doc 0\n---\nshort")
+        provider.calls.clear()
+        second = index.index_rebuild(str(docs), smoke=False)
+        assert second > first
+        assert sum(provider.calls) == 1  # 只编码变更的 chunk，其余从旧版本复制向量
+        assert index.resolve_alias(client, index.COLLECTION) == second
+        assert client.count(index.COLLECTION).count == 5
+        names = {c.name for c in client.get_collections().collections}
+        assert first not in names
+
+    def test_keep_old_versions(self, env, tmp_path):
+        client, _ = env
+        docs = _write_docs(tmp_path, n_docs=1, sections=1)
+        first = index.index_rebuild(str(docs), smoke=False)
+        index.index_rebuild(str(docs), smoke=False, keep=1)
+        assert first in {c.name for c in client.get_collections().collections}
+
+    def test_legacy_collection_migrated_to_alias(self, env, tmp_path):
+        client, _ = env
+        docs = _write_docs(tmp_path, n_docs=2, sections=1)
+        index.index_full(str(docs))
+        target = index.index_rebuild(str(docs), smoke=False)
+        assert index.resolve_alias(client, index.COLLECTION) == target
+        assert client.count(index.COLLECTION).count == 2
+
+    def test_shrunken_rebuild_is_not_swapped(self, env, tmp_path):
+        client, _ = env
+        docs = _write_docs(tmp_path, n_docs=4, sections=2)
+        first = index.index_rebuild(str(docs), smoke=False)
+        for f in list(docs.glob("doc[123].md")):
+            f.unlink()
+        with pytest.raises(RuntimeError, match="线上"):
+            index.index_rebuild(str(docs), smoke=False)
+        assert index.resolve_alias(client, index.COLLECTION) == first
+        assert client.count(index.COLLECTION).count == 8
+
+    def test_reuse_reembeds_points_deleted_after_scroll(self, env):
+        client, _ = env
+        chunks = _chunks("a", 2)
+        index.index_chunks(chunks)
+        gone = index._point_id("a-001")
+        client.delete(index.COLLECTION, points_selector=models.PointIdsList(points=[gone]))
+        reuse = [(c, index._point_id(c["chunk_id"])) for c in chunks]
+        points, missing = index._reused_points(client, reuse)
+        assert [p.id for p in points] == [index._point_id("a-000")]
+        assert missing == [chunks[1]]
+
+    def test_golden_regression_blocks_swap(self, env, tmp_path, monkeypatch):
+        client, _ = env
+        docs = _write_docs(tmp_path, n_docs=2, sections=1)
+        first = index.index_rebuild(str(docs), smoke=False)
+        cases = [{"question": "q", "expected_paths": ["doc0"]}]
+        monkeypatch.setattr(index, "_smoke_cases", lambda: cases)
+        live = index.resolve_alias(client, index.COLLECTION)
+        monkeypatch.setattr(index, "_golden_hits",
+                            lambda c, name, cs: 1 if name == live else 0)
+        with pytest.raises(RuntimeError, match="golden"):
+            index.index_rebuild(str(docs))
+        assert index.resolve_alias(client, index.COLLECTION) == first
+
+
+class TestPayloadFields:
+    def test_parse_file_writes_path_fields(self, tmp_path):
+        doc = tmp_path / "docs" / "runbook" / "redis.md"
+        doc.parent.mkdir(parents=True)
+        doc.write_text("---\ntitle: Redis\ntags: redis, failover\n---\n## A\n\nbody\n")
+        meta = index.parse_file(str(doc))[0]["metadata"]
+        assert meta["scope"] == "runbook"
+        assert meta["path_segments"][-2:] == ["docs", "runbook"]
+        assert meta["tags"] == ["redis", "failover"]
+
+    def test_path_fields_root_file(self):
+        assert index.path_fields("README.md") == {"path_segments": [], "scope": ""}
+
+    def test_migrate_backfills_legacy_points(self, env):
+        client, provider = env
+        chunks = _chunks("a", 3) + _chunks("b", 2)
+        for c in chunks:
+            c["metadata"]["path"] = f"docs/{'runbook' if c['doc_id'] == 'a' else 'adr'}/{c['doc_id']}.md"
+        index.index_chunks(chunks)
+        calls = len(provider.calls)
+
+        def in_segment(seg):
+            return client.count(index.COLLECTION, count_filter=models.Filter(must=[
+                models.FieldCondition(key="path_segments", match=models.MatchValue(value=seg))
+            ])).count
+
+        assert in_segment("runbook") == 0
+        assert index.migrate_payload(client) == 5
+        assert in_segment("runbook") == 3 and in_segment("adr") == 2
+        assert index.migrate_payload(client) == 0
+        assert len(provider.calls) == calls  # 只改 payload，不重新编码
+
+
+class TestPlanSync:
+    def _existing(self, chunks):
+        return {index._point_id(c["chunk_id"]): index._chunk_payload(c) for c in chunks}
+
+    def test_unchanged_skipped(self):
+        chunks = _chunks("a", 3)
+        plan = index.plan_sync(chunks, self._existing(chunks))
+        assert plan.unchanged == 3
+        assert plan.embed == [] and plan.reuse == [] and plan.stale_ids == []
+
+    def test_changed_chunk_embedded(self):
+        old = _chunks("a", 3)
+        new = _chunks("a", 3)
+        new[1]["text"] = "edited"
+        plan = index.plan_sync(new, self._existing(old))
+        assert [c["chunk_id"] for c in plan.embed] == ["a-001"]
+        assert plan.unchanged == 2
+
+    def test_metadata_only_change_reuses_vector(self):
+        old = _chunks("a", 2)
+        new = _chunks("a", 2)
+        new[0]["metadata"]["source_commit"] = "deadbeef"
+        plan = index.plan_sync(new, self._existing(old))
+        assert plan.embed == []
+        assert [(c["chunk_id"], src) for c, src in plan.reuse] == [
+            ("a-000", index._point_id("a-000"))]
+
+    def test_inserted_section_shifts_ids(self):
+        """中间插入一个 section：后续 chunk 的 id 变了，但向量可复用。"""
+        old = _chunks("a", 3)
+        new = [dict(c) for c in old]
+        inserted = {"doc_id": "a", "chunk_id": "", "text": "new section",
+                    "metadata": {"title": "a", "section_path": "New"}}
+        new.insert(1, inserted)
+        for i, c in enumerate(new):
+            c["chunk_id"] = f"a-{i:03d}"
+        plan = index.plan_sync(new, self._existing(old))
+        assert [c["text"] for c in plan.embed] == ["new section"]
+        assert len(plan.reuse) == 2
+        assert plan.stale_ids == []
+
+    def test_removed_chunks_are_stale(self):
+        old = _chunks("a", 3)
+        plan = index.plan_sync(old[:1], self._existing(old))
+        assert sorted(plan.stale_ids) == sorted(
+            index._point_id(c["chunk_id"]) for c in old[1:])
+
+
+class TestStageStats:
+    def test_rate(self):
+        stats = index.StageStats("encode")
+        stats.add(100, 2.0)
+        stats.add(50, 1.0)
+        assert stats.items == 150
+        assert stats.batches == 2
+        assert stats.rate == pytest.approx(50.0)
+        assert "50.0 chunks/s" in stats.summary()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""mcp_shim 会话配置单元测试。"""
+
+import json
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import mcp_shim  # noqa: E402
+
+
+def test_shim_mode_launches_shim():
+    config = mcp_shim.mcp_servers_config(python="py", env={"QDRANT_URL": "x"}, mode="shim")
+    server = config["knowledge-base"]
+    assert server["command"] == "py"
+    assert server["args"][0].endswith("mcp_shim.py")
+    assert server["env"] == {"QDRANT_URL": "x"}
+
+
+def test_stdio_mode_keeps_per_session_server():
+    config = mcp_shim.mcp_servers_config(python="py", mode="stdio")
+    assert config["knowledge-base"]["args"][0].endswith("mcp_server.py")
+    assert "env" not in config["knowledge-base"]
+
+
+def test_http_mode_uses_running_daemon(monkeypatch):
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        monkeypatch.setattr(mcp_shim, "ensure_daemon",
+                            lambda python=None, env=None: mcp_shim.daemon_url("127.0.0.1", port))
+        assert mcp_shim.daemon_alive("127.0.0.1", port)
+        config = mcp_shim.mcp_servers_config(mode="http")
+    assert config["knowledge-base"] == {"type": "http", "url": f"http://127.0.0.1:{port}/mcp"}
+    assert not mcp_shim.daemon_alive("127.0.0.1", port)
+
+
+def _fake_daemon(identity: dict) -> HTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({"pid": 0, **identity}).encode()
+            self.send_response(200 if self.path == mcp_shim.DAEMON_INFO_PATH else 404)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_ensure_daemon_refuses_mismatched_config(monkeypatch):
+    monkeypatch.setenv("COLLECTION_NAME", "mine")
+    server = _fake_daemon(mcp_shim.daemon_identity({**os.environ, "COLLECTION_NAME": "other"}))
+    port = server.server_address[1]
+    try:
+        with pytest.raises(RuntimeError, match="COLLECTION_NAME"):
+            mcp_shim.ensure_daemon(port=port)
+        url = mcp_shim.ensure_daemon(port=port, env={"COLLECTION_NAME": "other"})
+        assert url == mcp_shim.daemon_url("127.0.0.1", port)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stop_daemon_without_daemon():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    assert not mcp_shim.stop_daemon(port=port)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""mcp_server 冷启动 / 预热状态单元测试。"""
+
+import json
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).parent.parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+pytest.importorskip("mcp.server.fastmcp")
+
+import mcp_server  # noqa: E402
+from qdrant_client import QdrantClient  # noqa: E402
+
+
+class FakeProvider:
+    def encode_query(self, query):
+        return {"dense_vec": [0.0] * 4, "sparse_vec": None}
+
+
+class FakeReranker:
+    def compute_score(self, pairs, batch_size=32, normalize=False):
+        return [0.0] * len(pairs)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(mcp_server, "_startup", {"state": "cold", "error": "", "phases_ms": {}})
+    monkeypatch.setattr(mcp_server, "_ready", threading.Event())
+    monkeypatch.setattr(mcp_server, "_qdrant", QdrantClient(":memory:"))
+    return mcp_server
+
+
+def test_heavy_model_libs_not_imported_at_startup():
+    code = ("import sys, mcp_server; "
+            "print(any(m in sys.modules for m in ('FlagEmbedding', 'torch', 'transformers')))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS_DIR,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_warm_up_records_phases(server, monkeypatch):
+    monkeypatch.setattr(server, "_provider", FakeProvider())
+    monkeypatch.setattr(server, "_reranker", FakeReranker())
+    server.warm_up()
+    ready = server.readiness()
+    assert ready["state"] == "ready"
+    assert {"qdrant_client", "embedding_model", "reranker_warm"} <= set(ready["phases_ms"])
+    assert server._ready.is_set()
+
+
+def test_warm_up_failure_sets_error(server, monkeypatch):
+    def boom():
+        raise RuntimeError("no model")
+
+    monkeypatch.setattr(server, "get_provider", boom)
+    server.warm_up()
+    assert server.readiness()["state"] == "error"
+    assert "no model" in server.readiness()["error"]
+    assert server._ready.is_set()
+
+
+def test_hybrid_search_times_out_while_warming(server, monkeypatch):
+    monkeypatch.setattr(server, "SEARCH_READY_TIMEOUT", 0.01)
+    server._startup["state"] = "warming"
+    out = json.loads(server.hybrid_search("redis"))
+    assert "keyword_search" in out["error"]
+    assert out["readiness"]["state"] == "warming"
+
+
+def test_index_status_reports_readiness_without_models(server):
+    server._startup["state"] = "warming"
+    out = json.loads(server.index_status())
+    assert out["readiness"]["state"] == "warming"
+
+
+def test_scope_filter_uses_indexed_segments():
+    from qdrant_client import models
+
+    client = QdrantClient(":memory:")
+    client.create_collection("c", vectors_config={})
+    paths = ["docs/runbook/a.md", "docs/concepts/workloads/pods/b.md",
+             "docs/pods/workloads/concepts/c.md"]
+    client.upsert("c", points=[
+        models.PointStruct(id=i, vector={}, payload={
+            "path": p, "path_segments": p.split("/")[:-1]}) for i, p in enumerate(paths)
+    ])
+    assert mcp_server.scope_filter("") is None
+    assert len(mcp_server.scope_filter("runbook").must) == 1
+
+    def hits(scope):
+        return sorted(p.id for p in client.scroll("c", scroll_filter=mcp_server.scope_filter(scope))[0])
+
+    assert hits("runbook") == [0]
+    assert hits("pods") == [1, 2]
+    assert hits("concepts/workloads/pods") == [1]
+
+
+def test_scope_falls_back_until_payload_migrated(monkeypatch, tmp_path):
+    """旧 collection 上 index.py --file 会补建 path_segments 索引，未回填的旧文档仍要按 scope 命中。"""
+    import index
+    from qdrant_client import models
+    from test_index_pipeline import FakeProvider as IndexProvider, LockedClient
+
+    client = LockedClient(QdrantClient(":memory:"))
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: IndexProvider())
+    monkeypatch.setattr(mcp_server, "COLLECTION", index.COLLECTION)
+    monkeypatch.setattr(mcp_server, "_collection_version", None)
+    # 结构化路径字段之前建的 collection：没有迁移标记，points 只有 path
+    client.create_collection(index.COLLECTION, vectors_config={
+        "dense": models.VectorParams(size=1024, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()})
+    client.upsert(index.COLLECTION, points=[models.PointStruct(
+        id=index._point_id("old-000"), vector={"dense": [1.0] * 1024},
+        payload={"doc_id": "old", "path": f"{tmp_path}/runbook/old.md"})])
+    doc = tmp_path / "runbook" / "new.md"
+    doc.parent.mkdir()
+    doc.write_text("---\nid: new\ntitle: New\n---\n## A\n\nnew runbook")
+    index.index_file(str(doc))
+
+    def hits():
+        ready = mcp_server.path_segments_ready(client)
+        scoped = mcp_server.scope_filter("runbook", ready)
+        return ready, sorted(Path(p.payload["path"]).name
+                             for p in client.scroll(index.COLLECTION, scroll_filter=scoped)[0])
+
+    assert hits() == (False, ["new.md", "old.md"])
+    index.migrate_payload(client)
+    monkeypatch.setattr(mcp_server, "_collection_version", None)
+    assert hits() == (True, ["new.md", "old.md"])
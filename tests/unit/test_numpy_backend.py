@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""numpy_backend 测试：与 Qdrant 本地模式结果对齐、持久化、过滤、跑通 index.py 流水线。"""
+
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import numpy_backend  # noqa: E402
+from numpy_backend import NumpyVectorClient  # noqa: E402
+
+DIM = 16
+
+
+def _create(client, name="c"):
+    client.create_collection(
+        name,
+        vectors_config={"dense": models.VectorParams(size=DIM, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+
+
+def _points(n: int, seed: int = 0) -> list[models.PointStruct]:
+    rng = np.random.default_rng(seed)
+    points = []
+    for i in range(n):
+        idx = np.unique(rng.integers(0, 50, 6))
+        points.append(models.PointStruct(
+            id=str(uuid.UUID(int=i + 1)),
+            vector={"dense": rng.standard_normal(DIM).tolist(),
+                    "sparse": models.SparseVector(indices=idx.tolist(),
+                                                  values=rng.random(len(idx)).tolist())},
+            payload={"n": i, "path_segments": ["docs", "runbook" if i % 3 == 0 else "api"],
+                     "text": f"chunk {i} redis" if i % 2 else f"chunk {i}"},
+        ))
+    return points
+
+
+@pytest.fixture
+def pair(tmp_path):
+    ref = QdrantClient(":memory:")
+    npc = NumpyVectorClient(str(tmp_path / "vec"), dtype="float32")
+    for c in (ref, npc):
+        _create(c)
+        c.upsert("c", points=_points(200))
+    return ref, npc
+
+
+def _ids(resp):
+    return [p.id for p in resp.points]
+
+
+def test_dense_sparse_and_rrf_match_qdrant(pair):
+    ref, npc = pair
+    rng = np.random.default_rng(7)
+    for _ in range(5):
+        dense = rng.standard_normal(DIM).tolist()
+        sparse = models.SparseVector(indices=[1, 5, 9, 20], values=[0.5, 1.0, 0.3, 0.8])
+        scope = models.Filter(must=[models.FieldCondition(
+            key="path_segments", match=models.MatchValue(value="runbook"))])
+        kwargs = [
+            dict(query=dense, using="dense", limit=10),
+            dict(query=sparse, using="sparse", limit=10),
+            dict(query=dense, using="dense", limit=10, query_filter=scope),
+            dict(prefetch=[models.Prefetch(query=dense, using="dense", limit=20),
+                           models.Prefetch(query=sparse, using="sparse", limit=20)],
+                 query=models.FusionQuery(fusion=models.Fusion.RRF), limit=15),
+        ]
+        for kw in kwargs:
+            a, b = ref.query_points("c", **kw), npc.query_points("c", **kw)
+            assert _ids(a) == _ids(b)
+            assert np.allclose([p.score for p in a.points], [p.score for p in b.points], atol=1e-4)
+
+
+def test_sparse_idf_modifier_matches_qdrant(tmp_path):
+    import bm25
+
+    texts = ["redis maxmemory", "redis config set", "maxmemory-policy allkeys-lru",
+             "kubernetes pod", "redis 淘汰策略", ""]
+    ref = QdrantClient(":memory:")
+    npc = NumpyVectorClient(str(tmp_path / "vec"), dtype="float32")
+    for c in (ref, npc):
+        c.create_collection("c", vectors_config={},
+                            sparse_vectors_config={"bm25": bm25.sparse_params()})
+        c.upsert("c", points=[
+            models.PointStruct(id=i + 1, vector={"bm25": bm25.doc_vector({"text": t})})
+            for i, t in enumerate(texts)])
+        c.delete("c", points_selector=models.PointIdsList(points=[2]))
+    for q in ("redis maxmemory-policy", "淘汰策略", "config"):
+        kw = dict(query=bm25.query_vector(q), using="bm25", limit=5)
+        a, b = ref.query_points("c", **kw), npc.query_points("c", **kw)
+        assert _ids(a) == _ids(b)
+        assert np.allclose([p.score for p in a.points], [p.score for p in b.points], atol=1e-4)
+
+
+def test_multivector_maxsim_rescore_matches_qdrant(tmp_path):
+    rng = np.random.default_rng(5)
+    multi = models.VectorParams(size=DIM, distance=models.Distance.COSINE,
+                                multivector_config=models.MultiVectorConfig(
+                                    comparator=models.MultiVectorComparator.MAX_SIM))
+    points = [models.PointStruct(id=i + 1, vector={
+        "dense": rng.standard_normal(DIM).tolist(),
+        "colbert": rng.standard_normal((int(rng.integers(1, 8)), DIM)).tolist()})
+        for i in range(300)]
+    path = str(tmp_path / "vec")
+    ref = QdrantClient(":memory:")
+    npc = NumpyVectorClient(path, dtype="float32")
+    for c in (ref, npc):
+        c.create_collection("c", vectors_config={
+            "dense": models.VectorParams(size=DIM, distance=models.Distance.COSINE),
+            "colbert": multi})
+        c.upsert("c", points=points)
+        c.delete("c", points_selector=models.PointIdsList(points=list(range(1, 100))))
+    npc._col("c").compact()
+    npc.close()
+    npc = NumpyVectorClient(path, dtype="float32")
+
+    kw = dict(prefetch=models.Prefetch(query=rng.standard_normal(DIM).tolist(), using="dense",
+                                       limit=30),
+              query=rng.standard_normal((3, DIM)).tolist(), using="colbert", limit=10)
+    a, b = ref.query_points("c", **kw), npc.query_points("c", **kw)
+    assert _ids(a) == _ids(b)
+    assert np.allclose([p.score for p in a.points], [p.score for p in b.points], atol=1e-4)
+    rec = npc.retrieve("c", [300], with_vectors=True)[0]
+    assert np.allclose(np.linalg.norm(rec.vector["colbert"], axis=1), 1.0, atol=1e-5)
+
+
+def test_filters_scroll_count_and_delete(pair):
+    ref, npc = pair
+    npc.create_payload_index("c", "path_segments", models.PayloadSchemaType.KEYWORD)
+    flt = models.Filter(must=[
+        models.FieldCondition(key="path_segments", match=models.MatchAny(any=["runbook"])),
+        models.FieldCondition(key="text", match=models.MatchText(text="redis")),
+    ])
+    assert npc.count("c", count_filter=flt).count == ref.count("c", count_filter=flt).count
+
+    seen, offset = [], None
+    while True:
+        page, offset = npc.scroll("c", scroll_filter=flt, limit=7, offset=offset)
+        seen += [p.payload["n"] for p in page]
+        if offset is None:
+            break
+    assert seen == [n for n in range(200) if n % 3 == 0 and n % 2]
+
+    for c in (ref, npc):
+        c.delete("c", points_selector=models.FilterSelector(filter=flt))
+    assert npc.count("c").count == ref.count("c").count
+
+
+def test_persist_reload_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_backend, "RELOAD_CHECK_SEC", 0)
+    path = str(tmp_path / "vec")
+    writer = NumpyVectorClient(path)
+    _create(writer)
+    writer.upsert("c", points=_points(1500), wait=False)
+    writer.delete("c", points_selector=models.PointIdsList(points=[]))  # 屏障：落盘提交
+
+    reader = NumpyVectorClient(path)
+    q = _points(1, seed=3)[0].vector["dense"]
+    before = _ids(reader.query_points("c", query=q, using="dense", limit=5))
+    assert reader.count("c").count == 1500
+
+    # 删掉大部分后落盘触发压缩；读进程按 meta 变化重新加载
+    writer.delete("c", points_selector=models.PointIdsList(
+        points=[str(uuid.UUID(int=i + 1)) for i in range(1200)]))
+    assert writer._col("c").rows == 300
+    assert reader.count("c").count == 300
+    after = _ids(reader.query_points("c", query=q, using="dense", limit=5))
+    assert [i for i in before if i in after] == [i for i in before if int(uuid.UUID(i)) > 1200]
+
+    writer.set_payload("c", payload={"tag": "x"}, points=[str(uuid.UUID(int=1500))])
+    writer.close()
+    reopened = NumpyVectorClient(path)
+    rec = reopened.retrieve("c", [str(uuid.UUID(int=1500))], with_vectors=True)[0]
+    assert rec.payload["tag"] == "x" and rec.payload["n"] == 1499
+    assert len(rec.vector["dense"]) == DIM and rec.vector["sparse"].indices
+
+
+def test_reads_run_concurrently_writes_exclusive():
+    lock = numpy_backend._RWLock()
+    in_read, release = threading.Event(), threading.Event()
+    order = []
+
+    def reader():
+        with lock.read():
+            in_read.set()
+            release.wait(5)
+            order.append("read")
+
+    def writer():
+        with lock.write():
+            order.append("write")
+
+    t = threading.Thread(target=reader)
+    t.start()
+    in_read.wait(5)
+    # 读锁被持有时另一个读不阻塞，写要等读结束
+    with lock.read():
+        pass
+    w = threading.Thread(target=writer)
+    w.start()
+    w.join(0.1)
+    assert w.is_alive()
+    release.set()
+    t.join(5)
+    w.join(5)
+    assert order == ["read", "write"]
+    with lock.write(), lock.write(), lock.read():  # 写锁可重入，持写锁可读
+        pass
+
+
+def test_aliases(tmp_path):
+    c = NumpyVectorClient(str(tmp_path / "vec"))
+    _create(c, "kb-v1")
+    c.update_collection_aliases(change_aliases_operations=[
+        models.CreateAliasOperation(create_alias=models.CreateAlias(
+            collection_name="kb-v1", alias_name="kb"))])
+    c.upsert("kb", points=_points(3))
+    assert c.count("kb-v1").count == 3
+    assert [a.collection_name for a in c.get_aliases().aliases] == ["kb-v1"]
+    assert [d.name for d in c.get_collections().collections] == ["kb-v1"]
+
+
+def test_index_pipeline_runs_on_numpy_backend(tmp_path, monkeypatch):
+    import index
+    from test_index_pipeline import FakeProvider, _chunks
+
+    client = NumpyVectorClient(str(tmp_path / "vec"))
+    provider = FakeProvider()
+    monkeypatch.setattr(index, "get_qdrant", lambda: client)
+    monkeypatch.setattr(index, "get_provider", lambda: provider)
+    index.index_chunks(_chunks("a", 5) + _chunks("b", 3))
+    assert client.count(index.COLLECTION).count == 8
+    assert index.delete_where(client, "doc_id", ["a"]) == 5
+    assert client.count(index.COLLECTION).count == 3
+
+
+def test_unsupported_config_and_snapshots(tmp_path, monkeypatch):
+    npc = NumpyVectorClient(str(tmp_path / "vec"))
+    with pytest.raises(ValueError, match="Cosine"):
+        npc.create_collection("d", vectors_config={
+            "dense": models.VectorParams(size=DIM, distance=models.Distance.DOT)})
+    _create(npc)
+    with pytest.raises(ValueError, match="RRF"):
+        npc.query_points("c", prefetch=[models.Prefetch(query=[1.0] * DIM, using="dense")],
+                         query=models.FusionQuery(fusion=models.Fusion.DBSF))
+
+    with pytest.raises(ValueError, match="快照"):
+        npc.create_snapshot("c")
+
+    import index
+    monkeypatch.setattr(index, "VECTOR_BACKEND", "numpy")
+    with pytest.raises(SystemExit):
+        index.snapshot_export(str(tmp_path / "kb.snapshot"))
+    with pytest.raises(SystemExit):
+        index.snapshot_import(str(tmp_path / "kb.snapshot"))
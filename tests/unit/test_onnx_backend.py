@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""onnx_backend 中与推理引擎无关的后处理逻辑测试。"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from onnx_backend import OnnxBGEM3Provider
+
+
+def _provider(weight, bias=0.0, unused=(0, 1, 2)):
+    p = object.__new__(OnnxBGEM3Provider)
+    p._sparse_w = np.asarray(weight, dtype=np.float32)
+    p._sparse_b = bias
+    p._unused_tokens = set(unused)
+    return p
+
+
+class TestLexicalWeights:
+    def test_max_per_token_and_special_tokens_dropped(self):
+        p = _provider([1.0, 0.0])
+        # hidden[..., 0] 即 token 权重（sparse_w = [1, 0]）
+        hidden = np.array([[[0.9, 5], [0.2, 5], [0.7, 5], [0.4, 5], [0.3, 5]]], dtype=np.float32)
+        input_ids = np.array([[0, 10, 11, 10, 2]])
+        mask = np.ones_like(input_ids)
+        weights = p._lexical_weights(hidden, input_ids, mask)[0]
+        assert set(weights) == {"10", "11"}
+        assert weights["10"] == np.float32(0.4)
+        assert weights["11"] == np.float32(0.7)
+
+    def test_relu_and_padding(self):
+        p = _provider([1.0], bias=-0.5)
+        hidden = np.array([[[0.2], [0.9], [0.9]]], dtype=np.float32)
+        input_ids = np.array([[10, 11, 12]])
+        mask = np.array([[1, 1, 0]])
+        weights = p._lexical_weights(hidden, input_ids, mask)[0]
+        assert set(weights) == {"11"}  # 10 被 relu 置零，12 是 padding
+
+
+def test_colbert_vecs_drop_cls_and_padding():
+    p = _provider([1.0, 0.0])
+    p._colbert_w = np.eye(2, dtype=np.float32)
+    p._colbert_b = np.zeros(2, dtype=np.float32)
+    hidden = np.array([[[9, 9], [3, 4], [0, 2], [5, 5]]], dtype=np.float32)
+    vecs = p._colbert_vecs(hidden, np.array([[1, 1, 1, 0]]))[0]
+    # 去掉 CLS（位置 0）和 padding（位置 3），逐行归一化
+    assert np.allclose(vecs, [[0.6, 0.8], [0.0, 1.0]])
+
+
+class FakeSession:
+    def run(self, outputs, feeds):
+        ids = feeds["input_ids"]
+        return [np.stack([ids, np.ones_like(ids)], axis=-1).astype(np.float32)]
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        ids = np.array([[3 + len(t), 10] for t in texts])
+        return {"input_ids": ids, "attention_mask": np.ones_like(ids)}
+
+
+def test_dense_width_follows_hidden_size():
+    p = _provider([1.0, 0.0])
+    p._session = FakeSession()
+    p._tokenizer = FakeTokenizer()
+    p._input_names = {"input_ids", "attention_mask"}
+    p._max_length = 8192
+    p._batch_tokens = 0
+    p.colbert = False
+    out = p.encode_texts(["a", "bbb"])
+    assert out["dense_vecs"].shape == (2, 2)
+    assert np.allclose(np.linalg.norm(out["dense_vecs"], axis=1), 1.0)
+    assert p.encode_texts([])["dense_vecs"].shape == (0, 2)
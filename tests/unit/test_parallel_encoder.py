@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""parallel_encoder 多进程数据并行测试（worker 内用假 provider，不加载模型）。"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from embedding_provider import EmbeddingProvider  # noqa: E402
+from parallel_encoder import DataParallelProvider, pack_lexical, unpack_lexical  # noqa: E402
+
+
+class FakeProvider(EmbeddingProvider):
+    model_id = "fake:len"
+
+    def encode_texts(self, texts, batch_size=256):
+        return {
+            "dense_vecs": np.array([[len(t), os.getpid(), 0.5] for t in texts], dtype=np.float64),
+            "lexical_weights": [{str(len(t)): 0.25} for t in texts],
+        }
+
+    def encode_query(self, query):
+        raise NotImplementedError
+
+
+def fake_factory(threads):
+    return FakeProvider()
+
+
+def broken_factory(threads):
+    raise RuntimeError("model missing")
+
+
+def test_pack_roundtrip():
+    weights = [{"10": 0.5, "7": 0.25}, {}, {"3": 1.0}]
+    assert unpack_lexical(pack_lexical(weights)) == weights
+    assert pack_lexical(None) is None
+
+
+def test_encode_texts_keeps_order_across_workers():
+    provider = DataParallelProvider(fake_factory, workers=2, threads=1, pin_cpus=False)
+    try:
+        assert provider.model_id == "fake:len"
+        texts = ["x" * n for n in (5, 50, 1, 30, 7, 12, 3)]
+        out = provider.encode_texts(texts)
+        assert out["dense_vecs"].dtype == np.float32
+        assert out["dense_vecs"][:, 0].tolist() == [5, 50, 1, 30, 7, 12, 3]
+        assert len(set(out["dense_vecs"][:, 1].tolist())) == 2  # 两个 worker 都参与
+        assert [list(w) for w in out["lexical_weights"]] == [[str(len(t))] for t in texts]
+        # 更大的输入触发共享内存扩容
+        more = ["y" * (i % 17) for i in range(100)]
+        assert provider.encode_texts(more)["dense_vecs"][:, 0].tolist() == [i % 17 for i in range(100)]
+        q = provider.encode_query("abc")
+        assert q["dense_vec"][0] == 3 and q["sparse_vec"].indices == [3]
+    finally:
+        provider.close()
+
+
+def test_worker_start_failure_raises():
+    with pytest.raises(RuntimeError, match="model missing"):
+        DataParallelProvider(broken_factory, workers=1, threads=1, pin_cpus=False)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""qdrant_pool 共享 client 工厂测试（不连接 server：client 建连是惰性的）。"""
+
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import qdrant_pool  # noqa: E402
+
+URL = "http://127.0.0.1:6399"
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    qdrant_pool.close_qdrant_clients()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # 版本检查连不上 server 的警告
+        yield
+    qdrant_pool.close_qdrant_clients()
+
+
+def test_client_is_shared_per_transport():
+    rest = qdrant_pool.get_qdrant_client(URL, prefer_grpc=False)
+    assert qdrant_pool.get_qdrant_client(URL, prefer_grpc=False) is rest
+    grpc = qdrant_pool.get_qdrant_client(URL, prefer_grpc=True)
+    assert grpc is not rest
+    assert grpc._client._prefer_grpc and not rest._client._prefer_grpc
+
+
+def test_close_clears_cache():
+    first = qdrant_pool.get_qdrant_client(URL, prefer_grpc=False)
+    qdrant_pool.close_qdrant_clients()
+    assert qdrant_pool.get_qdrant_client(URL, prefer_grpc=False) is not first
+
+
+def test_index_uses_shared_client(monkeypatch):
+    import index
+    monkeypatch.setattr(qdrant_pool, "QDRANT_URL", URL)
+    assert index.get_qdrant() is index.get_qdrant()
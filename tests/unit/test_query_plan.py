@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""query_plan 编译结果，以及 hybrid_search 各模式都只发一次检索请求。"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from query_plan import QueryPlan  # noqa: E402
+
+SCOPE = models.Filter(must=[
+    models.FieldCondition(key="scope", match=models.MatchValue(value="runbook"))])
+SPARSE = models.SparseVector(indices=[1, 2], values=[0.5, 0.5])
+
+
+def test_single_signal_is_a_plain_query():
+    req = QueryPlan(limit=5, filter=SCOPE).add("dense", [1.0, 0.0], "dense").request()
+    assert req == {"query": [1.0, 0.0], "using": "dense", "query_filter": SCOPE, "limit": 5}
+
+
+def test_signals_fuse_in_one_request_with_optional_rescore():
+    text = models.Filter(must=[models.FieldCondition(key="text", match=models.MatchText(text="x"))])
+    plan = (QueryPlan(limit=30, filter=SCOPE, candidates=20)
+            .add("dense", [1.0, 0.0], "dense")
+            .add("sparse", SPARSE, "sparse")
+            .add("text", [1.0, 0.0], "dense", filter=text))
+    req = plan.request()
+    assert isinstance(req["query"], models.FusionQuery) and req["limit"] == 30
+    assert [p.using for p in req["prefetch"]] == ["dense", "sparse", "dense"]
+    assert req["prefetch"][0].filter is SCOPE
+    assert req["prefetch"][2].filter.must == [SCOPE, text]
+    assert plan.describe() == "rrf(dense,sparse,text)"
+
+    req = plan.rescore([1.0, 0.0], "dense").request()
+    (fused,) = req["prefetch"]
+    assert isinstance(fused.query, models.FusionQuery) and fused.limit == 30
+    assert len(fused.prefetch) == 3 and req["using"] == "dense"
+    assert plan.describe() == "rrf(dense,sparse,text)>dense"
+
+
+def test_nested_plan_runs_on_qdrant():
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "c",
+        vectors_config={"dense": models.VectorParams(size=2, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    client.upsert("c", points=[
+        models.PointStruct(
+            id=i,
+            vector={"dense": [1.0, i / 10],
+                    "sparse": models.SparseVector(indices=[i % 3], values=[1.0])},
+            payload={"scope": "runbook" if i % 2 else "api"})
+        for i in range(10)
+    ])
+    plan = (QueryPlan(limit=3, filter=SCOPE)
+            .add("dense", [0.0, 1.0], "dense")
+            .add("sparse", SPARSE, "sparse")
+            .rescore([0.0, 1.0], "dense"))
+    ids = [p.id for p in plan.run(client, "c").points]
+    assert ids == [9, 7, 5]
+
+
+def test_legacy_external_api_hybrid_is_one_round_trip(monkeypatch):
+    pytest.importorskip("mcp.server.fastmcp")
+    import mcp_server
+    from test_bm25 import CountingClient, FakeReranker, QueryProvider
+
+    client = CountingClient(QdrantClient(":memory:"))
+    client.create_collection(
+        mcp_server.COLLECTION,
+        vectors_config={"dense": models.VectorParams(size=1024, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    client.upsert(mcp_server.COLLECTION, points=[
+        models.PointStruct(id=i, vector={"dense": [1.0] + [0.0] * 1023},
+                           payload={"text": t, "path": f"docs/{i}.md"})
+        for i, t in enumerate(["redis eviction", "kubernetes pod", "redis sentinel"])
+    ])
+    monkeypatch.setattr(mcp_server, "_qdrant", client)
+    monkeypatch.setattr(mcp_server, "_provider", QueryProvider())
+    monkeypatch.setattr(mcp_server, "_reranker", FakeReranker())
+    monkeypatch.setattr(mcp_server, "_collection_version", None)
+    monkeypatch.setattr(mcp_server, "_has_bm25", False)
+    mcp_server._result_cache.clear()
+
+    timings = []
+    for query in ("redis", "sentinel"):
+        out = mcp_server.hybrid_search(query, top_k=2, include_timings=True)
+        timings.append(json.loads(out.split("[TIMINGS] ")[1]))
+    assert client.calls == ["query_points", "query_points"]
+    assert timings[0]["plan"] == "rrf(dense,text)"
+    # 第一次含 collection 版本检查（VERSION_CHECK_SEC 内复用）
+    assert [t["round_trips"] for t in timings] == [2, 1]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""rerank 自适应调度的单元测试。"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from rerank import adaptive_rerank, best_passage, query_terms, rrf_decisive
+
+
+class FakeScorer:
+    """按预设分数表打分，记录每批大小。"""
+
+    def __init__(self, scores_by_text):
+        self.scores_by_text = scores_by_text
+        self.batches: list[int] = []
+
+    def __call__(self, pairs):
+        self.batches.append(len(pairs))
+        return [self.scores_by_text[text] for _, text in pairs]
+
+
+class TestQueryTerms:
+    def test_english_and_commands(self):
+        terms = query_terms("CONFIG SET maxmemory-policy?")
+        assert {"config", "set", "maxmemory-policy"} <= terms
+
+    def test_cjk_bigrams(self):
+        assert {"管道", "道技", "技术"} <= query_terms("管道技术")
+
+
+class TestBestPassage:
+    def test_short_text_unchanged(self):
+        assert best_passage("short", "query", window=100) == "short"
+
+    def test_picks_matching_paragraph(self):
+        text = "intro " * 50 + "\n\n" + "filler " * 50 + "\n\n" + "sentinel failover details"
+        passage = best_passage(text, "sentinel failover", window=60)
+        assert passage.startswith("sentinel failover")
+
+    def test_no_terms_falls_back_to_head(self):
+        assert best_passage("x" * 100, "?!", window=10) == "x" * 10
+
+
+class TestRrfDecisive:
+    def test_clear_gap(self):
+        assert rrf_decisive([0.9, 0.8, 0.3, 0.2], top_k=2, ratio=2.0)
+
+    def test_no_gap(self):
+        assert not rrf_decisive([0.9, 0.8, 0.7], top_k=2, ratio=2.0)
+
+    def test_disabled(self):
+        assert not rrf_decisive([0.9, 0.1], top_k=1, ratio=0)
+
+    def test_not_enough_candidates(self):
+        assert not rrf_decisive([0.9, 0.8], top_k=2, ratio=2.0)
+
+
+class TestAdaptiveRerank:
+    def _run(self, scores, top_k=2, **kwargs):
+        texts = [f"t{i}" for i in range(len(scores))]
+        scorer = FakeScorer(dict(zip(texts, scores)))
+        kwargs.setdefault("skip_ratio", 0)
+        result, stats = adaptive_rerank("q", texts, [1.0] * len(texts), scorer, top_k, **kwargs)
+        return result, stats, scorer
+
+    def test_stops_when_top_k_stable(self):
+        # 第二批没有改变 top-2，其余 10 个不再需要
+        result, stats, scorer = self._run([0.9, 0.8, 0.1, 0.2] + [0.0] * 10)
+        assert scorer.batches == [2, 2]
+        assert stats["scored"] == 4 and stats["stop"] == "stable"
+        assert [i for i, _ in result] == list(range(4))
+
+    def test_stops_early_at_default_candidate_count(self):
+        # mcp_server 送入 3×top_k 个候选：第二批确认 top_k 后省掉最后一批
+        for top_k in (3, 5, 10):
+            scores = [1.0 - i / 100 for i in range(top_k)] + [0.0] * (2 * top_k)
+            _, stats, scorer = self._run(scores, top_k=top_k)
+            assert scorer.batches == [top_k, top_k]
+            assert stats["stop"] == "stable" and stats["scored"] == 2 * top_k
+
+    def test_continues_while_top_k_changes(self):
+        result, stats, scorer = self._run([0.1, 0.2, 0.9, 0.1, 0.1, 0.1])
+        assert scorer.batches == [2, 2, 2]
+        assert stats["scored"] == 6 and stats["stop"] == "exhausted"
+        assert max(result, key=lambda x: x[1])[0] == 2
+
+    def test_max_candidates(self):
+        _, stats, scorer = self._run([0.1, 0.2, 0.9, 0.95, 0.99, 1.0], max_candidates=3)
+        assert stats["scored"] == 3
+        assert scorer.batches == [2, 1]
+
+    def test_budget_stops_after_first_batch(self):
+        _, stats, scorer = self._run([0.1, 0.2, 0.9, 0.95, 0.99, 1.0], budget_ms=1e-9)
+        assert scorer.batches == [2]
+        assert stats["stop"] == "budget" and stats["scored"] == 2
+
+    def test_skip_when_rrf_decisive(self):
+        scorer = FakeScorer({})
+        result, stats = adaptive_rerank("q", ["a", "b", "c"], [0.04, 0.02, 0.005], scorer,
+                                        top_k=2, skip_ratio=2.0)
+        assert stats["skipped"] is True and stats["stop"] == "skipped"
+        assert scorer.batches == []
+        # RRF 原始分数换算成相对第一名的比值，与 min_score 同一量级
+        assert result == [(0, 1.0), (1, 0.5)]
+
+    def test_title_prefixed(self):
+        seen = []
+
+        def scorer(pairs):
+            seen.extend(pairs)
+            return [0.0] * len(pairs)
+
+        adaptive_rerank("q", ["body"], [1.0], scorer, top_k=1, titles=["Title"], skip_ratio=0)
+        assert seen == [("q", "Title\nbody")]
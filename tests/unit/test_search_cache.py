@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""search_cache 单元测试。"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import search_cache
+from search_cache import TTLCache, normalize_query
+
+
+class TestTTLCache:
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get("a") is None
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")          # a 变为最近使用
+        cache.put("c", 3)       # 淘汰 b
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl_expiry(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(search_cache.time, "monotonic", lambda: now[0])
+        cache = TTLCache(maxsize=10, ttl=5)
+        cache.put("a", 1)
+        now[0] += 4
+        assert cache.get("a") == 1
+        now[0] += 2
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_disabled_when_maxsize_zero(self):
+        cache = TTLCache(maxsize=0, ttl=60)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+    def test_clear(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.put("a", 1)
+        cache.clear()
+        assert cache.get("a") is None
+
+
+class TestNormalizeQuery:
+    def test_whitespace_collapsed(self):
+        assert normalize_query("  Redis   pipeline\n") == "Redis pipeline"
+
+    def test_case_preserved(self):
+        assert normalize_query("CONFIG SET") == "CONFIG SET"
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""search_metrics 分阶段耗时统计单元测试。"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+from search_metrics import SearchMetrics, StageTimer, format_table, percentile  # noqa: E402
+
+
+class TestStageTimer:
+    def test_stages_accumulate(self):
+        timer = StageTimer()
+        for _ in range(2):
+            with timer.stage("qdrant"):
+                time.sleep(0.005)
+        timings = timer.finish()
+        assert timings["qdrant"] >= 10
+        assert timings["total"] >= timings["qdrant"]
+
+    def test_finish_keeps_existing_total(self):
+        timer = StageTimer()
+        timer.timings["total"] = 42.0
+        assert timer.finish()["total"] == 42.0
+
+
+class TestSearchMetrics:
+    def test_percentiles(self):
+        values = sorted(float(i) for i in range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([7.0], 99) == 7.0
+
+    def test_rolling_window(self):
+        metrics = SearchMetrics(window=10)
+        for i in range(100):
+            metrics.record({"encode": float(i), "total": float(i)})
+        summary = metrics.summary()
+        assert summary["calls"] == 100
+        assert summary["stages_ms"]["encode"]["count"] == 10
+        assert summary["stages_ms"]["encode"]["p50"] == 94  # 最近 10 个样本 90..99
+
+    def test_stage_order_and_table(self):
+        metrics = SearchMetrics()
+        metrics.record({"total": 3.0, "rerank": 2.0, "encode": 1.0}, cache_hit=True)
+        summary = metrics.summary()
+        assert list(summary["stages_ms"]) == ["encode", "rerank", "total"]
+        assert summary["cache_hits"] == 1
+        assert "rerank" in format_table(summary)
+        metrics.reset()
+        assert metrics.summary()["calls"] == 0
+
+    def test_round_trips(self):
+        metrics = SearchMetrics()
+        for trips in (2, 1, 1, 0):
+            metrics.record({"total": 1.0}, round_trips=trips)
+        summary = metrics.summary()
+        assert summary["round_trips"] == {"mean": 1.0, "max": 2}
+        assert "round trips/query: mean 1.0, max 2" in format_table(summary)
+
+    def test_rerank_stop_reasons(self):
+        metrics = SearchMetrics()
+        metrics.record({"total": 1.0})  # 缓存命中等未 rerank 的调用不计入
+        for stop, scored in (("skipped", 0), ("stable", 6), ("stable", 6), ("budget", 3)):
+            metrics.record({"total": 1.0}, rerank={"stop": stop, "scored": scored})
+        summary = metrics.summary()
+        assert summary["rerank"] == {"stop": {"skipped": 1, "stable": 2, "budget": 1},
+                                     "scored_mean": 3.8}
+        assert "rerank stop: budget 1, skipped 1, stable 2" in format_table(summary)
+
+
+def test_hybrid_search_records_timings(monkeypatch):
+    pytest.importorskip("mcp.server.fastmcp")
+    import mcp_server
+    from qdrant_client import QdrantClient
+
+    monkeypatch.setattr(mcp_server, "_qdrant", QdrantClient(":memory:"))
+    monkeypatch.setattr(mcp_server, "_metrics", SearchMetrics())
+    monkeypatch.setattr(mcp_server, "encode_query",
+                        lambda q: {"dense_vec": [0.0] * 4, "sparse_vec": None})
+    raw = mcp_server.hybrid_search("redis", include_timings=True)
+    _, _, timings = raw.partition("\n\n[TIMINGS] ")
+    timings = json.loads(timings)
+    assert {"encode", "total"} <= set(timings)
+    assert timings["cache_hit"] is False
+    stats = json.loads(mcp_server.search_metrics(reset=True))
+    assert stats["calls"] == 1
+    assert json.loads(mcp_server.search_metrics())["calls"] == 0
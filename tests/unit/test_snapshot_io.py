@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""snapshot_io 流式快照传输测试（本地 HTTP server 模拟 Qdrant 快照接口）。"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "scripts"))
+
+import snapshot_io  # noqa: E402
+
+DATA = bytes(range(256)) * 4096  # 1 MB
+
+
+class FakeQdrant(BaseHTTPRequestHandler):
+    drop_after = None      # 第一次 GET 只发这么多字节就断开
+    ranges: list = []
+    uploads: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = 0
+        rng = self.headers.get("Range")
+        FakeQdrant.ranges.append(rng)
+        if rng:
+            start = int(rng.split("=")[1].rstrip("-"))
+            if start >= len(DATA):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        body = DATA[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if FakeQdrant.drop_after is not None:
+            self.wfile.write(body[:FakeQdrant.drop_after])
+            FakeQdrant.drop_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        received = b""
+        while len(received) < length:
+            received += self.rfile.read(min(65536, length - len(received)))
+        FakeQdrant.uploads.append((self.path, received))
+        out = json.dumps({"result": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(snapshot_io.time, "sleep", lambda s: None)
+    FakeQdrant.drop_after = None
+    FakeQdrant.ranges = []
+    FakeQdrant.uploads = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeQdrant)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_download_writes_manifest(server, tmp_path):
+    out = tmp_path / "kb.snapshot"
+    manifest = snapshot_io.download_snapshot(f"{server}/s", out, chunk_size=65536,
+                                             collection="kb", snapshot="s")
+    assert out.read_bytes() == DATA
+    assert manifest["size"] == len(DATA) and manifest["snapshot"] == "s"
+    assert snapshot_io.verify_snapshot(out) == manifest["sha256"]
+    assert not list(tmp_path.glob("*.part*"))
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    FakeQdrant.drop_after = 300_000
+    out = tmp_path / "kb.snapshot"
+    snapshot_io.download_snapshot(f"{server}/s", out, chunk_size=65536)
+    assert out.read_bytes() == DATA
+    assert FakeQdrant.ranges == [None, "bytes=300000-"]
+
+
+def test_leftover_part_is_resumed_across_runs(server, tmp_path):
+    out = tmp_path / "kb.snapshot"
+    (tmp_path / "kb.snapshot.part").write_bytes(DATA[:1000])
+    (tmp_path / "kb.snapshot.part.json").write_text(json.dumps({"url": f"{server}/s"}))
+    snapshot_io.download_snapshot(f"{server}/s", out)
+    assert out.read_bytes() == DATA
+    assert FakeQdrant.ranges == ["bytes=1000-"]
+
+
+def test_verify_detects_corruption(server, tmp_path):
+    out = tmp_path / "kb.snapshot"
+    snapshot_io.download_snapshot(f"{server}/s", out)
+    out.write_bytes(DATA[:-1] + b"\x00")
+    with pytest.raises(ValueError, match="SHA-256"):
+        snapshot_io.verify_snapshot(out)
+
+
+def test_streaming_upload_sends_multipart_with_checksum(server, tmp_path):
+    snap = tmp_path / "kb.snapshot"
+    snap.write_bytes(DATA)
+    snapshot_io.upload_snapshot(f"{server}/collections/kb/snapshots/upload", snap,
+                                checksum="abc", chunk_size=65536)
+    path, body = FakeQdrant.uploads[0]
+    assert path == "/collections/kb/snapshots/upload?checksum=abc"
+    assert b'filename="kb.snapshot"' in body
+    assert DATA in body